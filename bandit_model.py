@@ -0,0 +1,188 @@
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from trial_store import TrialStore
+
+# NumPy port of the hBayesDM banditNarm_4par model (Seymour et al., 2012) that
+# model fitting/run_model_seperately.R fits through Stan:
+#
+#   Qsum = Qr + Qp,  choice ~ categorical_logit(Qsum)
+#   PEr = R * gain - Qr[choice],  PEp = P * loss - Qp[choice]
+#   unchosen arms decay towards 0:  Qr += Arew * -Qr,  Qp += Apun * -Qp
+#   chosen arm:  Qr[choice] += Arew * PEr,  Qp[choice] += Apun * PEp
+#
+# with Arew, Apun in [0, 1] and R, P in [0, 30]. Like hBayesDM, losses enter the
+# model as -1, so the real data (loss == 1) is recoded on the way in.
+#
+# Everything is batched: parameters of shape (..., n_subjects, 4) are scored
+# against all subjects in one array pass per trial, so extra leading
+# dimensions (starts, posterior draws, grid points) come for free.
+
+PARAMETERS = ['Arew', 'Apun', 'R', 'P']
+UPPER_BOUNDS = np.array([1.0, 1.0, 30.0, 30.0])
+N_ARMS = 3
+
+TrialArrays = namedtuple('TrialArrays', ['subjects', 'choice', 'gain', 'loss', 'mask'])
+
+
+def phi_approx(x):
+    # Stan's Phi_approx: logistic approximation to the normal CDF (tanh form
+    # of the logistic, so large |x| cannot overflow)
+    return 0.5 * (1.0 + np.tanh(0.5 * (0.07056 * x ** 3 + 1.5976 * x)))
+
+
+def inv_phi_approx(p):
+    # Inverse of Phi_approx: the single real root of 0.07056 x^3 + 1.5976 x = logit(p)
+    y = np.log(p) - np.log1p(-p)
+    a, b = 0.07056, 1.5976
+    q = y / (2 * a)
+    r = np.sqrt(q ** 2 + (b / (3 * a)) ** 3)
+    return np.cbrt(q + r) + np.cbrt(q - r)
+
+
+def to_constrained(raw):
+    """Map unconstrained (probit-scale) parameters to Arew, Apun, R, P."""
+    return phi_approx(np.asarray(raw, dtype=float)) * UPPER_BOUNDS
+
+
+def to_raw(params, eps=1e-6):
+    """Map Arew, Apun, R, P back to the unconstrained scale."""
+    p = np.clip(np.asarray(params, dtype=float) / UPPER_BOUNDS, eps, 1 - eps)
+    return inv_phi_approx(p)
+
+
+def prepare_trials(data, id_col='Participant.Public.ID', lose_value=1):
+    """Pad a cleaned trial table (or a TrialStore) into (n_subjects, n_trials) arrays.
+
+    Subjects are in sorted ID order. A DataFrame keeps its row order within
+    each subject; a TrialStore keeps its own (trial_nr) order. Choices are
+    0-based arm indices, losses are recoded to -1 as in
+    run_model_seperately.R, and `mask` marks the real (non-padding) trials.
+    """
+    if isinstance(data, TrialStore):
+        store = data
+    else:
+        store = TrialStore.from_frame(data[[id_col, 'choice', 'gain', 'loss']], id_col=id_col, order_col=None)
+
+    choice = store.padded('choice', dtype=np.int64)
+    gain = store.padded('gain', dtype=float)
+    loss = np.where(store.padded('loss', dtype=float) == lose_value, -1.0, 0.0)
+    return TrialArrays(store.subjects, choice, gain, loss, store.mask())
+
+
+def log_likelihood(params, trials, n_arms=N_ARMS, pointwise=False):
+    """Log-likelihood of each subject's choices.
+
+    `params` holds Arew, Apun, R, P on the last axis, shape (..., n_subjects, 4).
+    Returns an array of shape (..., n_subjects), or (..., n_subjects, n_trials)
+    per-trial values with `pointwise=True` (0 on padding trials).
+    """
+    params = np.asarray(params, dtype=float)
+    arew, apun, r, p = (params[..., k, None] for k in range(4))
+    batch_shape = params.shape[:-1]
+    n_trials = trials.choice.shape[1]
+
+    qr = np.zeros(batch_shape + (n_arms,))
+    qp = np.zeros(batch_shape + (n_arms,))
+    arms = np.arange(n_arms)
+    log_lik = np.zeros(batch_shape + ((n_trials,) if pointwise else ()))
+
+    for t in range(n_trials):
+        chosen = trials.choice[:, t, None] == arms
+        valid = trials.mask[:, t]
+
+        # categorical_logit(Qsum) for the observed choice
+        qsum = qr + qp
+        qmax = qsum.max(axis=-1, keepdims=True)
+        log_norm = qmax[..., 0] + np.log(np.exp(qsum - qmax).sum(axis=-1))
+        ll_t = np.where(valid, (qsum * chosen).sum(axis=-1) - log_norm, 0.0)
+        if pointwise:
+            log_lik[..., t] = ll_t
+        else:
+            log_lik += ll_t
+
+        # Chosen arm moves towards the outcome, unchosen arms decay towards 0
+        target_r = np.where(chosen, r * trials.gain[:, t, None], 0.0)
+        target_p = np.where(chosen, p * trials.loss[:, t, None], 0.0)
+        update = valid[:, None]
+        qr = np.where(update, qr + arew * (target_r - qr), qr)
+        qp = np.where(update, qp + apun * (target_p - qp), qp)
+
+    return log_lik
+
+
+def log_likelihood_grad(params, trials, n_arms=N_ARMS):
+    """Log-likelihood and its gradient with respect to Arew, Apun, R, P.
+
+    Same batching as `log_likelihood`; the gradient is propagated forward
+    through the Q-value recursion alongside it, so it costs one pass.
+    Returns (log_lik of shape (..., n_subjects), grad of shape (..., n_subjects, 4)).
+    """
+    params = np.asarray(params, dtype=float)
+    arew, apun, r, p = (params[..., k, None] for k in range(4))
+    batch_shape = params.shape[:-1]
+
+    qr = np.zeros(batch_shape + (n_arms,))
+    qp = np.zeros(batch_shape + (n_arms,))
+    # dQ/dtheta: Qr only depends on (Arew, R), Qp only on (Apun, P)
+    dqr_da, dqr_dr, dqp_da, dqp_dp = (np.zeros_like(qr) for _ in range(4))
+    arms = np.arange(n_arms)
+    log_lik = np.zeros(batch_shape)
+    grad = np.zeros(batch_shape + (4,))
+
+    for t in range(trials.choice.shape[1]):
+        chosen = trials.choice[:, t, None] == arms
+        valid = trials.mask[:, t]
+        update = valid[:, None]
+
+        qsum = qr + qp
+        qmax = qsum.max(axis=-1, keepdims=True)
+        expq = np.exp(qsum - qmax)
+        norm = expq.sum(axis=-1)
+        prob = expq / norm[..., None]
+        log_lik += np.where(valid, (qsum * chosen).sum(axis=-1) - qmax[..., 0] - np.log(norm), 0.0)
+
+        # d/dtheta [Qsum[choice] - logsumexp(Qsum)]
+        weight = np.where(update, chosen - prob, 0.0)
+        for k, dq in enumerate((dqr_da, dqp_da, dqr_dr, dqp_dp)):
+            grad[..., k] += (weight * dq).sum(axis=-1)
+
+        gain = trials.gain[:, t, None]
+        loss = trials.loss[:, t, None]
+        target_r = np.where(chosen, r * gain, 0.0)
+        target_p = np.where(chosen, p * loss, 0.0)
+
+        dqr_da = np.where(update, (1 - arew) * dqr_da + target_r - qr, dqr_da)
+        dqr_dr = np.where(update, (1 - arew) * dqr_dr + arew * chosen * gain, dqr_dr)
+        dqp_da = np.where(update, (1 - apun) * dqp_da + target_p - qp, dqp_da)
+        dqp_dp = np.where(update, (1 - apun) * dqp_dp + apun * chosen * loss, dqp_dp)
+        qr = np.where(update, qr + arew * (target_r - qr), qr)
+        qp = np.where(update, qp + apun * (target_p - qp), qp)
+
+    return log_lik, grad
+
+
+def raw_jacobian(raw):
+    """Elementwise d(to_constrained)/d(raw)."""
+    raw = np.asarray(raw, dtype=float)
+    phi = phi_approx(raw)
+    return UPPER_BOUNDS * phi * (1 - phi) * (3 * 0.07056 * raw ** 2 + 1.5976)
+
+
+def load_individual_parameters(path):
+    """Read an exported allIndPars table (subjID, Arew, Apun, R, P)."""
+    parameters = pd.read_csv(path)
+    return parameters[['subjID'] + PARAMETERS]
+
+
+def subject_log_likelihoods(parameters, data, id_col='Participant.Public.ID', lose_value=1):
+    """Per-subject log-likelihoods for an allIndPars table and a cleaned trial table."""
+    trials = prepare_trials(data, id_col=id_col, lose_value=lose_value)
+    values = parameters.set_index('subjID').loc[trials.subjects, PARAMETERS].to_numpy()
+    return pd.DataFrame({
+        'subjID': trials.subjects,
+        'log_lik': log_likelihood(values, trials),
+        'n_trials': trials.mask.sum(axis=1)
+    })
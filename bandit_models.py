@@ -0,0 +1,338 @@
+import numpy as np
+
+import bandit_model
+from bandit_model import N_ARMS, inv_phi_approx, phi_approx
+
+# Registry of the candidate models compared in
+# looic_model_selection_comparison_plots.py, ported from the hBayesDM
+# bandit4arm_* / bandit4arm2_kalman_filter Stan models to the 3-armed task:
+#
+#   singleA_lapse   Qr/Qp delta rule with one learning rate A, sensitivities R, P
+#                   and a lapse xi mixing the softmax with a uniform choice
+#   4par            banditNarm_4par (bandit_model.py): Arew, Apun, R, P
+#   2par_lapse      Arew, Apun and lapse xi, outcomes used as they are (R = P = 1)
+#   kalman_filter   Kalman filter on the net outcome (gain + loss) per arm with
+#                   decay lambda towards theta, softmax on beta * mean
+#   lapse_decay     Arew, Apun, R, P, lapse xi; unchosen values decay by d
+#
+# Every model exposes the same batched interface: parameter transforms
+# between the unconstrained (probit) scale and [lower, upper], the
+# log-likelihood of padded TrialArrays for parameters of shape
+# (..., n_subjects, n_params), its gradient on the unconstrained scale,
+# simulation on a reward/punishment schedule, and the names of its latent
+# state arrays and prediction errors (used by latent_variables.py). Fitting, simulation, recovery
+# and model comparison take a model name from MODELS, so swapping models is
+# a configuration change.
+#
+# Models without an analytic gradient get it from forward differences: the
+# n_params shifted copies of the parameters are stacked as an extra leading
+# batch dimension, so one likelihood pass scores all n_params + 1 points for
+# every subject at once.
+
+
+class BanditModel:
+    """Base class: subclasses define the parameters, bounds, initial state,
+    choice log-probabilities and the update after each trial."""
+
+    name = None
+    label = None
+    parameters = []
+    lower = np.zeros(0)
+    upper = np.zeros(0)
+    state_names = ['Qr', 'Qp']
+    error_names = ['PEr', 'PEp']
+
+    @property
+    def n_params(self):
+        return len(self.parameters)
+
+    def to_constrained(self, raw):
+        """Map unconstrained parameters to [lower, upper]."""
+        return self.lower + (self.upper - self.lower) * phi_approx(np.asarray(raw, dtype=float))
+
+    def to_raw(self, params, eps=1e-6):
+        """Map parameters back to the unconstrained scale."""
+        p = (np.asarray(params, dtype=float) - self.lower) / (self.upper - self.lower)
+        return inv_phi_approx(np.clip(p, eps, 1 - eps))
+
+    def raw_jacobian(self, raw):
+        """Elementwise d(to_constrained)/d(raw)."""
+        raw = np.asarray(raw, dtype=float)
+        phi = phi_approx(raw)
+        return (self.upper - self.lower) * phi * (1 - phi) * (3 * 0.07056 * raw ** 2 + 1.5976)
+
+    def initial_state(self, theta, batch_shape, n_arms):
+        raise NotImplementedError
+
+    def log_probabilities(self, state, theta):
+        raise NotImplementedError
+
+    def update(self, state, theta, chosen, gain, loss):
+        raise NotImplementedError
+
+    def prediction_errors(self, state, theta, chosen, gain, loss):
+        """Prediction errors of the chosen arm, one (..., n_subjects) array per error_names."""
+        raise NotImplementedError
+
+    def _columns(self, params):
+        params = np.asarray(params, dtype=float)
+        return params.shape[:-1], [params[..., k, None] for k in range(params.shape[-1])]
+
+    def log_likelihood(self, params, trials, n_arms=N_ARMS, pointwise=False):
+        """Log-likelihood of each subject's choices, shape (..., n_subjects),
+        or per trial with `pointwise=True` (0 on padding trials)."""
+        batch_shape, theta = self._columns(params)
+        n_trials = trials.choice.shape[1]
+        arms = np.arange(n_arms)
+        state = self.initial_state(theta, batch_shape, n_arms)
+        log_lik = np.zeros(batch_shape + ((n_trials,) if pointwise else ()))
+
+        for t in range(n_trials):
+            chosen = trials.choice[:, t, None] == arms
+            valid = trials.mask[:, t]
+            ll_t = np.where(valid, (self.log_probabilities(state, theta) * chosen).sum(axis=-1), 0.0)
+            if pointwise:
+                log_lik[..., t] = ll_t
+            else:
+                log_lik += ll_t
+            new_state = self.update(state, theta, chosen, trials.gain[:, t, None], trials.loss[:, t, None])
+            state = tuple(np.where(valid[:, None], new, old) for new, old in zip(new_state, state))
+
+        return log_lik
+
+    def raw_log_likelihood_grad(self, raw, trials, n_arms=N_ARMS):
+        """Log-likelihood and its gradient with respect to the unconstrained
+        parameters, by batched forward differences."""
+        raw = np.asarray(raw, dtype=float)
+        step = np.sqrt(np.finfo(float).eps) * np.maximum(1.0, np.abs(raw))
+        shifted = np.broadcast_to(raw, (self.n_params + 1,) + raw.shape).copy()
+        for k in range(self.n_params):
+            shifted[k + 1, ..., k] += step[..., k]
+        log_lik = self.log_likelihood(self.to_constrained(shifted), trials, n_arms)
+        grad = np.moveaxis(log_lik[1:] - log_lik[0], 0, -1) / step
+        return log_lik[0], grad
+
+    def simulate(self, params, money_prob, pain_prob, n_replicates=1, n_trials=None, rng=None):
+        """Simulate choices and outcomes on a schedule.
+
+        `params` is (n_subjects, n_params), or any (..., n_params) shape which
+        then replaces the replicate dimension. The schedule probabilities are
+        (n_arms, n_trials), or (n_replicates, n_arms, n_trials) to play a
+        different schedule in each replicate (the first batch dimension).
+        Returns int8 arrays choice (0-based), gain (0/1) and loss (0/-1) of
+        shape (n_replicates, n_subjects, n_trials).
+        """
+        rng = np.random.default_rng(rng)
+        money_prob = np.asarray(money_prob, dtype=float)
+        pain_prob = np.asarray(pain_prob, dtype=float)
+        params = np.asarray(params, dtype=float)
+        if params.ndim == 2:
+            n_replicates = money_prob.shape[0] if money_prob.ndim == 3 else n_replicates
+            params = np.broadcast_to(params, (n_replicates,) + params.shape)
+        batch_shape, theta = self._columns(params)
+
+        n_arms = money_prob.shape[-2]
+        n_trials = money_prob.shape[-1] if n_trials is None else n_trials
+        # Leading index that picks each replicate's own schedule
+        replicate = ()
+        if money_prob.ndim == 3:
+            replicate = (np.arange(money_prob.shape[0]).reshape((-1,) + (1,) * (len(batch_shape) - 1)),)
+
+        arms = np.arange(n_arms)
+        state = self.initial_state(theta, batch_shape, n_arms)
+        choice = np.empty(batch_shape + (n_trials,), dtype=np.int8)
+        gain = np.empty_like(choice)
+        loss = np.empty_like(choice)
+
+        for t in range(n_trials):
+            # Sample by inverting the cumulative choice probabilities
+            cumulative = np.exp(self.log_probabilities(state, theta)).cumsum(axis=-1)
+            u = rng.random(batch_shape + (1,)) * cumulative[..., -1:]
+            chosen_arm = np.minimum((u > cumulative).sum(axis=-1), n_arms - 1)
+
+            win = rng.random(batch_shape) < money_prob[replicate + (chosen_arm, t)]
+            shock = rng.random(batch_shape) < pain_prob[replicate + (chosen_arm, t)]
+            choice[..., t] = chosen_arm
+            gain[..., t] = win
+            loss[..., t] = -shock.astype(np.int8)
+
+            state = self.update(state, theta, chosen_arm[..., None] == arms,
+                                win[..., None].astype(float), -shock[..., None].astype(float))
+
+        return choice, gain, loss
+
+
+def _softmax_log_prob(values):
+    top = values.max(axis=-1, keepdims=True)
+    return values - top - np.log(np.exp(values - top).sum(axis=-1, keepdims=True))
+
+
+def _lapse_log_prob(values, xi):
+    # (1 - xi) * softmax(values) + xi / n_arms
+    n_arms = values.shape[-1]
+    return np.log((1 - xi) * np.exp(_softmax_log_prob(values)) + xi / n_arms)
+
+
+def _delta_update(qr, qp, a_rew, a_pun, chosen, target_r, target_p):
+    # Chosen arm moves towards its outcome, unchosen arms decay towards 0
+    qr = qr + a_rew * (np.where(chosen, target_r, 0.0) - qr)
+    qp = qp + a_pun * (np.where(chosen, target_p, 0.0) - qp)
+    return qr, qp
+
+
+def _delta_errors(qr, qp, chosen, target_r, target_p):
+    # PEr = target_r - Qr[choice], PEp = target_p - Qp[choice]
+    return target_r[..., 0] - (qr * chosen).sum(axis=-1), target_p[..., 0] - (qp * chosen).sum(axis=-1)
+
+
+class SingleALapse(BanditModel):
+    name = 'singleA_lapse'
+    label = 'Learning Rate, Reward Sensitivity, Lapse'
+    parameters = ['A', 'R', 'P', 'xi']
+    lower = np.zeros(4)
+    upper = np.array([1.0, 30.0, 30.0, 1.0])
+
+    def initial_state(self, theta, batch_shape, n_arms):
+        return np.zeros(batch_shape + (n_arms,)), np.zeros(batch_shape + (n_arms,))
+
+    def log_probabilities(self, state, theta):
+        qr, qp = state
+        return _lapse_log_prob(qr + qp, theta[3])
+
+    def update(self, state, theta, chosen, gain, loss):
+        a, r, p, _ = theta
+        return _delta_update(*state, a, a, chosen, r * gain, p * loss)
+
+    def prediction_errors(self, state, theta, chosen, gain, loss):
+        _, r, p, _ = theta
+        return _delta_errors(*state, chosen, r * gain, p * loss)
+
+
+class FourPar(BanditModel):
+    name = '4par'
+    label = 'Learning from Reward/Punishment, Sensitivity'
+    parameters = list(bandit_model.PARAMETERS)
+    lower = np.zeros(4)
+    upper = bandit_model.UPPER_BOUNDS
+
+    def initial_state(self, theta, batch_shape, n_arms):
+        return np.zeros(batch_shape + (n_arms,)), np.zeros(batch_shape + (n_arms,))
+
+    def log_probabilities(self, state, theta):
+        qr, qp = state
+        return _softmax_log_prob(qr + qp)
+
+    def update(self, state, theta, chosen, gain, loss):
+        arew, apun, r, p = theta
+        return _delta_update(*state, arew, apun, chosen, r * gain, p * loss)
+
+    def prediction_errors(self, state, theta, chosen, gain, loss):
+        _, _, r, p = theta
+        return _delta_errors(*state, chosen, r * gain, p * loss)
+
+    def log_likelihood(self, params, trials, n_arms=N_ARMS, pointwise=False):
+        return bandit_model.log_likelihood(params, trials, n_arms, pointwise)
+
+    def raw_log_likelihood_grad(self, raw, trials, n_arms=N_ARMS):
+        # Analytic gradient from the forward-mode recursion in bandit_model
+        log_lik, grad = bandit_model.log_likelihood_grad(self.to_constrained(raw), trials, n_arms)
+        return log_lik, grad * self.raw_jacobian(raw)
+
+
+class TwoParLapse(BanditModel):
+    name = '2par_lapse'
+    label = 'Delta Rule with Lapse'
+    parameters = ['Arew', 'Apun', 'xi']
+    lower = np.zeros(3)
+    upper = np.ones(3)
+
+    def initial_state(self, theta, batch_shape, n_arms):
+        return np.zeros(batch_shape + (n_arms,)), np.zeros(batch_shape + (n_arms,))
+
+    def log_probabilities(self, state, theta):
+        qr, qp = state
+        return _lapse_log_prob(qr + qp, theta[2])
+
+    def update(self, state, theta, chosen, gain, loss):
+        arew, apun, _ = theta
+        return _delta_update(*state, arew, apun, chosen, gain, loss)
+
+    def prediction_errors(self, state, theta, chosen, gain, loss):
+        shape = state[0].shape[:-1] + (1,)
+        return _delta_errors(*state, chosen, np.broadcast_to(gain, shape), np.broadcast_to(loss, shape))
+
+
+class KalmanFilter(BanditModel):
+    # hBayesDM's bounds assume points outcomes of 1-100 and observation noise
+    # sigmaO = 4; here the outcome is gain + loss in {-1, 0, 1}, so the means
+    # live in [-1, 1], the noise terms in [0, 2] and sigmaO is the SD of a
+    # binary outcome at p = 0.5
+    name = 'kalman_filter'
+    label = 'Kalman Filter for Learning'
+    parameters = ['lambda', 'theta', 'beta', 'mu0', 'sigma0', 'sigmaD']
+    lower = np.array([0.0, -1.0, 0.0, -1.0, 0.0, 0.0])
+    upper = np.array([1.0, 1.0, 30.0, 1.0, 2.0, 2.0])
+    sigma_o = 0.5
+    state_names = ['mu', 'variance']
+    error_names = ['PE']
+
+    def initial_state(self, theta, batch_shape, n_arms):
+        mu0, sigma0 = theta[3], theta[4]
+        ones = np.ones(batch_shape + (n_arms,))
+        return mu0 * ones, sigma0 ** 2 * ones
+
+    def log_probabilities(self, state, theta):
+        mu, _ = state
+        return _softmax_log_prob(theta[2] * mu)
+
+    def update(self, state, theta, chosen, gain, loss):
+        decay, center, _, _, _, sigma_d = theta
+        mu, variance = state
+        kalman_gain = np.where(chosen, variance / (variance + self.sigma_o ** 2), 0.0)
+        mu = mu + kalman_gain * (gain + loss - mu)
+        variance = variance * (1 - kalman_gain)
+        # Diffusion between trials
+        return decay * mu + (1 - decay) * center, decay ** 2 * variance + sigma_d ** 2
+
+    def prediction_errors(self, state, theta, chosen, gain, loss):
+        mu, _ = state
+        return ((gain + loss)[..., 0] - (mu * chosen).sum(axis=-1),)
+
+
+class LapseDecay(BanditModel):
+    name = 'lapse_decay'
+    label = 'Lapse with Exponential Decay'
+    parameters = ['Arew', 'Apun', 'R', 'P', 'xi', 'd']
+    lower = np.zeros(6)
+    upper = np.array([1.0, 1.0, 30.0, 30.0, 1.0, 1.0])
+
+    def initial_state(self, theta, batch_shape, n_arms):
+        return np.zeros(batch_shape + (n_arms,)), np.zeros(batch_shape + (n_arms,))
+
+    def log_probabilities(self, state, theta):
+        qr, qp = state
+        return _lapse_log_prob(qr + qp, theta[4])
+
+    def update(self, state, theta, chosen, gain, loss):
+        arew, apun, r, p, _, d = theta
+        qr, qp = state
+        # Unchosen arms decay by d, the chosen arm follows the delta rule
+        qr = np.where(chosen, qr + arew * (r * gain - qr), (1 - d) * qr)
+        qp = np.where(chosen, qp + apun * (p * loss - qp), (1 - d) * qp)
+        return qr, qp
+
+    def prediction_errors(self, state, theta, chosen, gain, loss):
+        _, _, r, p, _, _ = theta
+        return _delta_errors(*state, chosen, r * gain, p * loss)
+
+
+MODELS = {model.name: model for model in (SingleALapse(), FourPar(), TwoParLapse(), KalmanFilter(), LapseDecay())}
+
+
+def get_model(model):
+    """Look up a model by name (instances are passed through)."""
+    if isinstance(model, BanditModel):
+        return model
+    if model not in MODELS:
+        raise ValueError(f"unknown model {model!r}, choose from {', '.join(MODELS)}")
+    return MODELS[model]
@@ -0,0 +1,185 @@
+import argparse
+import os
+import platform
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from bandit_models import MODELS
+from correlation_engine import correlation_table
+from fit_bandit import fit_subjects
+from profiling import stage
+from questionnaire_scoring import score_questionnaires
+from rt_summary import RTSummary
+from schedules import random_walk_schedules
+from simulate_bandit import simulate_choices
+from synthetic_data import DATA_VERSION, QUESTIONNAIRES, generate
+from trial_cache import ID_COLUMN, load_trials
+from wsls import compute_wsls
+
+# Benchmark suite for the core operations on synthetic cohorts
+# (synthetic_data.py) of 100 to 100k participants.
+#
+# For every cohort size the data are generated once into --data-dir and then
+# each operation is timed with profiling.stage (wall and CPU time, peak RSS,
+# rows): a cold load that builds a fresh trial cache, a load from that cache,
+# WSLS, the per-trial RT curves, questionnaire scoring, questionnaire x WSLS
+# correlations with permutation FWER, MAP fitting and simulation. Results are
+# appended to a CSV together with the git commit they were measured on, and
+# --compare shows the wall times of two commits side by side. Fitting (about
+# 10 ms per participant and core with one start) dominates the run at 100k
+# participants; leave it out with --operations when it is not being measured.
+
+OPERATIONS = ['load', 'load_cached', 'wsls', 'rt_curves', 'questionnaires', 'correlations', 'fit', 'simulate']
+SIZES = [100, 1_000, 10_000, 100_000]
+
+
+def git_commit():
+    """Short hash of HEAD, with '+dirty' if tracked files were modified."""
+    directory = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=directory, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=directory,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return commit + ('+dirty' if dirty else '')
+
+
+def cohort(n_participants, data_dir, n_trials=200, seed=1234):
+    """Paths of a synthetic cohort, generated only if not already in `data_dir`."""
+    directory = os.path.join(data_dir, f'n{n_participants}_t{n_trials}_s{seed}_v{DATA_VERSION}')
+    paths = {'trials': os.path.join(directory, 'cleaned_data.csv')}
+    paths.update({name: os.path.join(directory, f'{name}_questionnaire.csv') for name in QUESTIONNAIRES})
+    if not all(os.path.exists(path) for path in paths.values()):
+        paths = generate(n_participants, directory, n_trials=n_trials, seed=seed)
+    return paths
+
+
+def run_size(paths, operations=OPERATIONS, permutations=1000, starts=1, replicates=10, n_jobs=None, seed=1234):
+    """Time each of `operations` on one cohort; returns one record per operation."""
+    records, run = [], set(operations)
+
+    def timed(name):
+        return stage(name, trace=records if name in run else None)
+
+    with tempfile.TemporaryDirectory() as cache_root:
+        cache_dir = os.path.join(cache_root, 'trials')
+        with timed('load') as timing:
+            data = load_trials(paths['trials'], cache_dir=cache_dir)
+            timing.rows = len(data)
+        with timed('load_cached') as timing:
+            data = load_trials(paths['trials'], cache_dir=cache_dir)
+            timing.rows = len(data)
+        n_participants = data[ID_COLUMN].nunique()
+
+        if run & {'wsls', 'correlations'}:
+            with timed('wsls') as timing:
+                strategies = compute_wsls(data)
+                timing.rows = len(data)
+
+        if 'rt_curves' in run:
+            with timed('rt_curves') as timing:
+                summary = RTSummary()
+                summary.update(data, 'all')
+                summary.curve('all')
+                timing.rows = len(data)
+
+        if run & {'questionnaires', 'correlations'}:
+            exports = {name: pd.read_csv(paths[name]) for name in QUESTIONNAIRES}
+            with timed('questionnaires') as timing:
+                scores = score_questionnaires(exports)
+                timing.rows = sum(len(export) for export in exports.values())
+
+        if 'correlations' in run:
+            merged = scores.merge(strategies, on=ID_COLUMN)
+            x = merged[[f'{name}_score' for name in QUESTIONNAIRES]]
+            y = merged[['win_stay_percentage', 'lose_shift_percentage']]
+            with timed('correlations') as timing:
+                correlation_table(x, y, n_permutations=permutations, seed=seed)
+                timing.rows = len(merged)
+
+        if 'fit' in run:
+            with timed('fit') as timing:
+                fit_subjects(data, n_starts=starts, n_jobs=n_jobs, seed=seed)
+                timing.rows = n_participants
+
+        if 'simulate' in run:
+            rng = np.random.default_rng(seed)
+            money_prob, pain_prob = (schedule[0] for schedule in random_walk_schedules(1, seed=rng))
+            params = MODELS['4par'].to_constrained(rng.standard_normal((n_participants, 4)))
+            with timed('simulate') as timing:
+                simulate_choices(params, money_prob, pain_prob, n_replicates=replicates, rng=rng)
+                timing.rows = n_participants * replicates
+
+    for record in records:
+        record['operation'] = record.pop('stage')
+        record['n_participants'] = n_participants
+    return records
+
+
+def run_benchmarks(sizes=SIZES, operations=OPERATIONS, data_dir='benchmark_data', n_trials=200, seed=1234,
+                   **kwargs):
+    """Benchmark every cohort size; returns a table with one row per size x operation."""
+    records = []
+    for n_participants in sizes:
+        paths = cohort(n_participants, data_dir, n_trials=n_trials, seed=seed)
+        records.extend(run_size(paths, operations, seed=seed, **kwargs))
+
+    results = pd.DataFrame(records)
+    results.insert(0, 'commit', git_commit())
+    results.insert(1, 'created', time.strftime('%Y-%m-%dT%H:%M:%S'))
+    results.insert(2, 'host', platform.node())
+    results['rows_per_s'] = results['rows'] / results['wall_s']
+    columns = ['commit', 'created', 'host', 'operation', 'n_participants', 'wall_s', 'cpu_s', 'peak_rss_mb', 'rows',
+               'rows_per_s']
+    return results[columns]
+
+
+def compare_commits(results, base, head):
+    """Wall seconds per operation and cohort size at two commits (base_s,
+    head_s) and their ratio. The latest measurement of each is used."""
+    tables = []
+    for commit, column in ((base, 'base_s'), (head, 'head_s')):
+        runs = results[results['commit'] == commit]
+        if runs.empty:
+            raise ValueError(f"no benchmark results for commit {commit}")
+        latest = runs.sort_values('created').groupby(['operation', 'n_participants'], sort=False).last()
+        tables.append(latest['wall_s'].rename(column))
+    table = pd.concat(tables, axis=1)
+    table['ratio'] = table['head_s'] / table['base_s']
+    table = table.reset_index()
+    table['operation'] = pd.Categorical(table['operation'], OPERATIONS, ordered=True)
+    return table.sort_values(['n_participants', 'operation'], ignore_index=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the core operations on synthetic cohorts.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help='participants per cohort')
+    parser.add_argument('--operations', nargs='+', default=OPERATIONS, choices=OPERATIONS)
+    parser.add_argument('--trials', type=int, default=200)
+    parser.add_argument('--data-dir', default='benchmark_data', help='generated cohorts, reused between runs')
+    parser.add_argument('--permutations', type=int, default=1000)
+    parser.add_argument('--starts', type=int, default=1, help='optimiser starts per participant when fitting')
+    parser.add_argument('--replicates', type=int, default=10, help='simulated replicates per participant')
+    parser.add_argument('--jobs', type=int, default=None, help='worker processes for fitting')
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--output', default='benchmark_results.csv', help='results are appended to this file')
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'HEAD'),
+                        help='print the wall times of two benchmarked commits instead of running')
+    args = parser.parse_args()
+
+    if args.compare:
+        print(f"base: {args.compare[0]}, head: {args.compare[1]}")
+        print(compare_commits(pd.read_csv(args.output), *args.compare).to_string(index=False))
+    else:
+        benchmark = run_benchmarks(args.sizes, args.operations, data_dir=args.data_dir, n_trials=args.trials,
+                                   seed=args.seed, permutations=args.permutations, starts=args.starts,
+                                   replicates=args.replicates, n_jobs=args.jobs)
+        benchmark.to_csv(args.output, mode='a', header=not os.path.exists(args.output), index=False)
+        print(benchmark.to_string(index=False))
+        print(f"Results appended to: {args.output}")
@@ -0,0 +1,126 @@
+import argparse
+import os
+import re
+
+import pandas as pd
+
+from profiling import stage
+
+# Streaming Python port of preprocessing/3AB_data_cleaning.R.
+#
+# The R script reads the whole Gorilla task export, drops every participant
+# with more than 20 NAs in any of t_response, choice, rt, gain, loss or
+# score.tally, then drops the remaining rows with an NA in those columns.
+# Here the export is read twice in fixed-size chunks: the first pass only
+# accumulates per-participant NA counts, the second filters each chunk and
+# appends it to the output (one file per group when a group mapping is given),
+# so memory stays bounded by the chunk size however large the export is.
+# read.csv types whole columns, which chunks cannot see: the NA_COLUMNS are
+# taken to be numeric (empty = NA) and every other column to be character.
+
+NA_COLUMNS = ['t_response', 'choice', 'rt', 'gain', 'loss', 'score.tally']
+ID_COLUMN = 'Participant.Public.ID'
+MAX_NAS = 20
+
+
+def make_names(columns):
+    # Column names as R's read.csv(check.names = TRUE) makes them:
+    # 'Participant Public ID' -> 'Participant.Public.ID'
+    names = []
+    for column in columns:
+        name = re.sub(r'[^0-9A-Za-z._]', '.', str(column))
+        if not re.match(r'[A-Za-z]|\.(?![0-9])', name):
+            name = 'X' + name
+        names.append(name)
+    return names
+
+
+def _read_chunks(path, chunksize):
+    # Only 'NA' is missing, plus empty fields in the numeric NA_COLUMNS, as in
+    # R's read.csv; empty character fields (e.g. IDs) stay ''. pandas' wider
+    # default set ('null', 'N/A', 'None', 'nan', ...) would change exclusions
+    for chunk in pd.read_csv(path, dtype=str, chunksize=chunksize, keep_default_na=False, na_values=['NA']):
+        chunk.columns = make_names(chunk.columns)
+        chunk[NA_COLUMNS] = chunk[NA_COLUMNS].mask(chunk[NA_COLUMNS] == '')
+        yield chunk
+
+
+def count_missing(path, chunksize=100_000):
+    """Per-participant NA counts for the NA_COLUMNS, accumulated chunk by chunk."""
+    counts = None
+    for chunk in _read_chunks(path, chunksize):
+        chunk_counts = chunk[NA_COLUMNS].isna().groupby(chunk[ID_COLUMN], dropna=False).sum()
+        counts = chunk_counts if counts is None else counts.add(chunk_counts, fill_value=0)
+    if counts is None:
+        return pd.DataFrame(columns=NA_COLUMNS, dtype=int)
+    return counts.astype(int)
+
+
+def excluded_participants(na_counts, max_nas=MAX_NAS):
+    """Participants with more than `max_nas` NAs in any of the checked columns."""
+    return set(na_counts.index[(na_counts > max_nas).any(axis=1)])
+
+
+def _group_file(output_dir, group):
+    name = re.sub(r'[^0-9a-z]+', '_', str(group).lower()).strip('_')
+    return os.path.join(output_dir, f'{name}_cleaned_data.csv')
+
+
+def clean_export(path, output_dir='.', groups=None, columns=None, chunksize=100_000, max_nas=MAX_NAS):
+    """Clean a raw task export and write the result.
+
+    Without `groups` everything goes to cleaned_data.csv, as in the R script.
+    With `groups` (a mapping from participant ID to group name) each group is
+    written to <group>_cleaned_data.csv, e.g. anhedonic_cleaned_data.csv, and
+    participants without a group are left out. `columns` optionally restricts
+    the written columns. Returns (excluded participant IDs, rows written per file).
+    """
+    with stage('clean') as timing:
+        excluded = excluded_participants(count_missing(path, chunksize), max_nas)
+        if groups is not None:
+            groups = pd.Series(groups)
+
+        os.makedirs(output_dir, exist_ok=True)
+        written = {}
+        for chunk in _read_chunks(path, chunksize):
+            chunk = chunk[~chunk[ID_COLUMN].isin(excluded)].dropna(subset=NA_COLUMNS)
+            if columns is not None:
+                chunk_columns = columns if ID_COLUMN in columns else [ID_COLUMN] + list(columns)
+                chunk = chunk[chunk_columns]
+
+            if groups is None:
+                parts = [(os.path.join(output_dir, 'cleaned_data.csv'), chunk)]
+            else:
+                labels = chunk[ID_COLUMN].map(groups)
+                parts = [(_group_file(output_dir, group), part) for group, part in chunk.groupby(labels)]
+
+            for output, part in parts:
+                part.to_csv(output, mode='a' if output in written else 'w', header=output not in written,
+                            index=False, na_rep='NA')
+                written[output] = written.get(output, 0) + len(part)
+
+        timing.rows = sum(written.values())
+        return excluded, written
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Clean a Gorilla 3AB task export (port of 3AB_data_cleaning.R).')
+    parser.add_argument('export', help='raw task export, e.g. data_exp_136114-v2_task-knqe.csv')
+    parser.add_argument('--output-dir', default='.')
+    parser.add_argument('--groups', help='CSV with a participant ID column and a group column, e.g. organized_data.csv')
+    parser.add_argument('--group-column', default='Group')
+    parser.add_argument('--columns', nargs='+', help='columns to keep, e.g. trial_nr choice rt gain loss score.tally')
+    parser.add_argument('--chunksize', type=int, default=100_000)
+    args = parser.parse_args()
+
+    group_map = None
+    if args.groups:
+        group_table = pd.read_csv(args.groups)
+        group_table.columns = make_names(group_table.columns)
+        group_map = group_table.set_index(ID_COLUMN)[args.group_column]
+
+    excluded_ids, rows = clean_export(args.export, args.output_dir, groups=group_map,
+                                      columns=args.columns, chunksize=args.chunksize)
+    print(f"Excluded {len(excluded_ids)} participants with more than {MAX_NAS} NAs")
+    for output_file, n_rows in rows.items():
+        print(f"{n_rows} rows saved to: {output_file}")
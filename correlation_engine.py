@@ -0,0 +1,111 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from profiling import stage
+
+# Batched correlation engine for questionnaire x model-parameter analyses.
+#
+# The full correlation matrix between two sets of columns is computed from a
+# handful of matrix products over zero-filled data and missingness masks, so
+# every pair uses its own pairwise-complete observations (like calling
+# pearsonr on each pair after dropna) without looping over pairs. Family-wise
+# error is controlled with the max-statistic permutation method: rows of the
+# second set are permuted in batches, the largest |r| of each permuted matrix
+# forms the null distribution, and every observed |r| is compared against it.
+
+
+def _prepare(values):
+    values = np.asarray(values, dtype=float)
+    present = ~np.isnan(values)
+    # Centring first keeps the sums of squares well conditioned
+    centred = values - np.nanmean(values, axis=0)
+    return np.where(present, centred, 0.0), present.astype(float)
+
+
+def _correlations(x, mx, y, my):
+    # x, mx: (..., n, p); y, my: (..., n, q). Returns r and pairwise n, (..., p, q)
+    xt, mxt = np.swapaxes(x, -1, -2), np.swapaxes(mx, -1, -2)
+    n = mxt @ my
+    sx, sy = xt @ my, mxt @ y
+    sxx, syy = (xt ** 2) @ my, mxt @ (y ** 2)
+    sxy = xt @ y
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cov = sxy - sx * sy / n
+        var_x = sxx - sx ** 2 / n
+        var_y = syy - sy ** 2 / n
+        r = cov / np.sqrt(var_x * var_y)
+    return np.clip(r, -1.0, 1.0), n
+
+
+def correlation_matrix(x, y):
+    """Pearson r and pairwise-complete n for every column of `x` against every column of `y`."""
+    x, mx = _prepare(x)
+    y, my = _prepare(y)
+    return _correlations(x, mx, y, my)
+
+
+def correlation_p_values(r, n):
+    """Two-sided parametric p-values for Pearson r (same as scipy.stats.pearsonr)."""
+    df = n - 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = r * np.sqrt(df / (1 - r ** 2))
+    return 2 * stats.t.sf(np.abs(t), df)
+
+
+def _max_null_chunk(x, mx, y, my, n_permutations, seed):
+    rng = np.random.default_rng(seed)
+    order = rng.random((n_permutations, y.shape[0])).argsort(axis=1)
+    r, _ = _correlations(x, mx, y[order], my[order])
+    return np.nanmax(np.abs(r).reshape(n_permutations, -1), axis=1)
+
+
+def permutation_fwer(x, y, r=None, n_permutations=5000, memory_mb=256, n_jobs=1, seed=1234):
+    """Max-statistic permutation p-values, corrected over the whole x-by-y matrix."""
+    x, mx = _prepare(x)
+    y, my = _prepare(y)
+    if r is None:
+        r, _ = _correlations(x, mx, y, my)
+
+    # Permutations per chunk: the permuted y copies and the (p x q) sums dominate
+    n_obs, p, q = x.shape[0], x.shape[1], y.shape[1]
+    per_permutation = 8 * (4 * n_obs * q + 8 * p * q)
+    chunk_size = max(1, int(memory_mb * 2 ** 20 / per_permutation))
+    sizes = [min(chunk_size, n_permutations - start) for start in range(0, n_permutations, chunk_size)]
+    jobs = [(x, mx, y, my, size, s) for size, s in zip(sizes, np.random.SeedSequence(seed).spawn(len(sizes)))]
+
+    if n_jobs == 1:
+        null = [_max_null_chunk(*job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            null = list(pool.map(_max_null_chunk, *zip(*jobs)))
+    null = np.sort(np.concatenate(null))
+
+    # Count of null maxima >= |r| for every cell, via binary search on the sorted null
+    exceed = len(null) - np.searchsorted(null, np.abs(r) - 1e-12, side='left')
+    return (exceed + 1) / (n_permutations + 1)
+
+
+def correlation_table(x, y, n_permutations=5000, memory_mb=256, n_jobs=1, seed=1234):
+    """Long table of every x-by-y correlation with parametric, Bonferroni and
+    permutation FWER-corrected p-values.
+
+    `x` and `y` are DataFrames with one row per participant.
+    """
+    with stage('correlations', rows=len(x), n_x=x.shape[1], n_y=y.shape[1]):
+        r, n = correlation_matrix(x, y)
+        p = correlation_p_values(r, n)
+        p_fwer = permutation_fwer(x, y, r=r, n_permutations=n_permutations, memory_mb=memory_mb,
+                                  n_jobs=n_jobs, seed=seed) if n_permutations else np.full(r.shape, np.nan)
+
+        return pd.DataFrame({
+            'x': np.repeat(list(x.columns), len(y.columns)),
+            'y': np.tile(list(y.columns), len(x.columns)),
+            'r': r.ravel(),
+            'n': n.ravel().astype(int),
+            'p': p.ravel(),
+            'p_bonferroni': np.minimum(p.ravel() * r.size, 1.0),
+            'p_fwer': p_fwer.ravel()
+        })
@@ -0,0 +1,154 @@
+import argparse
+
+import pandas as pd
+
+from profiling import stage
+
+# Demographics summaries for any number of cohorts at once.
+#
+# The long-format participant_details_questionnaire.csv export (one row per
+# participant x question) is read in chunks, keeping only the demographic
+# questions, and pivoted once into a participant x field table. Cohorts (all
+# screened participants, included participants, anhedonic / non-anhedonic,
+# ...) are given as lists of participant IDs and may overlap; the participant
+# table is joined to the cohort memberships and every count is computed by a
+# single group-by over (cohort, field, category), with the age statistics from
+# one group-by over cohort. Ages below `min_age` are treated as invalid and
+# left out of the age statistics in every cohort.
+
+ID_COLUMN = 'Participant Public ID'
+FIELDS = {
+    'age': 'demographic_age',
+    'sex': 'demographic_sex',
+    'ethnicity': 'demographic_ethnicity',
+    'education': 'demographic_education'
+}
+MIN_AGE = 18
+
+
+def read_export(path, fields=FIELDS, chunksize=1_000_000):
+    """The rows of a long export that answer one of `fields`, read in chunks."""
+    with stage('load') as timing:
+        keys = list(fields.values())
+        parts = [chunk[chunk['Question Key'].isin(keys)]
+                 for chunk in pd.read_csv(path, usecols=[ID_COLUMN, 'Question Key', 'Response'], dtype=str,
+                                          chunksize=chunksize)]
+        timing.rows = sum(len(part) for part in parts)
+        return pd.concat(parts, ignore_index=True)
+
+
+def participant_table(data, fields=FIELDS, min_age=MIN_AGE):
+    """Pivot a long export into one row per participant and one column per field.
+
+    The last response wins if a question was answered twice. Ages are numeric,
+    with ages below `min_age` set to NaN.
+    """
+    names = {key: name for name, key in fields.items()}
+    data = data[data['Question Key'].isin(names)]
+    table = (data.drop_duplicates([ID_COLUMN, 'Question Key'], keep='last')
+                 .pivot(index=ID_COLUMN, columns='Question Key', values='Response')
+                 .rename(columns=names)
+                 .reindex(columns=list(fields)))
+    if 'age' in table:
+        age = pd.to_numeric(table['age'], errors='coerce')
+        table['age'] = age.where(age >= min_age)
+    table.columns.name = None
+    return table
+
+
+def summarize(participants, cohorts):
+    """Counts, percentages and age statistics of every cohort.
+
+    `participants` is a participant_table, `cohorts` a mapping from cohort
+    name to participant IDs. Returns (counts, ages): counts has one row per
+    cohort x field x category with the count and the percentage of the
+    cohort's non-missing answers to that field; ages has the number of
+    participants found in the export, the number of valid ages, and the age
+    range, mean and SD per cohort.
+    """
+    with stage('demographics', rows=len(participants), cohorts=len(cohorts)):
+        membership = pd.concat([pd.DataFrame({'cohort': name, ID_COLUMN: list(ids)})
+                                for name, ids in cohorts.items()], ignore_index=True).drop_duplicates()
+        membership['cohort'] = pd.Categorical(membership['cohort'], list(cohorts))
+        joined = membership.join(participants, on=ID_COLUMN, how='inner')
+
+        fields = [column for column in participants.columns if column != 'age']
+        long = joined.melt(id_vars='cohort', value_vars=fields, var_name='field', value_name='category').dropna()
+        counts = long.groupby(['cohort', 'field', 'category'], observed=True).size().rename('count').reset_index()
+        answered = counts.groupby(['cohort', 'field'], observed=True)['count'].transform('sum')
+        counts['percentage'] = 100 * counts['count'] / answered
+
+        # Fields in their given order, categories by their frequency over all cohorts
+        counts['field_order'] = counts['field'].map({field: i for i, field in enumerate(fields)})
+        counts['total'] = counts.groupby(['field', 'category'])['count'].transform('sum')
+        counts = counts.sort_values(['cohort', 'field_order', 'total', 'category'],
+                                    ascending=[True, True, False, True])
+        counts = counts.drop(columns=['field_order', 'total']).reset_index(drop=True)
+
+        grouped = joined.groupby('cohort', observed=False)
+        ages = grouped.size().rename('n').to_frame()
+        if 'age' in joined:
+            statistics = grouped['age'].agg(['count', 'min', 'max', 'mean', 'std'])
+            ages = ages.join(statistics.add_prefix('age_'))
+        return counts, ages.reset_index()
+
+
+def summary_table(counts, ages):
+    """Wide, publication-style table: one row per age statistic / category,
+    one column per cohort (headed with its size), cells 'count (percent%)'."""
+    rows = []
+    for age in ages.itertuples():
+        column = f'{age.cohort} (N={age.n})'
+        if 'age_count' in ages and age.age_count > 0:
+            rows.append(('Age', 'Range', column, f'{age.age_min:.0f} - {age.age_max:.0f}'))
+            rows.append(('Age', 'Mean (SD)', column, f'{age.age_mean:.1f} ({age.age_std:.1f})'))
+        for row in counts[counts['cohort'] == age.cohort].itertuples():
+            rows.append((row.field.capitalize(), row.category, column, f'{row.count} ({row.percentage:.0f}%)'))
+
+    table = pd.DataFrame(rows, columns=['Field', 'Metric', 'cohort', 'value'])
+    order = pd.MultiIndex.from_frame(table[['Field', 'Metric']].drop_duplicates())
+    wide = table.pivot(index=['Field', 'Metric'], columns='cohort', values='value').reindex(order)
+    wide = wide[list(table['cohort'].unique())].fillna('0 (0%)')
+    return wide.reset_index().rename_axis(columns=None)
+
+
+def to_markdown(table):
+    """GitHub-flavoured Markdown for a DataFrame (no tabulate dependency)."""
+    def cell(value):
+        return '' if pd.isna(value) else str(value).replace('|', '\\|')
+
+    numeric = [pd.api.types.is_numeric_dtype(table[column]) for column in table.columns]
+    lines = ['| ' + ' | '.join(cell(column) for column in table.columns) + ' |',
+             '| ' + ' | '.join('---:' if is_numeric else '---' for is_numeric in numeric) + ' |']
+    for values in table.itertuples(index=False):
+        lines.append('| ' + ' | '.join(cell(value) for value in values) + ' |')
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Demographics summary for several cohorts at once.')
+    parser.add_argument('export', help='participant_details_questionnaire.csv')
+    parser.add_argument('--included', help='table of included participants, e.g. organized_data.csv')
+    parser.add_argument('--group-column', default='Group', help='column of --included that splits it into groups')
+    parser.add_argument('--min-age', type=float, default=MIN_AGE)
+    parser.add_argument('--output', default='demographics',
+                        help='writes <output>.csv, <output>_age.csv and <output>.md')
+    args = parser.parse_args()
+
+    details = participant_table(read_export(args.export), min_age=args.min_age)
+    cohort_ids = {'All participants': details.index}
+    if args.included:
+        included = pd.read_csv(args.included)
+        cohort_ids['Included participants'] = included['Participant.Public.ID']
+        if args.group_column in included:
+            for group, members in included.groupby(args.group_column)['Participant.Public.ID']:
+                cohort_ids[group] = members
+
+    count_table, age_table = summarize(details, cohort_ids)
+    count_table.to_csv(f'{args.output}.csv', index=False)
+    age_table.to_csv(f'{args.output}_age.csv', index=False)
+    markdown = to_markdown(summary_table(count_table, age_table))
+    with open(f'{args.output}.md', 'w') as f:
+        f.write(markdown + '\n')
+    print(markdown)
+    print(f"Summaries saved to: {args.output}.csv, {args.output}_age.csv, {args.output}.md")
@@ -0,0 +1,202 @@
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from bandit_model import TrialArrays, prepare_trials
+from bandit_models import MODELS, get_model
+from profiling import stage
+
+# Fast per-subject MAP fits of the banditNarm_4par model, as an exploratory
+# stand-in for the hBayesDM run in model fitting/run_model_seperately.R.
+#
+# Parameters are estimated on the unconstrained (probit) scale with a normal
+# prior, N(0, 1) by default, which maps to a flat prior over Arew, Apun in
+# [0, 1] and R, P in [0, 30] like hBayesDM's individual-level parameters.
+# Subjects are split into chunks that run in a process pool; within a chunk
+# all subjects and starting points are optimised together, because their
+# objectives are independent and the batched likelihood scores them in one
+# pass. Output follows the allIndPars / *_modelparameters.csv schema.
+# Any model from bandit_models.MODELS can be fitted; banditNarm_4par is the default.
+
+
+def negative_log_posterior(raw, trials, prior_mean=0.0, prior_sd=1.0, model='4par'):
+    """Summed negative log posterior and its gradient over a batch of fits.
+
+    `raw` has shape (..., n_subjects, n_params) on the unconstrained scale.
+    Returns the per-fit values (shape (..., n_subjects)) and the gradient w.r.t. `raw`.
+    """
+    log_lik, grad = get_model(model).raw_log_likelihood_grad(raw, trials)
+    z = (raw - prior_mean) / prior_sd
+    value = -log_lik + 0.5 * (z ** 2).sum(axis=-1)
+    gradient = -grad + z / prior_sd
+    return value, gradient
+
+
+def _batched_bfgs(objective, x0, max_iter=200, gtol=1e-5, max_step=2.0):
+    # BFGS run independently for each row of x0 (n_problems, n_params), with
+    # a backtracking line search per row. Only the rows still searching are
+    # re-evaluated, so converged problems drop out of the batch.
+    x = x0.copy()
+    n_problems, n_params = x.shape
+    identity = np.eye(n_params)
+    inv_hessian = np.tile(identity, (n_problems, 1, 1))
+    failures = np.zeros(n_problems, dtype=int)
+    value, gradient = objective(x, np.arange(n_problems))
+
+    for _ in range(max_iter):
+        active = np.flatnonzero(np.abs(gradient).max(axis=1) > gtol)
+        if len(active) == 0:
+            break
+
+        direction = -np.einsum('nij,nj->ni', inv_hessian[active], gradient[active])
+        slope = (direction * gradient[active]).sum(axis=1)
+        uphill = slope >= 0
+        direction[uphill] = -gradient[active][uphill]
+        inv_hessian[active[uphill]] = identity
+        slope[uphill] = -(gradient[active][uphill] ** 2).sum(axis=1)
+
+        # Keep the first trial step within max_step on the raw scale
+        step = np.minimum(1.0, max_step / np.abs(direction).max(axis=1))
+        new_x = x[active].copy()
+        new_value = value[active].copy()
+        new_gradient = gradient[active].copy()
+        searching = np.arange(len(active))
+        for _ in range(30):
+            trial_x = x[active[searching]] + step[searching, None] * direction[searching]
+            trial_value, trial_gradient = objective(trial_x, active[searching])
+            accepted = trial_value <= value[active[searching]] + 1e-4 * step[searching] * slope[searching]
+            done = searching[accepted]
+            new_x[done] = trial_x[accepted]
+            new_value[done] = trial_value[accepted]
+            new_gradient[done] = trial_gradient[accepted]
+            searching = searching[~accepted]
+            if len(searching) == 0:
+                break
+            step[searching] *= 0.5
+
+        # Rows whose line search failed keep their point and restart from
+        # steepest descent (s = y = 0 resets their inverse Hessian below)
+        failed = np.zeros(len(active), dtype=bool)
+        failed[searching] = True
+        s = new_x - x[active]
+        y = new_gradient - gradient[active]
+        sy = (s * y).sum(axis=1)
+        curved = sy > 1e-10
+        rho = np.where(curved, 1.0 / np.where(curved, sy, 1.0), 0.0)
+        h = inv_hessian[active]
+        left = identity - rho[:, None, None] * s[:, :, None] * y[:, None, :]
+        updated = left @ h @ left.transpose(0, 2, 1) + rho[:, None, None] * s[:, :, None] * s[:, None, :]
+        inv_hessian[active] = np.where(curved[:, None, None], updated, identity)
+
+        # Converged: an accepted step that barely decreased the objective, or a
+        # second failed search in a row (the retry from steepest descent)
+        stalled = ~failed & (np.abs(new_value - value[active]) <= 1e-12 * (1 + np.abs(value[active])))
+        failures[active] = np.where(failed, failures[active] + 1, 0)
+        stalled |= failures[active] >= 2
+        x[active], value[active], gradient[active] = new_x, new_value, new_gradient
+        gradient[active[stalled]] = 0.0
+
+    return x, value
+
+
+def _fit_chunk(trials, starts, prior_mean, prior_sd, max_iter, model):
+    # starts: (n_starts, n_subjects, n_params). Every (start, subject) pair is an
+    # independent problem; they are stacked into one batch and optimised together.
+    n_starts, n_subjects, n_params = starts.shape
+    subject = np.tile(np.arange(n_subjects), n_starts)
+    problems = _subset(trials, subject)
+    mean = np.tile(prior_mean, (n_starts, 1))
+    sd = np.tile(prior_sd, (n_starts, 1))
+
+    def objective(raw, index):
+        return negative_log_posterior(raw, _subset(problems, index), mean[index], sd[index], model)
+
+    raw, value = _batched_bfgs(objective, starts.reshape(-1, n_params), max_iter=max_iter)
+    raw = raw.reshape(starts.shape)
+    value = value.reshape(n_starts, n_subjects)
+
+    best = value.argmin(axis=0)
+    subjects = np.arange(n_subjects)
+    return raw[best, subjects], value[best, subjects]
+
+
+def _subset(trials, index):
+    return TrialArrays(trials.subjects[index], trials.choice[index], trials.gain[index],
+                       trials.loss[index], trials.mask[index])
+
+
+def fit_raw(trials, n_starts=5, prior_mean=0.0, prior_sd=1.0, init=None, n_jobs=None,
+            chunk_size=None, max_iter=200, seed=1234, model='4par'):
+    """MAP estimates on the unconstrained scale for every subject in `trials`.
+
+    The first start is `init` (shape (n_subjects, n_params), defaults to the
+    prior mean); the others are drawn from the prior. Returns (raw estimates
+    of shape (n_subjects, n_params), negative log posterior per subject).
+    """
+    with stage('fit', rows=len(trials.subjects), model=get_model(model).name):
+        n_subjects = len(trials.subjects)
+        n_params = get_model(model).n_params
+        prior_mean = np.broadcast_to(np.asarray(prior_mean, dtype=float), (n_subjects, n_params))
+        prior_sd = np.broadcast_to(np.asarray(prior_sd, dtype=float), (n_subjects, n_params))
+
+        rng = np.random.default_rng(seed)
+        starts = prior_mean + prior_sd * rng.standard_normal((n_starts, n_subjects, n_params))
+        starts[0] = prior_mean if init is None else init
+
+        # By default one chunk per worker, capped so each batch stays small in memory
+        n_workers = 1 if n_jobs == 1 else (n_jobs or os.cpu_count() or 1)
+        if chunk_size is None:
+            chunk_size = min(512, max(1, -(-n_subjects // n_workers)))
+        chunks = [np.arange(i, min(i + chunk_size, n_subjects)) for i in range(0, n_subjects, chunk_size)]
+        jobs = [(_subset(trials, index), starts[:, index], prior_mean[index], prior_sd[index], max_iter, model)
+                for index in chunks]
+
+        if n_jobs == 1 or len(jobs) <= 1:
+            results = [_fit_chunk(*job) for job in jobs]
+        else:
+            with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+                results = list(pool.map(_fit_chunk, *zip(*jobs)))
+
+        raw = np.concatenate([r[0] for r in results]) if results else np.zeros((0, n_params))
+        value = np.concatenate([r[1] for r in results]) if results else np.zeros(0)
+        return raw, value
+
+
+def fit_subjects(data, id_col='Participant.Public.ID', lose_value=1, model='4par', **kwargs):
+    """Fit every participant in a cleaned trial table.
+
+    Returns a DataFrame with the allIndPars columns (subjID and the model's
+    parameters, e.g. Arew, Apun, R, P). Keyword arguments are passed on to `fit_raw`.
+    """
+    model = get_model(model)
+    trials = prepare_trials(data, id_col=id_col, lose_value=lose_value)
+    raw, _ = fit_raw(trials, model=model.name, **kwargs)
+    parameters = pd.DataFrame(model.to_constrained(raw), columns=model.parameters)
+    parameters.insert(0, 'subjID', trials.subjects)
+    return parameters
+
+
+def write_individual_parameters(parameters, path):
+    # Same layout as R's write.csv(allIndPars): 1-based row names in the first column
+    parameters = parameters.reset_index(drop=True)
+    parameters.index = parameters.index + 1
+    parameters.to_csv(path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='MAP fit of a bandit model for each participant.')
+    parser.add_argument('data', help='cleaned trial data, e.g. non_anhedonic_cleaned_data.csv')
+    parser.add_argument('output', help='output parameter table, e.g. nonanhedonic_modelparameters.csv')
+    parser.add_argument('--model', default='4par', choices=list(MODELS))
+    parser.add_argument('--starts', type=int, default=5, help='optimiser starts per participant')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(), help='worker processes')
+    parser.add_argument('--seed', type=int, default=1234)
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.data)
+    fitted = fit_subjects(df, model=args.model, n_starts=args.starts, n_jobs=args.jobs, seed=args.seed)
+    write_individual_parameters(fitted, args.output)
+    print(f"Fitted {len(fitted)} participants, parameters saved to: {args.output}")
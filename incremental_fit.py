@@ -0,0 +1,132 @@
+import argparse
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from bandit_model import prepare_trials
+from bandit_models import MODELS, get_model
+from fit_bandit import fit_raw, write_individual_parameters
+from profiling import stage
+from trial_cache import file_hash
+from trial_store import TrialStore
+
+# Incremental refits for growing cohorts.
+#
+# A JSON store keeps every participant's MAP fit (unconstrained estimates and
+# objective) keyed by model version and participant ID, together with a hash
+# of that participant's choices and outcomes. On each run only participants
+# who are new or whose trials changed are fitted; everyone else is read back
+# from the store. The model version is a hash of the model and fitting code
+# and of the fit settings, so changing either invalidates the stored fits.
+# New fits start from the current group mean of the stored estimates (plus
+# random starts from the prior), which is usually close to the optimum.
+
+STORE_VERSION = 1
+MODEL_CODE = ['bandit_model.py', 'bandit_models.py', 'fit_bandit.py']
+
+
+def model_version(model, prior_mean=0.0, prior_sd=1.0, lose_value=1):
+    """Hash of the model/fitting code and the settings that change a fit."""
+    digest = hashlib.sha256()
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for name in MODEL_CODE:
+        digest.update(file_hash(os.path.join(directory, name)).encode())
+    digest.update(json.dumps([model, np.asarray(prior_mean).tolist(), np.asarray(prior_sd).tolist(),
+                              lose_value]).encode())
+    return f'{model}:{digest.hexdigest()[:16]}'
+
+
+def participant_hashes(store):
+    """SHA-256 of each participant's choice, gain and loss sequence."""
+    choice, gain, loss = (np.ascontiguousarray(store.column(name), dtype=np.int16)
+                          for name in ('choice', 'gain', 'loss'))
+    hashes = []
+    for i in range(len(store)):
+        rows = slice(store.offsets[i], store.offsets[i + 1])
+        digest = hashlib.sha256()
+        for values in (choice, gain, loss):
+            digest.update(values[rows].tobytes())
+        hashes.append(digest.hexdigest())
+    return hashes
+
+
+def load_store(path):
+    try:
+        with open(path) as f:
+            store = json.load(f)
+    except (OSError, ValueError):
+        return {'version': STORE_VERSION, 'fits': {}}
+    if store.get('version') != STORE_VERSION:
+        return {'version': STORE_VERSION, 'fits': {}}
+    return store
+
+
+def save_store(store, path):
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(store, f)
+    os.replace(tmp, path)
+
+
+def refit(data, store_path, model='4par', id_col='Participant.Public.ID', lose_value=1, n_starts=5,
+          prior_mean=0.0, prior_sd=1.0, n_jobs=None, seed=1234):
+    """Fit new or changed participants in `data` and reuse stored fits for the rest.
+
+    Returns (allIndPars-style table for every participant in `data`, number
+    of participants fitted in this run). The store at `store_path` is updated.
+    """
+    with stage('refit', model=get_model(model).name) as timing:
+        model = get_model(model)
+        if isinstance(data, TrialStore):
+            trials_store = data
+        else:
+            trials_store = TrialStore.from_frame(data[[id_col, 'choice', 'gain', 'loss']], id_col=id_col,
+                                                 order_col=None)
+        timing.rows = len(trials_store)
+
+        store = load_store(store_path)
+        version = model_version(model.name, prior_mean, prior_sd, lose_value)
+        # Fits from an older version of this model can never be reused
+        for key in [k for k in store['fits'] if k.split(':')[0] == model.name and k != version]:
+            del store['fits'][key]
+        fits = store['fits'].setdefault(version, {})
+        subjects = [str(s) for s in trials_store.subjects]
+        hashes = participant_hashes(trials_store)
+        stale = [i for i, (s, h) in enumerate(zip(subjects, hashes)) if fits.get(s, {}).get('hash') != h]
+
+        if stale:
+            # Warm start from the group mean of the fits we already have
+            known = [fit['raw'] for fit in fits.values()]
+            init = np.mean(known, axis=0) if known else np.broadcast_to(prior_mean, model.n_params)
+            trials = prepare_trials(trials_store.select(trials_store.subjects[stale]), lose_value=lose_value)
+            raw, nlp = fit_raw(trials, n_starts=n_starts, prior_mean=prior_mean, prior_sd=prior_sd,
+                               init=np.tile(init, (len(stale), 1)), n_jobs=n_jobs, seed=seed, model=model.name)
+            for k, i in enumerate(stale):
+                fits[subjects[i]] = {'hash': hashes[i], 'raw': raw[k].tolist(), 'nlp': float(nlp[k])}
+            save_store(store, store_path)
+
+        raw = np.array([fits[s]['raw'] for s in subjects]).reshape(-1, model.n_params)
+        parameters = pd.DataFrame(model.to_constrained(raw), columns=model.parameters)
+        parameters.insert(0, 'subjID', trials_store.subjects)
+        return parameters, len(stale)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fit only new or changed participants, reusing stored fits.')
+    parser.add_argument('data', help='cleaned trial data, e.g. non_anhedonic_cleaned_data.csv')
+    parser.add_argument('output', help='output parameter table, e.g. nonanhedonic_modelparameters.csv')
+    parser.add_argument('--store', default='fit_store.json', help='persistent per-participant fit store')
+    parser.add_argument('--model', default='4par', choices=list(MODELS))
+    parser.add_argument('--starts', type=int, default=5, help='optimiser starts per new participant')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(), help='worker processes')
+    parser.add_argument('--seed', type=int, default=1234)
+    args = parser.parse_args()
+
+    fitted, n_fitted = refit(pd.read_csv(args.data), args.store, model=args.model, n_starts=args.starts,
+                             n_jobs=args.jobs, seed=args.seed)
+    write_individual_parameters(fitted, args.output)
+    print(f"Fitted {n_fitted} new or changed participants, reused {len(fitted) - n_fitted}; "
+          f"parameters saved to: {args.output}")
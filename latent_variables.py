@@ -0,0 +1,231 @@
+import argparse
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from bandit_model import N_ARMS, prepare_trials
+from bandit_models import MODELS, get_model
+from fit_bandit import _subset
+from profiling import stage
+from trial_store import ID_COLUMN, TrialStore
+
+# Per-trial latent variables of a fitted trial model, for regressing RT and
+# choice on model-derived signals.
+#
+# For every subject and trial the model's state before the choice (Qr and Qp
+# per arm for the delta-rule models, mu and variance for the Kalman filter),
+# the choice probabilities and the prediction errors of the chosen arm are
+# computed with the same batched recursion as the log-likelihood, for all
+# subjects at once and for point estimates (n_subjects, n_params) or posterior
+# draws (n_draws, n_subjects, n_params). Results are written as one float32
+# .npy file per column plus a manifest.json, in the row order of the
+# TrialStore (subject-major, trial_nr within subject): a column is (n_rows,)
+# for point estimates and (n_draws, n_rows) for draws. Subjects and draws are
+# processed in chunks that fit the memory budget and written straight into
+# memory-mapped outputs, so many draws of large cohorts never have to fit in
+# memory; load_latents memory-maps the table again.
+
+LATENT_VERSION = 1
+
+
+def column_names(model, n_arms=N_ARMS):
+    """Output columns of a model: per-arm states and their chosen-arm value,
+    choice probabilities (p_1 .. p_n, p_chosen) and prediction errors."""
+    model = get_model(model)
+    names = []
+    for prefix in model.state_names + ['p']:
+        names.extend(f'{prefix}_{arm + 1}' for arm in range(n_arms))
+        names.append(f'{prefix}_chosen')
+    return names + model.error_names
+
+
+def trajectories(params, trials, model='4par', n_arms=N_ARMS):
+    """Latent variables of every trial for parameters of shape (..., n_subjects, n_params).
+
+    Returns a dict of column_names(model) to arrays of shape (..., n_subjects,
+    n_trials); the state and probabilities are those before the trial's choice
+    (padding trials hold the last real trial's state).
+    """
+    model = get_model(model)
+    batch_shape, theta = model._columns(params)
+    n_trials = trials.choice.shape[1]
+    arms = np.arange(n_arms)
+    state = model.initial_state(theta, batch_shape, n_arms)
+    per_arm = {name: np.empty(batch_shape + (n_trials, n_arms)) for name in model.state_names + ['p']}
+    errors = {name: np.zeros(batch_shape + (n_trials,)) for name in model.error_names}
+
+    for t in range(n_trials):
+        chosen = trials.choice[:, t, None] == arms
+        valid = trials.mask[:, t]
+        for name, values in zip(model.state_names, state):
+            per_arm[name][..., t, :] = values
+        per_arm['p'][..., t, :] = np.exp(model.log_probabilities(state, theta))
+        gain, loss = trials.gain[:, t, None], trials.loss[:, t, None]
+        for name, values in zip(model.error_names, model.prediction_errors(state, theta, chosen, gain, loss)):
+            errors[name][..., t] = values
+        new_state = model.update(state, theta, chosen, gain, loss)
+        state = tuple(np.where(valid[:, None], new, old) for new, old in zip(new_state, state))
+
+    chosen = trials.choice[..., None] == arms
+    out = {}
+    for name, values in per_arm.items():
+        for arm in range(n_arms):
+            out[f'{name}_{arm + 1}'] = values[..., arm]
+        out[f'{name}_chosen'] = (values * chosen).sum(axis=-1)
+    out.update(errors)
+    return out
+
+
+def align_parameters(parameters, subjects, model='4par'):
+    """(n_subjects, n_params) array of an allIndPars table in the order of `subjects`."""
+    model = get_model(model)
+    table = parameters.set_index('subjID')
+    missing = pd.Index(subjects).difference(table.index)
+    if len(missing):
+        raise ValueError(f"no parameters for {len(missing)} subjects, e.g. {missing[0]}")
+    return table.loc[subjects, model.parameters].to_numpy(dtype=float)
+
+
+def extract_latents(params, store, output_dir, model='4par', n_arms=N_ARMS, lose_value=1, memory_mb=256):
+    """Write the per-trial latent variables of `store` to `output_dir`.
+
+    `params` is an allIndPars DataFrame (subjID and the model's parameters), an
+    (n_subjects, n_params) array or (n_draws, n_subjects, n_params) posterior
+    draws, with arrays in store.subjects order. Returns the output directory.
+    """
+    model = get_model(model)
+    if isinstance(params, pd.DataFrame):
+        params = align_parameters(params, store.subjects, model)
+    if params.shape[-2:] != (len(store), model.n_params):
+        raise ValueError(f"expected parameters for {len(store)} subjects x {model.n_params} "
+                         f"({', '.join(model.parameters)}), got shape {params.shape}")
+    n_draws = params.shape[0] if params.ndim == 3 else None
+    draw_shape = () if n_draws is None else (n_draws,)
+
+    with stage('latents', rows=store.n_trials * (n_draws or 1), model=model.name):
+        trials = prepare_trials(store, lose_value=lose_value)
+        columns = column_names(model, n_arms)
+        parent = os.path.dirname(os.path.abspath(output_dir))
+        os.makedirs(parent, exist_ok=True)
+        staging = tempfile.mkdtemp(dir=parent)
+        os.chmod(staging, 0o755)
+
+        entries = [{'name': ID_COLUMN, 'file': '0.npy', 'categories': [str(s) for s in store.subjects]}]
+        np.save(os.path.join(staging, '0.npy'), store.codes.astype(np.int32))
+        if 'trial_nr' in store.columns:
+            entries.append({'name': 'trial_nr', 'file': '1.npy'})
+            np.save(os.path.join(staging, '1.npy'), np.asarray(store.columns['trial_nr']))
+        outputs = {}
+        for name in columns:
+            entry = {'name': name, 'file': f'{len(entries)}.npy'}
+            outputs[name] = np.lib.format.open_memmap(os.path.join(staging, entry['file']), mode='w+',
+                                                      dtype=np.float32, shape=draw_shape + (store.n_trials,))
+            entries.append(entry)
+
+        # Every (draw, subject) cell holds a (trials x arms) array per state and
+        # the choice probabilities, and a (trials) array per output column
+        n_trials = trials.mask.shape[1]
+        per_cell = 8 * n_trials * ((len(model.state_names) + 1) * (n_arms + 2) + len(columns))
+        cells = max(1, int(memory_mb * 2 ** 20 / per_cell))
+        subject_chunk = min(len(store), cells) if len(store) else 1
+        draw_chunk = max(1, cells // subject_chunk)
+        for first in range(0, len(store), subject_chunk):
+            index = slice(first, first + subject_chunk)
+            chunk_trials = _subset(trials, index)
+            rows = slice(store.offsets[first], store.offsets[min(first + subject_chunk, len(store))])
+            for start in range(0, n_draws or 1, draw_chunk):
+                if n_draws is None:
+                    values, target = trajectories(params[index], chunk_trials, model, n_arms), (rows,)
+                else:
+                    draws = np.asarray(params[start:start + draw_chunk, index], dtype=float)
+                    values = trajectories(draws, chunk_trials, model, n_arms)
+                    target = (slice(start, start + draw_chunk), rows)
+                for name in columns:
+                    outputs[name][target] = values[name][..., chunk_trials.mask]
+        for values in outputs.values():
+            values.flush()
+        del outputs
+
+        manifest = {
+            'version': LATENT_VERSION,
+            'model': model.name,
+            'n_rows': int(store.n_trials),
+            'n_draws': n_draws,
+            'columns': entries
+        }
+        with open(os.path.join(staging, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f, indent=1)
+
+        # Swap the finished table into place so readers never see a partial one
+        if os.path.exists(output_dir):
+            shutil.rmtree(output_dir)
+        os.replace(staging, output_dir)
+        return output_dir
+
+
+def load_latents(output_dir):
+    """Memory-mapped columns and the manifest of a table written by extract_latents."""
+    with open(os.path.join(output_dir, 'manifest.json')) as f:
+        manifest = json.load(f)
+    if manifest.get('version') != LATENT_VERSION:
+        raise ValueError(f"{output_dir} was written by another version of latent_variables.py")
+    columns = {entry['name']: np.load(os.path.join(output_dir, entry['file']), mmap_mode='r')
+               for entry in manifest['columns']}
+    return columns, manifest
+
+
+def latent_frame(output_dir, draw=None):
+    """The latent table as a DataFrame with participant IDs; for posterior
+    draws one `draw`, or the posterior mean of every column by default."""
+    columns, manifest = load_latents(output_dir)
+    data = {}
+    for entry in manifest['columns']:
+        values = columns[entry['name']]
+        if 'categories' in entry:
+            data[entry['name']] = pd.Categorical.from_codes(values, entry['categories'])
+        elif values.ndim == 2:
+            data[entry['name']] = values.mean(axis=0) if draw is None else values[draw]
+        else:
+            data[entry['name']] = values
+    return pd.DataFrame(data)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Per-trial Q-values, prediction errors and choice probabilities.')
+    parser.add_argument('data', help='cleaned trial CSV')
+    parser.add_argument('parameters', help='allIndPars CSV, or .npy posterior draws (n_draws x n_subjects x n_params)')
+    parser.add_argument('output_dir')
+    parser.add_argument('--subjects', help='CSV with a subjID column in the subject order of the .npy draws')
+    parser.add_argument('--model', default='4par', choices=list(MODELS))
+    parser.add_argument('--lose-value', type=float, default=1, help='loss value that counts as a punishment')
+    parser.add_argument('--memory-mb', type=int, default=256)
+    parser.add_argument('--csv', help='also write the table (posterior mean for draws) to this CSV')
+    args = parser.parse_args()
+
+    trial_store = TrialStore.from_csv(args.data)
+    if args.parameters.endswith('.npy'):
+        if not args.subjects:
+            parser.error('--subjects is required with posterior draws')
+        draw_subjects = pd.Index(pd.read_csv(args.subjects)['subjID'].astype(str))
+        parameter_values = np.load(args.parameters, mmap_mode='r')
+        if parameter_values.ndim != 3 or parameter_values.shape[1] != len(draw_subjects):
+            raise ValueError(f"{args.parameters} has shape {parameter_values.shape}, expected (n_draws, "
+                             f"{len(draw_subjects)} subjects of {args.subjects}, n_params)")
+        store_subjects = pd.Index(trial_store.subjects.astype(str))
+        missing = store_subjects.difference(draw_subjects)
+        if len(missing):
+            raise ValueError(f"no draws for {len(missing)} subjects of {args.data}, e.g. {missing[0]}")
+        if not draw_subjects.equals(store_subjects):
+            parameter_values = parameter_values[:, draw_subjects.get_indexer(store_subjects)]
+    else:
+        parameter_values = pd.read_csv(args.parameters)
+    extract_latents(parameter_values, trial_store, args.output_dir, model=args.model, lose_value=args.lose_value,
+                    memory_mb=args.memory_mb)
+    print(f"Latent variables saved to: {args.output_dir}")
+    if args.csv:
+        latent_frame(args.output_dir).to_csv(args.csv, index=False)
+        print(f"Table saved to: {args.csv}")
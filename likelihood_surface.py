@@ -0,0 +1,382 @@
+import argparse
+import itertools
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from bandit_model import N_ARMS, prepare_trials
+from bandit_models import MODELS, get_model
+from fit_bandit import _subset
+from latent_variables import trajectories
+from profiling import stage
+from trial_store import TrialStore
+
+# Likelihood surfaces of the trial models on dense parameter grids, to see
+# why some parameters recover worse than others (e.g. Arew / R trade-offs).
+#
+# The grid is the product of one axis of values per parameter; a 2-D slice is
+# a grid whose other axes hold a single value. Grid points are the batch
+# dimension of the likelihood, and the grid is split into blocks of rows (the
+# leading parameters) that are evaluated and reduced one at a time, so a
+# 50^4 grid is never stored: per subject only the maximum, the profile
+# likelihoods (maximum over the other parameters) of every parameter and
+# parameter pair, and the marginals of the normalised likelihood are kept.
+# The normalised likelihood is a grid posterior under a flat prior on the
+# grid, which gives posterior means, SDs and parameter correlations.
+# Subjects and row blocks are spread over a process pool.
+#
+# banditNarm_4par has a much faster path: Qr is linear in R and Qp in P, so
+# with Q-values computed once for R = P = 1 on the Arew and Apun axes, the
+# choice probability on trial t is 1 / (1 + sum_k exp(R dQr_k) exp(P dQp_k))
+# over the unchosen arms k. For a block of (Arew, R) rows and all (Apun, P)
+# columns that sum is one batched matrix product per trial, and the log is
+# taken once per few trials on the running product, so a 50^4 grid of 200
+# trials takes under ten seconds per subject and core. Other models run their
+# full recursion on the batch of grid points.
+
+Surface = namedtuple('Surface', ['subjects', 'axes', 'max_log_lik', 'mle', 'profiles', 'profiles_2d', 'marginals',
+                                 'marginals_2d', 'mean', 'cov', 'corr'])
+
+
+def grid_axes(model='4par', points=50, bounds=None, fixed=None):
+    """Grid axis of each model parameter: `points` values evenly spaced over
+    the parameter's bounds (or `bounds[name] = (low, high)`); parameters in
+    `fixed` get the single given value."""
+    model = get_model(model)
+    bounds, fixed = bounds or {}, fixed or {}
+    unknown = (set(bounds) | set(fixed)) - set(model.parameters)
+    if unknown:
+        raise ValueError(f"{model.name} has no parameters {sorted(unknown)}; it has {model.parameters}")
+    axes = {}
+    for k, name in enumerate(model.parameters):
+        if name in fixed:
+            axes[name] = np.array([float(fixed[name])])
+        else:
+            axes[name] = np.linspace(*bounds.get(name, (model.lower[k], model.upper[k])), points)
+    return axes
+
+
+def _layout(model):
+    # Parameter axes of the row blocks (prefix) and of the columns (tail)
+    if model.name == '4par':
+        return (0, 2), (1, 3)
+    n_prefix = model.n_params // 2
+    return tuple(range(n_prefix)), tuple(range(n_prefix, model.n_params))
+
+
+def _reduce(block, prefix_index, prefix, tail, keep, shape, ufunc, initial):
+    # Reduce a (subjects, rows, *tail) block over every parameter not in
+    # `keep`, giving (subjects, *[shape of keep]) with keep in parameter order
+    drop = tuple(2 + tail.index(a) for a in tail if a not in keep)
+    values = ufunc.reduce(block, axis=drop) if drop else block
+    kept_prefix = [a for a in prefix if a in keep]
+    if kept_prefix:
+        out = np.full((block.shape[0],) + tuple(shape[a] for a in kept_prefix) + values.shape[2:], initial)
+        ufunc.at(out, (slice(None),) + tuple(prefix_index[a] for a in kept_prefix), values)
+    else:
+        out = ufunc.reduce(values, axis=1)
+    order = kept_prefix + [a for a in tail if a in keep]
+    return out.transpose([0] + [1 + order.index(a) for a in sorted(keep)])
+
+
+def _block_statistics(block, prefix_index, prefix, tail, shape):
+    # Maximum, arg-maximum and pairwise profiles / likelihood marginals (the
+    # latter relative to the maximum) of a block
+    n_subjects = block.shape[0]
+    flat = block.reshape(n_subjects, -1)
+    best = flat.argmax(axis=1)
+    row, rest = np.divmod(best, flat.shape[1] // block.shape[1])
+    argmax = np.zeros((n_subjects, len(shape)), dtype=np.int64)
+    for a in prefix:
+        argmax[:, a] = prefix_index[a][row]
+    for a, values in zip(tail, np.unravel_index(rest, block.shape[2:])):
+        argmax[:, a] = values
+    maximum = flat[np.arange(n_subjects), best]
+
+    weights = np.exp(block - maximum.reshape((-1,) + (1,) * (block.ndim - 1)))
+    pairs = list(itertools.combinations(range(len(shape)), 2))
+    profiles = {pair: _reduce(block, prefix_index, prefix, tail, pair, shape, np.maximum, -np.inf) for pair in pairs}
+    marginals = {pair: _reduce(weights, prefix_index, prefix, tail, pair, shape, np.add, 0.0) for pair in pairs}
+    return {'max': maximum, 'argmax': argmax, 'profiles': profiles, 'marginals': marginals}
+
+
+def _combine(first, second):
+    # Statistics of the union of two sets of grid points for the same subjects
+    if first is None:
+        return second
+    maximum = np.maximum(first['max'], second['max'])
+    better = second['max'] > first['max']
+    combined = {'max': maximum, 'argmax': np.where(better[:, None], second['argmax'], first['argmax']),
+                'profiles': {}, 'marginals': {}}
+    scale_first, scale_second = np.exp(first['max'] - maximum), np.exp(second['max'] - maximum)
+    for pair in first['profiles']:
+        combined['profiles'][pair] = np.maximum(first['profiles'][pair], second['profiles'][pair])
+        combined['marginals'][pair] = (scale_first[:, None, None] * first['marginals'][pair]
+                                       + scale_second[:, None, None] * second['marginals'][pair])
+    return combined
+
+
+def _separable_blocks(trials, axes, rows, memory_mb):
+    # banditNarm_4par: log-likelihood blocks (1, rows, n_Apun, n_P) per subject
+    arew, apun, r, p = axes
+    n_subjects, n_trials = trials.choice.shape
+    n_arms = N_ARMS
+    n = max(len(arew), len(apun))
+    unit = np.ones((n, n_subjects, 4))
+    unit[:len(arew), :, 0] = arew[:, None]
+    unit[:len(apun), :, 1] = apun[:, None]
+    values = trajectories(unit, trials, '4par', n_arms)
+
+    # Q-value of each unchosen arm minus the chosen arm's, (n, subjects, trials, arms - 1)
+    others = (trials.choice[..., None] + 1 + np.arange(n_arms - 1)) % n_arms
+    differences = []
+    for stream in ('Qr', 'Qp'):
+        q = np.stack([values[f'{stream}_{arm + 1}'] for arm in range(n_arms)], axis=-1)
+        differences.append(np.take_along_axis(q, np.broadcast_to(others, q.shape[:1] + others.shape), axis=-1)
+                           - values[f'{stream}_chosen'][..., None])
+    d_reward, d_punishment = differences
+    d_reward, d_punishment = d_reward[:len(arew)], d_punishment[:len(apun)]
+
+    ia, ir = np.unravel_index(rows, (len(arew), len(r)))
+    n_columns = len(apun) * len(p)
+    for s in range(n_subjects):
+        # exp(P dQp) of every (Apun, P) column, 0 on padding trials: (trials, arms - 1, columns)
+        e_pun = np.exp(p[None, :, None, None] * d_punishment[:, s, None])
+        e_pun = e_pun * trials.mask[s, :, None]
+        # The running product over `span` trials stays below the float64 range:
+        # log(1 + sum_k exp(...)) is at most bound + log 2
+        bound = np.log(n_arms - 1) + np.abs(r).max() * np.abs(d_reward[:, s]).max() \
+            + np.abs(p).max() * np.abs(d_punishment[:, s]).max()
+        span = max(1, min(n_trials, int(700 // (bound + np.log(2)))))
+        n_spans = -(-n_trials // span)
+        e_pun = np.concatenate([e_pun.reshape(n_columns, n_trials, n_arms - 1),
+                                np.zeros((n_columns, n_spans * span - n_trials, n_arms - 1))], axis=1)
+        e_pun = np.ascontiguousarray(e_pun.transpose(1, 2, 0))
+
+        per_row = 8 * n_columns * (n_spans * span + n_spans + 8)
+        block_rows = max(1, int(memory_mb * 2 ** 20 / per_row))
+        for start in range(0, len(rows), block_rows):
+            block = slice(start, start + block_rows)
+            e_rew = np.exp(r[ir[block], None, None] * d_reward[ia[block], s])
+            e_rew = np.concatenate([e_rew, np.zeros((len(e_rew), n_spans * span - n_trials, n_arms - 1))], axis=1)
+            z = np.matmul(e_rew.transpose(1, 0, 2), e_pun)
+            z += 1
+            log_lik = -np.log(z.reshape(n_spans, span, *z.shape[1:]).prod(axis=1)).sum(axis=0)
+            yield s, block, log_lik.reshape(1, -1, len(apun), len(p))
+
+
+def _batched_blocks(trials, axes, rows, memory_mb, model, prefix, tail):
+    # Any model: grid points x subjects through the model's recursion
+    shape = tuple(len(axis) for axis in axes)
+    tail_shape = tuple(shape[a] for a in tail)
+    tail_points = np.stack(np.meshgrid(*[axes[a] for a in tail], indexing='ij'), axis=-1).reshape(-1, len(tail))
+    prefix_index = np.unravel_index(rows, tuple(shape[a] for a in prefix))
+    n_subjects, n_trials = trials.choice.shape
+    per_row = 8 * len(tail_points) * n_subjects * (24 + n_trials // 8)
+    block_rows = max(1, int(memory_mb * 2 ** 20 / per_row))
+    for start in range(0, len(rows), block_rows):
+        block = slice(start, start + block_rows)
+        n_rows = len(rows[block])
+        params = np.empty((n_rows, len(tail_points), len(axes)))
+        for a, index in zip(prefix, prefix_index):
+            params[..., a] = axes[a][index[block], None]
+        params[..., list(tail)] = tail_points[None]
+        params = np.broadcast_to(params.reshape(-1, 1, len(axes)), (n_rows * len(tail_points), n_subjects, len(axes)))
+        log_lik = model.log_likelihood(params, trials)
+        yield slice(None), block, log_lik.T.reshape((n_subjects, n_rows) + tail_shape)
+
+
+def _surface_job(trials, axes, rows, model, memory_mb, surface=None, first_subject=0):
+    # Statistics of one chunk of subjects over one range of grid rows
+    model = get_model(model)
+    prefix, tail = _layout(model)
+    shape = tuple(len(axis) for axis in axes)
+    prefix_index = dict(zip(prefix, np.unravel_index(rows, tuple(shape[a] for a in prefix))))
+    n_subjects = len(trials.subjects)
+    if model.name == '4par':
+        blocks = _separable_blocks(trials, axes, rows, memory_mb)
+    else:
+        blocks = _batched_blocks(trials, axes, rows, memory_mb, model, prefix, tail)
+    if surface is not None:
+        surface = np.load(surface, mmap_mode='r+')
+        surface_view = surface.transpose([0] + [1 + a for a in prefix + tail])
+
+    statistics = [None] * n_subjects
+    for subjects, block, log_lik in blocks:
+        index = {a: values[block] for a, values in prefix_index.items()}
+        chunk = _block_statistics(log_lik, index, prefix, tail, shape)
+        members = range(n_subjects)[subjects] if isinstance(subjects, slice) else [subjects]
+        for k, s in enumerate(members):
+            statistics[s] = _combine(statistics[s], _select(chunk, k))
+        if surface is not None:
+            targets = np.arange(n_subjects)[subjects] + first_subject
+            surface_view[(np.atleast_1d(targets)[:, None],) + tuple(index[a][None] for a in prefix)] = log_lik
+    if surface is not None:
+        surface.flush()
+    return statistics
+
+
+def _select(statistics, k):
+    # Statistics of the k-th subject, keeping the subject axis
+    return {'max': statistics['max'][k:k + 1], 'argmax': statistics['argmax'][k:k + 1],
+            'profiles': {pair: values[k:k + 1] for pair, values in statistics['profiles'].items()},
+            'marginals': {pair: values[k:k + 1] for pair, values in statistics['marginals'].items()}}
+
+
+def likelihood_surface(trials, axes, model='4par', memory_mb=256, n_jobs=None, surface=None):
+    """Profile likelihoods and grid-posterior summaries of every subject in `trials`.
+
+    `axes` maps each model parameter to its grid values (see grid_axes). With
+    `surface` (a .npy path) the full log-likelihood surface of shape
+    (n_subjects, *grid shape) is also written there; leave it out for large
+    grids. Returns a Surface of per-subject arrays: max_log_lik, mle (grid
+    values), profiles / marginals per parameter (n_subjects, n_values),
+    profiles_2d / marginals_2d per parameter pair, and the posterior mean,
+    covariance and correlation matrix of the normalised likelihood.
+    """
+    model = get_model(model)
+    names = model.parameters
+    if list(axes) != names:
+        raise ValueError(f"expected grid axes for {names}, got {list(axes)}")
+    if model.n_params < 2:
+        raise ValueError("likelihood surfaces need at least two parameters")
+    grid = [np.asarray(axes[name], dtype=float) for name in names]
+    shape = tuple(len(axis) for axis in grid)
+    n_subjects = len(trials.subjects)
+
+    with stage('likelihood_surface', rows=n_subjects * int(np.prod(shape)), model=model.name):
+        if surface is not None:
+            np.lib.format.open_memmap(surface, mode='w+', dtype=np.float32, shape=(n_subjects,) + shape).flush()
+
+        # Enough jobs to keep every worker busy: whole subjects when there are
+        # many, otherwise each subject's grid split into ranges of rows
+        prefix, _ = _layout(model)
+        n_rows = int(np.prod([shape[a] for a in prefix]))
+        n_workers = 1 if n_jobs == 1 else (n_jobs or os.cpu_count() or 1)
+        target = 4 * n_workers if n_workers > 1 else 1
+        subject_chunk = max(1, -(-n_subjects // target))
+        row_chunk = -(-n_rows // max(1, min(n_rows, -(-target // max(n_subjects, 1)))))
+        jobs = [(_subset(trials, slice(s, s + subject_chunk)), grid, np.arange(r, min(r + row_chunk, n_rows)),
+                 model.name, memory_mb, surface, s)
+                for s in range(0, n_subjects, subject_chunk) for r in range(0, n_rows, row_chunk)]
+
+        if n_jobs == 1 or len(jobs) <= 1:
+            results = [_surface_job(*job) for job in jobs]
+        else:
+            with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+                results = list(pool.map(_surface_job, *zip(*jobs)))
+
+        statistics = [None] * n_subjects
+        for job, result in zip(jobs, results):
+            for k, subject_statistics in enumerate(result):
+                statistics[job[-1] + k] = _combine(statistics[job[-1] + k], subject_statistics)
+        return _summarize(trials.subjects, names, grid, statistics)
+
+
+def _summarize(subjects, names, grid, statistics):
+    n_params = len(names)
+    pairs = list(itertools.combinations(range(n_params), 2))
+    maximum = np.concatenate([s['max'] for s in statistics])
+    argmax = np.concatenate([s['argmax'] for s in statistics])
+    profiles_2d = {pair: np.concatenate([s['profiles'][pair] for s in statistics]) for pair in pairs}
+    marginals_2d = {pair: np.concatenate([s['marginals'][pair] for s in statistics]) for pair in pairs}
+    total = next(iter(marginals_2d.values())).sum(axis=(1, 2))
+    marginals_2d = {pair: values / total[:, None, None] for pair, values in marginals_2d.items()}
+
+    # One-parameter profiles and marginals from any pair containing the parameter
+    profiles, marginals = {}, {}
+    for a in range(n_params):
+        pair = next(pair for pair in pairs if a in pair)
+        other = 2 if pair[0] == a else 1
+        profiles[names[a]] = profiles_2d[pair].max(axis=other)
+        marginals[names[a]] = marginals_2d[pair].sum(axis=other)
+
+    mean = np.stack([marginals[name] @ grid[a] for a, name in enumerate(names)], axis=-1)
+    cov = np.empty((len(subjects), n_params, n_params))
+    for a, name in enumerate(names):
+        cov[:, a, a] = marginals[name] @ grid[a] ** 2 - mean[:, a] ** 2
+    for i, j in pairs:
+        cov[:, i, j] = cov[:, j, i] = (np.einsum('sij,i,j->s', marginals_2d[(i, j)], grid[i], grid[j])
+                                       - mean[:, i] * mean[:, j])
+    # Parameters held at one value (slices) have no correlations
+    varying = np.array([len(axis) > 1 for axis in grid])
+    cov[:, ~varying] = 0
+    cov[:, :, ~varying] = 0
+    sd = np.sqrt(np.clip(np.diagonal(cov, axis1=1, axis2=2), 0, None))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        corr = np.where(varying[:, None] & varying, cov / (sd[:, :, None] * sd[:, None, :]), np.nan)
+
+    mle = np.stack([grid[a][argmax[:, a]] for a in range(n_params)], axis=-1)
+    named_pairs = {(names[i], names[j]): values for (i, j), values in profiles_2d.items()}
+    named_marginals = {(names[i], names[j]): values for (i, j), values in marginals_2d.items()}
+    return Surface(subjects, dict(zip(names, grid)), maximum, mle, profiles, named_pairs, marginals, named_marginals,
+                   mean, cov, corr)
+
+
+def summary_table(result):
+    """One row per subject: maximum log-likelihood, grid MLE, posterior mean
+    and SD of every parameter, and the posterior correlation of every pair."""
+    names = list(result.axes)
+    table = pd.DataFrame({'subjID': result.subjects, 'max_log_lik': result.max_log_lik})
+    sd = np.sqrt(np.clip(np.diagonal(result.cov, axis1=1, axis2=2), 0, None))
+    for a, name in enumerate(names):
+        table[f'{name}_mle'] = result.mle[:, a]
+        table[f'{name}_mean'] = result.mean[:, a]
+        table[f'{name}_sd'] = sd[:, a]
+    for i, j in itertools.combinations(range(len(names)), 2):
+        table[f'corr_{names[i]}_{names[j]}'] = result.corr[:, i, j]
+    return table
+
+
+def profile_table(result):
+    """Long table of the one-parameter profile log-likelihoods and grid-posterior marginals."""
+    parts = []
+    for name, values in result.axes.items():
+        n_subjects, n_values = result.profiles[name].shape
+        parts.append(pd.DataFrame({
+            'subjID': np.repeat(result.subjects, n_values),
+            'parameter': name,
+            'value': np.tile(values, n_subjects),
+            'profile_log_lik': result.profiles[name].ravel(),
+            'marginal': result.marginals[name].ravel()
+        }))
+    return pd.concat(parts, ignore_index=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Profile likelihoods and parameter correlations on dense grids.')
+    parser.add_argument('data', help='cleaned trial data, e.g. anhedonic_cleaned_data.csv')
+    parser.add_argument('--model', default='4par', choices=list(MODELS))
+    parser.add_argument('--points', type=int, default=50, help='grid values per parameter')
+    parser.add_argument('--bounds', nargs=3, action='append', default=[], metavar=('NAME', 'LOW', 'HIGH'),
+                        help='grid range of one parameter (default: its full range)')
+    parser.add_argument('--fix', nargs=2, action='append', default=[], metavar=('NAME', 'VALUE'),
+                        help='hold a parameter at one value, e.g. for 2-D slices')
+    parser.add_argument('--subjects', nargs='+', help='participant IDs (default: everyone)')
+    parser.add_argument('--surface', help='also write the full log-likelihood surface to this .npy')
+    parser.add_argument('--output', default='likelihood_surface',
+                        help='writes <output>_summary.csv, <output>_profiles.csv and <output>_profiles_2d.npz')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(), help='worker processes')
+    parser.add_argument('--memory-mb', type=int, default=256, help='memory per worker for one block of grid rows')
+    args = parser.parse_args()
+
+    store = TrialStore.from_csv(args.data)
+    if args.subjects:
+        store = store.select(args.subjects)
+    axes_values = grid_axes(args.model, args.points, bounds={name: (float(low), float(high))
+                                                             for name, low, high in args.bounds},
+                            fixed={name: float(value) for name, value in args.fix})
+    surface_result = likelihood_surface(prepare_trials(store), axes_values, model=args.model,
+                                        memory_mb=args.memory_mb, n_jobs=args.jobs, surface=args.surface)
+
+    summary_table(surface_result).to_csv(f'{args.output}_summary.csv', index=False)
+    profile_table(surface_result).to_csv(f'{args.output}_profiles.csv', index=False)
+    arrays = {f'axis_{name}': values for name, values in surface_result.axes.items()}
+    arrays.update({f'profile_{i}_{j}': values for (i, j), values in surface_result.profiles_2d.items()})
+    arrays.update({f'marginal_{i}_{j}': values for (i, j), values in surface_result.marginals_2d.items()})
+    np.savez(f'{args.output}_profiles_2d.npz', subjects=surface_result.subjects.astype(str), **arrays)
+    print(summary_table(surface_result).describe().T[['mean', 'std', 'min', 'max']].to_string())
+    print(f"Saved: {args.output}_summary.csv, {args.output}_profiles.csv, {args.output}_profiles_2d.npz")
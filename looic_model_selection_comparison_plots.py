@@ -1,4 +1,8 @@
+import os
+
 import matplotlib.pyplot as plt
+import pandas as pd
+from bandit_models import MODELS
 
 # Model descriptions and corresponding LOOIC values
 models = ['Learning Rate, Reward Sensitivity, Lapse',
@@ -8,6 +12,19 @@ models = ['Learning Rate, Reward Sensitivity, Lapse',
           'Lapse with Exponential Decay']
 looic_values = [801.332, 738.885, 791.991, 774.502, 740.501]
 
+# Use LOOIC values computed from the fitted models when available
+# (python model_comparison.py name=pointwise_log_lik.npy ... --output looic_values.csv)
+looic_file = 'looic_values.csv'
+if os.path.exists(looic_file):
+    looic_table = pd.read_csv(looic_file)
+    # Registry order and descriptive labels, as in the original figure, so
+    # figures from different runs line up; other names follow as they are
+    order = {name: i for i, name in enumerate(MODELS)}
+    looic_table = looic_table.sort_values('model', key=lambda names: names.map(order).fillna(len(order)),
+                                          kind='stable')
+    models = [MODELS[name].label if name in MODELS else name for name in looic_table['model']]
+    looic_values = looic_table['looic'].tolist()
+
 # Subtracting the lowest LOOIC value from all values
 min_looic = min(looic_values)
 relative_looic = [val - min_looic for val in looic_values]
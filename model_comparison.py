@@ -0,0 +1,220 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from bandit_models import get_model
+from profiling import stage
+
+# PSIS-LOO model comparison (Vehtari, Gelman & Gabry, 2017; Vehtari et al.,
+# 2024), the quantity behind the LOOIC values that hBayesDM's printFit reports.
+#
+# For every observation the importance ratios 1 / p(y_i | theta_s) of the
+# posterior draws are Pareto smoothed: the largest M ratios are replaced by
+# the expected order statistics of a generalized Pareto distribution fitted to
+# them (Zhang & Stephens' estimator with the weakly informative prior on k
+# used by the R loo package) and truncated at the largest raw ratio. The
+# estimated shape k is the reliability diagnostic for that observation.
+#
+# All observations are smoothed at once: the draws x observations matrix is
+# processed in blocks of observations sized to a memory budget, so it can also
+# be a memory-mapped array. Every block needs all draws of its observations
+# (the tail fit sorts them), so chunking over draws happens when the pointwise
+# log-likelihoods are computed (`pointwise_log_lik`), not here.
+
+
+def _logsumexp(x, axis=0):
+    top = np.max(x, axis=axis, keepdims=True)
+    top = np.where(np.isfinite(top), top, 0.0)
+    return np.squeeze(top, axis=axis) + np.log(np.exp(x - top).sum(axis=axis))
+
+
+def tail_length(n_draws, r_eff=1.0):
+    """Number of draws in the smoothed tail, as in loo::n_pareto."""
+    return int(np.ceil(np.minimum(0.2 * n_draws, 3 * np.sqrt(n_draws / np.asarray(r_eff)).min())))
+
+
+def pareto_k_threshold(n_draws):
+    """Sample-size dependent threshold above which PSIS estimates are unreliable."""
+    return min(1 - 1 / np.log10(n_draws), 0.7)
+
+
+def gpd_fit(x):
+    """Generalized Pareto fit to exceedances, column-wise.
+
+    `x` has shape (M, n_obs) and is sorted ascending along axis 0. Returns the
+    shape k (with loo's weakly informative prior adjustment) and scale sigma.
+    """
+    n = x.shape[0]
+    prior = 3
+    m = 30 + int(np.sqrt(n))
+    quartile = x[int(n / 4 + 0.5) - 1]
+    jj = np.arange(1, m + 1)[:, None]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        theta = 1 / x[-1] + (1 - np.sqrt(m / (jj - 0.5))) / (prior * quartile)
+        # Profile log-likelihood of theta on the grid, averaged with its softmax weights
+        k = np.log1p(-theta[:, None, :] * x[None]).mean(axis=1)
+        profile = n * (np.log(-theta / k) - k - 1)
+        weights = np.exp(profile - np.where(np.isnan(profile), -np.inf, profile).max(axis=0))
+        weights = np.where(np.isnan(weights), 0.0, weights)
+        weights /= weights.sum(axis=0)
+        theta_hat = (theta * weights).sum(axis=0)
+        k = np.log1p(-theta_hat * x).mean(axis=0)
+        sigma = -k / theta_hat
+    k = (n * k + 10 * 0.5) / (n + 10)
+    return k, sigma
+
+
+def _gpd_quantile(p, k, sigma):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(np.abs(k) < 1e-12, -sigma * np.log1p(-p), sigma * np.expm1(-k * np.log1p(-p)) / k)
+
+
+def psis_smooth(log_ratios, r_eff=1.0):
+    """Pareto smoothed log importance weights for a (n_draws, n_obs) block.
+
+    Returns the normalised log weights (same shape) and the Pareto k of each
+    observation (NaN when the tail is too short or degenerate to fit).
+    """
+    n_draws, n_obs = log_ratios.shape
+    log_weights = log_ratios - log_ratios.max(axis=0)
+    tail = tail_length(n_draws, r_eff)
+    k = np.full(n_obs, np.nan)
+
+    if tail >= 5:
+        order = np.argsort(log_weights, axis=0)
+        tail_index = order[-tail:]
+        cutoff = np.take_along_axis(log_weights, order[-tail - 1][None], axis=0)[0]
+        tail_values = np.take_along_axis(log_weights, tail_index, axis=0)
+        exceedance = np.exp(tail_values) - np.exp(cutoff)
+
+        k, sigma = gpd_fit(exceedance)
+        fitted = np.isfinite(k) & np.isfinite(sigma) & (sigma > 0)
+        p = ((np.arange(1, tail + 1) - 0.5) / tail)[:, None]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            smoothed = np.log(_gpd_quantile(p, k, sigma) + np.exp(cutoff))
+        # Replace the tail where the fit worked, then truncate at the largest raw weight (0)
+        smoothed = np.where(fitted, np.minimum(smoothed, 0.0), tail_values)
+        np.put_along_axis(log_weights, tail_index, smoothed, axis=0)
+        k = np.where(fitted, k, np.nan)
+
+    return log_weights - _logsumexp(log_weights, axis=0), k
+
+
+def psis_loo(log_lik, r_eff=1.0, memory_mb=256):
+    """PSIS-LOO from pointwise log-likelihoods.
+
+    `log_lik` is (n_draws, n_obs) or (n_chains, n_draws, n_obs); an
+    observation can be a subject (summed over its trials) or a single trial.
+    Returns (summary, pointwise): `summary` holds elpd_loo, p_loo and looic
+    with their standard errors plus the Pareto k counts, `pointwise` one row
+    per observation with elpd_loo, p_loo, looic and pareto_k.
+    """
+    with stage('psis_loo', rows=np.shape(log_lik)[-1]):
+        if log_lik.ndim == 3:
+            log_lik = log_lik.reshape(-1, log_lik.shape[-1])
+        n_draws, n_obs = log_lik.shape
+
+        # Observations per block: the sort order, weights and temporaries are a few
+        # (n_draws x block) arrays, the GPD grid a (grid x tail x block) array
+        tail = tail_length(n_draws, r_eff)
+        per_obs = 8 * (6 * n_draws + (30 + int(np.sqrt(tail))) * tail)
+        block = max(1, int(memory_mb * 2 ** 20 / per_obs))
+
+        elpd = np.empty(n_obs)
+        lpd = np.empty(n_obs)
+        k = np.empty(n_obs)
+        for start in range(0, n_obs, block):
+            columns = slice(start, min(start + block, n_obs))
+            values = np.asarray(log_lik[:, columns], dtype=float)
+            log_weights, k[columns] = psis_smooth(-values, r_eff)
+            elpd[columns] = _logsumexp(log_weights + values, axis=0)
+            lpd[columns] = _logsumexp(values, axis=0) - np.log(n_draws)
+
+        pointwise = pd.DataFrame({'elpd_loo': elpd, 'p_loo': lpd - elpd, 'looic': -2 * elpd, 'pareto_k': k})
+        threshold = pareto_k_threshold(n_draws)
+        summary = {}
+        for name in ('elpd_loo', 'p_loo', 'looic'):
+            summary[name] = pointwise[name].sum()
+            summary[f'se_{name}'] = np.sqrt(n_obs) * pointwise[name].std()
+        summary.update({
+            'n_obs': n_obs,
+            'n_draws': n_draws,
+            'k_threshold': threshold,
+            'n_k_high': int((k > threshold).sum()),
+            'n_k_very_high': int((k > 1).sum()),
+            'max_pareto_k': np.nanmax(k) if np.isfinite(k).any() else np.nan
+        })
+        return summary, pointwise
+
+
+def compare_models(pointwise):
+    """loo_compare-style table from a mapping of model name -> psis_loo pointwise table.
+
+    Models are sorted by elpd_loo; elpd_diff and se_diff are relative to the
+    best model and use the paired pointwise differences.
+    """
+    if len({len(table) for table in pointwise.values()}) > 1:
+        raise ValueError('models must be scored on the same observations to be compared')
+    elpd = pd.DataFrame({name: table['elpd_loo'].to_numpy() for name, table in pointwise.items()})
+    totals = elpd.sum().sort_values(ascending=False)
+    best = totals.index[0]
+    differences = elpd.sub(elpd[best], axis=0)
+    n_obs = len(elpd)
+    return pd.DataFrame({
+        'model': totals.index,
+        'elpd_loo': totals.to_numpy(),
+        'looic': -2 * totals.to_numpy(),
+        'se_looic': [2 * np.sqrt(n_obs) * elpd[name].std() for name in totals.index],
+        'elpd_diff': differences[totals.index].sum().to_numpy(),
+        'se_diff': [np.sqrt(n_obs) * differences[name].std() for name in totals.index],
+        'max_pareto_k': [pointwise[name]['pareto_k'].max() for name in totals.index]
+    })
+
+
+def pointwise_log_lik(draws, trials, model='4par', per_trial=False, memory_mb=256, out=None):
+    """Pointwise log-likelihood matrix for posterior draws of a trial model.
+
+    `draws` has shape (n_draws, n_subjects, n_params) for a model from
+    bandit_models.MODELS. Draws are scored in chunks that fit the memory
+    budget and written into `out` (optional, e.g. a np.lib.format.open_memmap
+    array). Observations are subjects, or with `per_trial` every real trial
+    in subject-major order.
+    """
+    with stage('pointwise_log_lik', rows=draws.shape[0] * draws.shape[1], model=get_model(model).name):
+        model = get_model(model)
+        n_draws, n_subjects, _ = draws.shape
+        n_trials = trials.mask.shape[1]
+        valid = trials.mask.ravel()
+        n_obs = int(valid.sum()) if per_trial else n_subjects
+        if out is None:
+            out = np.empty((n_draws, n_obs))
+
+        # The batched recursion keeps a few (chunk x subjects x arms) state arrays
+        # and, per trial, a (chunk x subjects x trials) output
+        per_draw = 8 * n_subjects * (16 + (n_trials if per_trial else 1))
+        chunk = max(1, int(memory_mb * 2 ** 20 / per_draw))
+        for start in range(0, n_draws, chunk):
+            stop = min(start + chunk, n_draws)
+            values = model.log_likelihood(draws[start:stop], trials, pointwise=per_trial)
+            out[start:stop] = values.reshape(stop - start, -1)[:, valid] if per_trial else values
+        return out
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='PSIS-LOO comparison of models from pointwise log-likelihoods.')
+    parser.add_argument('models', nargs='+', help='name=path pairs; each .npy holds a draws x observations matrix')
+    parser.add_argument('--output', default='looic_values.csv')
+    parser.add_argument('--memory-mb', type=int, default=256)
+    args = parser.parse_args()
+
+    model_pointwise = {}
+    for spec in args.models:
+        model_name, path = spec.split('=', 1)
+        model_summary, model_pointwise[model_name] = psis_loo(np.load(path, mmap_mode='r'), memory_mb=args.memory_mb)
+        print(f"{model_name}: LOOIC {model_summary['looic']:.3f} (SE {model_summary['se_looic']:.3f}), "
+              f"{model_summary['n_k_high']} of {model_summary['n_obs']} Pareto k > {model_summary['k_threshold']:.2f}")
+    comparison = compare_models(model_pointwise)
+    comparison.to_csv(args.output, index=False)
+    print(f"Model comparison saved to: {os.path.abspath(args.output)}")
@@ -1,7 +1,8 @@
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
-from scipy.stats import pearsonr
+from correlation_engine import correlation_table
+from profiling import stage
 import numpy as np
 
 # Load the data
@@ -27,10 +28,14 @@ y_labels = {
     'P': 'Punishment Sensitivity'
 }
 
+# Calculate every questionnaire vs model parameter correlation at once
+correlations = correlation_table(filtered_data[['dars_score', 'shaps_score']], filtered_data[['Arew', 'Apun', 'R', 'P']],
+                                 n_permutations=0).set_index(['x', 'y'])
+
 # Function to create scatter plots with r and p value annotations
 def plot_correlation(score, model, ax):
-    # Calculate correlation coefficient and p-value
-    r, p_val = pearsonr(filtered_data[score], filtered_data[model])
+    # Look up correlation coefficient and p-value
+    r, p_val = correlations.loc[(score, model), ['r', 'p']]
     
     # Plot using circles as markers
     sns.scatterplot(
@@ -64,17 +69,18 @@ fig, axes = plt.subplots(2, 4, figsize=(20, 10))
 model_params = ['Arew', 'Apun', 'R', 'P']
 
 # Loop through model parameters and x-variables
-for i, model in enumerate(model_params):
-    for j, score in enumerate(['dars_score', 'shaps_score']):
-        ax = axes[j, i]  # Select the appropriate subplot
-        plot_correlation(score, model, ax)
+with stage('render', rows=len(model_params) * 2):
+    for i, model in enumerate(model_params):
+        for j, score in enumerate(['dars_score', 'shaps_score']):
+            ax = axes[j, i]  # Select the appropriate subplot
+            plot_correlation(score, model, ax)
 
-# Adjust layout for the plots
-plt.tight_layout()
+    # Adjust layout for the plots
+    plt.tight_layout()
 
-# Save the final plot with 4x4 subplots
-subplot_path_final = '/mnt/data/subplots_4x4_final_update.png'
-fig.savefig(subplot_path_final, bbox_inches='tight')
+    # Save the final plot with 4x4 subplots
+    subplot_path_final = '/mnt/data/subplots_4x4_final_update.png'
+    fig.savefig(subplot_path_final, bbox_inches='tight')
 
 # Show the file path for download
 subplot_path_final
@@ -0,0 +1,114 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from bandit_model import TrialArrays
+from bandit_models import MODELS, get_model
+from fit_bandit import fit_raw
+from profiling import stage
+from schedules import load_master_schedule
+from simulate_bandit import simulate_choices
+
+# End-to-end parameter recovery for banditNarm_4par (or any model in bandit_models.MODELS):
+# draw ground-truth parameters from the fitted group distribution, simulate the
+# 3-armed task, refit in parallel and score how well each parameter comes back
+# (Pearson r, bias and RMSE between true and recovered values). The loop runs
+# over a grid of cohort sizes and trial counts, and the wall time, CPU time and
+# peak resident memory of every stage (profiling.stage; for the fit stage the
+# parent and its fitting workers together) are recorded next to the recovery
+# results, so speed and recovery quality can be tracked together as the
+# dataset grows.
+
+
+def group_distribution(parameter_tables, model='4par'):
+    """Mean and covariance of the fitted parameters on the unconstrained scale."""
+    model = get_model(model)
+    fitted = pd.concat(parameter_tables, ignore_index=True)
+    raw = model.to_raw(fitted[model.parameters].to_numpy(dtype=float))
+    return raw.mean(axis=0), np.cov(raw, rowvar=False)
+
+
+def draw_parameters(mean, cov, n_subjects, rng, model='4par'):
+    """Ground-truth parameters (e.g. Arew, Apun, R, P) for `n_subjects` simulated participants."""
+    return get_model(model).to_constrained(rng.multivariate_normal(mean, cov, size=n_subjects))
+
+
+def recovery_statistics(true, recovered, parameters=MODELS['4par'].parameters):
+    """Per-parameter Pearson r, bias and RMSE of recovered vs true values."""
+    error = recovered - true
+    rows = []
+    for k, param in enumerate(parameters):
+        rows.append({
+            'parameter': param,
+            'r': np.corrcoef(true[:, k], recovered[:, k])[0, 1],
+            'bias': error[:, k].mean(),
+            'rmse': np.sqrt((error[:, k] ** 2).mean())
+        })
+    return pd.DataFrame(rows)
+
+
+def run_recovery(mean, cov, money_prob, pain_prob, cohort_sizes=(50, 100, 200), trial_counts=(100, 200),
+                 n_starts=5, n_jobs=None, seed=1234, model='4par'):
+    """Simulate -> refit -> correlate for every cohort size x trial count.
+
+    Schedules shorter than a requested trial count are repeated. Returns
+    (recovery table, stage timing table).
+    """
+    model = get_model(model)
+    rng = np.random.default_rng(seed)
+    results, timings = [], []
+
+    for n_subjects in cohort_sizes:
+        for n_trials in trial_counts:
+            labels = {'n_subjects': n_subjects, 'n_trials': n_trials}
+            trial_index = np.arange(n_trials) % money_prob.shape[1]
+
+            with stage('draw', trace=timings, **labels):
+                true = draw_parameters(mean, cov, n_subjects, rng, model)
+
+            with stage('simulate', trace=timings, **labels):
+                choice, gain, loss = simulate_choices(true, money_prob[:, trial_index], pain_prob[:, trial_index],
+                                                      n_replicates=1, rng=rng, model=model)
+                trials = TrialArrays(np.arange(n_subjects), choice[0].astype(np.int64), gain[0].astype(float),
+                                     loss[0].astype(float), np.ones((n_subjects, n_trials), dtype=bool))
+
+            # Fitting runs in worker processes, so their memory counts towards the peak
+            with stage('fit', trace=timings, include_children=True, **labels):
+                raw, _ = fit_raw(trials, n_starts=n_starts, n_jobs=n_jobs, seed=rng.integers(2 ** 31),
+                                 model=model.name)
+
+            with stage('score', trace=timings, **labels):
+                scores = recovery_statistics(true, model.to_constrained(raw), model.parameters)
+            results.append(scores.assign(**labels))
+
+    columns = ['n_subjects', 'n_trials']
+    recovery = pd.concat(results, ignore_index=True)
+    recovery = recovery[columns + [c for c in recovery.columns if c not in columns]]
+    timings = pd.DataFrame(timings)[columns + ['stage', 'wall_s', 'cpu_s', 'peak_rss_mb']]
+    return recovery, timings
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Parameter recovery benchmark for a bandit model.')
+    parser.add_argument('schedule', help='master_prob_new.mat')
+    parser.add_argument('parameters', nargs='+', help='fitted parameter tables, e.g. anhedonic_modelparameters.csv')
+    parser.add_argument('--model', default='4par', choices=list(MODELS))
+    parser.add_argument('--subjects', type=int, nargs='+', default=[50, 100, 200])
+    parser.add_argument('--trials', type=int, nargs='+', default=[100, 200])
+    parser.add_argument('--starts', type=int, default=5)
+    parser.add_argument('--jobs', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--output', default='parameter_recovery')
+    args = parser.parse_args()
+
+    group_mean, group_cov = group_distribution([pd.read_csv(p) for p in args.parameters], args.model)
+    master_money_prob, master_pain_prob = load_master_schedule(args.schedule)
+    recovery, timings = run_recovery(group_mean, group_cov, master_money_prob, master_pain_prob,
+                                     cohort_sizes=args.subjects, trial_counts=args.trials,
+                                     n_starts=args.starts, n_jobs=args.jobs, seed=args.seed, model=args.model)
+
+    recovery.to_csv(f'{args.output}_results.csv', index=False)
+    timings.to_csv(f'{args.output}_timings.csv', index=False)
+    print(recovery.to_string(index=False))
+    print(timings.to_string(index=False))
@@ -0,0 +1,297 @@
+import argparse
+import hashlib
+import inspect
+import json
+import os
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import pandas as pd
+
+from bandit_models import get_model
+from profiling import TRACE, stage
+from render_figures import REPO_DIR, _local_imports
+from trial_cache import file_hash
+
+# Content-hash cached runner for the analysis pipeline:
+#
+#   task export --clean--> <group>_cleaned_data.csv --fit--> <group>_modelparameters.csv
+#   questionnaire exports --score--> all_questionnaire_scores.csv
+#   parameters + scores --organize--> organized_data.csv --correlate--> questionnaire_correlations.csv
+#   cleaned data + parameters --compare--> group_comparison.csv
+#
+# Every step declares its input and output files. A step is stale when the
+# fingerprint of its code (its run function, its module and the repo modules
+# that imports), its settings and the content of its inputs differs from the
+# one recorded after its last successful run, or when an output is missing.
+# Stale steps whose upstream steps are finished run in a process pool, so
+# independent branches (the two group fits, questionnaire scoring) run side by
+# side. Because inputs are compared by content, a step that rewrites an
+# identical file does not invalidate anything downstream; a questionnaire-only
+# change therefore reruns scoring, organize and correlate but not cleaning or
+# fitting.
+
+PIPELINE_VERSION = 1
+MANIFEST_NAME = 'pipeline_manifest.json'
+ID_COLUMN = 'Participant.Public.ID'
+GROUPS = ['Anhedonic', 'Non-Anhedonic']
+
+
+def _group_name(group):
+    return group.lower().replace('-', '_')
+
+
+def run_clean(inputs, outputs, settings):
+    from clean_trials import clean_export, make_names
+    groups = pd.read_csv(inputs['groups'])
+    groups.columns = make_names(groups.columns)
+    group_map = groups.set_index(ID_COLUMN)[settings['group_column']]
+    # Files from an earlier run must not survive for a group that is now empty
+    for path in outputs.values():
+        if os.path.exists(path):
+            os.remove(path)
+    clean_export(inputs['export'], settings['output_dir'], groups=group_map)
+
+
+def run_fit(inputs, outputs, settings):
+    from fit_bandit import fit_subjects, write_individual_parameters
+    fitted = fit_subjects(pd.read_csv(inputs['data']), model=settings['model'], n_starts=settings['starts'],
+                          n_jobs=settings['fit_jobs'], seed=settings['seed'])
+    write_individual_parameters(fitted, outputs['parameters'])
+
+
+def run_score(inputs, outputs, settings):
+    from questionnaire_scoring import score_questionnaires
+    scores = score_questionnaires({name: pd.read_csv(path) for name, path in inputs.items()},
+                                  dars_subscales=True)
+    scores.index = scores.index + 1
+    scores.to_csv(outputs['scores'])
+
+
+def run_organize(inputs, outputs, settings):
+    tables = []
+    for group in settings['groups']:
+        parameters = pd.read_csv(inputs[group], index_col=0).rename(columns={'subjID': ID_COLUMN})
+        parameters.insert(1, 'Group', group)
+        tables.append(parameters)
+    scores = pd.read_csv(inputs['scores'], index_col=0)
+    organized = pd.concat(tables, ignore_index=True).merge(scores, on=ID_COLUMN, how='left')
+    organized.to_csv(outputs['organized'], index=False)
+
+
+def run_correlate(inputs, outputs, settings):
+    from correlation_engine import correlation_table
+    organized = pd.read_csv(inputs['organized'])
+    questionnaires = [c for c in organized.columns if c.endswith('_score') or c in settings['subscales']]
+    table = correlation_table(organized[questionnaires], organized[settings['parameters']],
+                              n_permutations=settings['permutations'], seed=settings['seed'])
+    table.to_csv(outputs['correlations'], index=False)
+
+
+def run_compare(inputs, outputs, settings):
+    from resampling import compare_groups, participant_metrics
+    first, second = settings['groups']
+    metrics = [participant_metrics(pd.read_csv(inputs[f'{group}_data']),
+                                   pd.read_csv(inputs[f'{group}_parameters'], index_col=0))
+               for group in (first, second)]
+    table = compare_groups(*metrics, n_permutations=settings['permutations'],
+                           n_bootstrap=settings['permutations'], seed=settings['seed'])
+    table.to_csv(outputs['comparison'], index=False)
+
+
+def build_steps(config):
+    """Step table for a config with the source paths and run settings.
+
+    `config` needs 'export' (raw task export), 'groups' (table with the
+    participant IDs and a Group column), 'questionnaires' (instrument name ->
+    export path) and 'output_dir'. Each step is a dict with a name, the
+    function to run, the module that implements it, named input and output
+    paths and the settings that enter its fingerprint.
+    """
+    out = config['output_dir']
+    groups = config.get('group_names', GROUPS)
+    seed = config.get('seed', 1234)
+    permutations = config.get('permutations', 5000)
+    cleaned = {group: os.path.join(out, f'{_group_name(group)}_cleaned_data.csv') for group in groups}
+    parameters = {group: os.path.join(out, f'{_group_name(group)}_modelparameters.csv') for group in groups}
+    scores = os.path.join(out, 'all_questionnaire_scores.csv')
+    organized = os.path.join(out, 'organized_data.csv')
+
+    steps = [{
+        'name': 'clean', 'function': run_clean, 'module': 'clean_trials',
+        'inputs': {'export': config['export'], 'groups': config['groups']},
+        'outputs': cleaned,
+        'settings': {'output_dir': out, 'group_column': config.get('group_column', 'Group')}
+    }, {
+        'name': 'score', 'function': run_score, 'module': 'questionnaire_scoring',
+        'inputs': dict(config['questionnaires']),
+        'outputs': {'scores': scores},
+        'settings': {}
+    }]
+    for group in groups:
+        steps.append({
+            'name': f'fit_{_group_name(group)}', 'function': run_fit, 'module': 'fit_bandit',
+            'inputs': {'data': cleaned[group]},
+            'outputs': {'parameters': parameters[group]},
+            'settings': {'model': config.get('model', '4par'), 'starts': config.get('starts', 5),
+                         'fit_jobs': config.get('fit_jobs', 1), 'seed': seed}
+        })
+    steps += [{
+        'name': 'organize', 'function': run_organize, 'module': None,
+        'inputs': {**parameters, 'scores': scores},
+        'outputs': {'organized': organized},
+        'settings': {'groups': groups}
+    }, {
+        'name': 'correlate', 'function': run_correlate, 'module': 'correlation_engine',
+        'inputs': {'organized': organized},
+        'outputs': {'correlations': os.path.join(out, 'questionnaire_correlations.csv')},
+        'settings': {'permutations': permutations, 'seed': seed,
+                     'parameters': get_model(config.get('model', '4par')).parameters,
+                     'subscales': ['Hobbies', 'Food_Drink', 'Social_Interaction', 'Sensory_Experiences']}
+    }, {
+        'name': 'compare', 'function': run_compare, 'module': 'resampling',
+        'inputs': {**{f'{g}_data': cleaned[g] for g in groups[:2]},
+                   **{f'{g}_parameters': parameters[g] for g in groups[:2]}},
+        'outputs': {'comparison': os.path.join(out, 'group_comparison.csv')},
+        'settings': {'groups': groups[:2], 'permutations': permutations, 'seed': seed}
+    }]
+    return steps
+
+
+def fingerprint(step):
+    """Content hash of a step's code, settings and input files."""
+    digest = hashlib.sha256()
+    digest.update(f"{PIPELINE_VERSION}|{step['name']}|{json.dumps(step['settings'], sort_keys=True)}".encode())
+    digest.update(inspect.getsource(step['function']).encode())
+    code = []
+    if step['module']:
+        module_path = os.path.join(REPO_DIR, f"{step['module']}.py")
+        code += [module_path] + [os.path.join(REPO_DIR, f'{m}.py') for m in _local_imports(module_path)]
+    for path in sorted(set(code)):
+        digest.update(f'|{os.path.basename(path)}:{file_hash(path)}'.encode())
+    for name, path in sorted(step['inputs'].items()):
+        digest.update(f'|{name}:{file_hash(path)}'.encode())
+    return digest.hexdigest()
+
+
+def _run_step(name, function, inputs, outputs, settings):
+    # Also returns the profiling records of the step, which are made in the
+    # worker process, so the parent can add them to its own trace
+    start, first = time.perf_counter(), len(TRACE)
+    try:
+        with stage(name):
+            function(inputs, outputs, settings)
+        missing = [path for path in outputs.values() if not os.path.exists(path)]
+        if missing:
+            return f'output not written: {missing[0]}', time.perf_counter() - start, TRACE[first:]
+        return None, time.perf_counter() - start, TRACE[first:]
+    except Exception:
+        return traceback.format_exc(), time.perf_counter() - start, TRACE[first:]
+
+
+def run_pipeline(steps, manifest_path, n_jobs=None, force=(), dry_run=False):
+    """Run the stale steps of `steps` in dependency order, in parallel where possible.
+
+    `force` names steps to rerun regardless of their fingerprint. With
+    `dry_run` nothing is executed and the steps that would run are reported
+    (downstream steps are assumed to go stale with them). Returns one status
+    row per step: 'cached', 'ran', 'failed', 'blocked' or 'stale' (dry run).
+    """
+    producers = {path: step['name'] for step in steps for path in step['outputs'].values()}
+    upstream = {step['name']: {producers[p] for p in step['inputs'].values() if p in producers} for step in steps}
+    by_name = {step['name']: step for step in steps}
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+
+    status, done, failed, changed = {}, set(), set(), set()
+    pending = [step['name'] for step in steps]
+    running = {}
+
+    def save_manifest():
+        tmp = f'{manifest_path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(tmp, manifest_path)
+
+    with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+        while pending or running:
+            for name in list(pending):
+                if upstream[name] & failed:
+                    pending.remove(name)
+                    failed.add(name)
+                    status[name] = {'step': name, 'status': 'blocked', 'seconds': 0.0}
+                    continue
+                if not upstream[name] <= done:
+                    continue
+                pending.remove(name)
+                step = by_name[name]
+                if dry_run and upstream[name] & changed:
+                    done.add(name)
+                    changed.add(name)
+                    status[name] = {'step': name, 'status': 'stale', 'seconds': 0.0}
+                    continue
+                missing = [p for p in step['inputs'].values() if not os.path.exists(p)]
+                if missing:
+                    failed.add(name)
+                    status[name] = {'step': name, 'status': 'failed', 'seconds': 0.0,
+                                    'error': f'missing input {missing[0]}'}
+                    continue
+
+                key = fingerprint(step)
+                current = (manifest.get(name) == key
+                           and all(os.path.exists(p) for p in step['outputs'].values()))
+                if current and name not in force:
+                    done.add(name)
+                    status[name] = {'step': name, 'status': 'cached', 'seconds': 0.0}
+                elif dry_run:
+                    done.add(name)
+                    changed.add(name)
+                    status[name] = {'step': name, 'status': 'stale', 'seconds': 0.0}
+                else:
+                    job = pool.submit(_run_step, name, step['function'], step['inputs'], step['outputs'],
+                                      step['settings'])
+                    running[job] = (name, key)
+
+            if not running:
+                continue
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for job in finished:
+                name, key = running.pop(job)
+                error, seconds, records = job.result()
+                TRACE.extend(records)
+                if error is None:
+                    done.add(name)
+                    manifest[name] = key
+                    status[name] = {'step': name, 'status': 'ran', 'seconds': seconds}
+                else:
+                    failed.add(name)
+                    manifest.pop(name, None)
+                    status[name] = {'step': name, 'status': 'failed', 'seconds': seconds,
+                                    'error': error.strip().splitlines()[-1]}
+                if not dry_run:
+                    save_manifest()
+
+    return [status[step['name']] for step in steps]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the stale steps of the analysis pipeline.')
+    parser.add_argument('config', help='JSON file with export, groups, questionnaires and output_dir')
+    parser.add_argument('--jobs', type=int, default=None, help='steps run at the same time')
+    parser.add_argument('--force', nargs='+', default=[], help='rerun these steps even if up to date')
+    parser.add_argument('--dry-run', action='store_true', help='only report which steps are stale')
+    args = parser.parse_args()
+
+    with open(args.config) as f:
+        pipeline_config = json.load(f)
+    os.makedirs(pipeline_config['output_dir'], exist_ok=True)
+    pipeline_steps = build_steps(pipeline_config)
+    rows = run_pipeline(pipeline_steps, os.path.join(pipeline_config['output_dir'], MANIFEST_NAME),
+                        n_jobs=args.jobs, force=set(args.force), dry_run=args.dry_run)
+    for row in rows:
+        line = f"{row['status']:>8}  {row['step']}  ({row['seconds']:.1f} s)"
+        print(line + (f"  {row['error']}" if 'error' in row else ''))
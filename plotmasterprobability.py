@@ -1,13 +1,9 @@
-import scipy.io
 import matplotlib.pyplot as plt
+from schedules import load_master_schedule
 
-# Load the .mat file
+# Load the 'master_money_prob' and 'master_pain_prob' data from the .mat file
 file_path = '/mnt/data/master_prob_new.mat'
-mat_data = scipy.io.loadmat(file_path)
-
-# Extract the 'master_money_prob' and 'master_pain_prob' data
-master_money_prob = mat_data['master_money_prob']
-master_pain_prob = mat_data['master_pain_prob']
+master_money_prob, master_pain_prob = load_master_schedule(file_path)
 
 # Define standard green and red base colors for win and loss
 standard_green = (0/255, 128/255, 0/255)  # Standard green base
@@ -0,0 +1,126 @@
+import argparse
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from bandit_models import MODELS, get_model
+from profiling import stage
+from schedules import load_master_schedule
+
+# Posterior predictive checks without inc_postpred.
+#
+# Instead of storing Stan's y_pred (draws x subjects x trials) inside the fit
+# object, every posterior draw of every subject plays the task schedule
+# (master_prob_new.mat) through the batched simulator, a chunk of draws at a
+# time, and each chunk is immediately reduced to the statistics the plots
+# use: per-trial choice proportions, win-stay / lose-shift rates per draw and
+# subject, and per-trial accuracy (choosing the arm with the highest
+# money_prob - pain_prob on that trial). Memory is bounded by the chunk size,
+# not by the number of draws. Chunks can run in a process pool; each has its
+# own seed, so results do not depend on the number of workers.
+
+PosteriorPredictive = namedtuple('PosteriorPredictive', ['choice_proportions', 'accuracy', 'win_stay', 'lose_shift'])
+
+
+def best_arms(money_prob, pain_prob):
+    """Index of the arm with the highest expected money_prob - pain_prob on each trial."""
+    return np.argmax(np.asarray(money_prob) - np.asarray(pain_prob), axis=0)
+
+
+def wsls_rates(choice, gain, loss, lose_value=-1):
+    """Win-stay and lose-shift percentages over the last axis of (..., n_trials)
+    arrays, with the same definitions as wsls.compute_wsls."""
+    win = (gain == 1) & (loss == 0)
+    lose = (gain == 0) & (loss == lose_value)
+    stay = choice[..., 1:] == choice[..., :-1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        win_stay = 100 * (win[..., :-1] & stay).sum(axis=-1) / win.sum(axis=-1)
+        lose_shift = 100 * (lose[..., :-1] & ~stay).sum(axis=-1) / lose.sum(axis=-1)
+    return win_stay, lose_shift
+
+
+def _predictive_chunk(draws, money_prob, pain_prob, n_trials, model, seed):
+    choice, gain, loss = get_model(model).simulate(draws, money_prob, pain_prob, n_trials=n_trials,
+                                                   rng=np.random.default_rng(seed))
+    n_arms = money_prob.shape[0]
+    best = best_arms(money_prob, pain_prob)[:choice.shape[-1]]
+    # Summed over the draws of the chunk: (subjects, trials, arms) and (subjects, trials)
+    choice_counts = np.stack([(choice == arm).sum(axis=0) for arm in range(n_arms)], axis=-1)
+    correct = (choice == best).sum(axis=0)
+    win_stay, lose_shift = wsls_rates(choice, gain, loss)
+    return choice_counts, correct, win_stay, lose_shift
+
+
+def posterior_predictive(draws, money_prob, pain_prob, model='4par', chunk_draws=100, n_trials=None,
+                         n_jobs=1, seed=1234):
+    """Posterior predictive summaries for per-subject posterior draws.
+
+    `draws` has shape (n_draws, n_subjects, n_params), e.g. Arew, Apun, R, P
+    for each subject. Returns a PosteriorPredictive with choice proportions
+    (n_subjects, n_trials, n_arms) and accuracy (n_subjects, n_trials), both
+    averaged over draws, and win-stay / lose-shift percentages per draw and
+    subject (n_draws, n_subjects).
+    """
+    with stage('posterior_predictive', rows=draws.shape[0] * draws.shape[1], model=get_model(model).name):
+        n_draws = draws.shape[0]
+        starts = range(0, n_draws, chunk_draws)
+        seeds = np.random.SeedSequence(seed).spawn(len(starts))
+        jobs = [(np.asarray(draws[start:start + chunk_draws], dtype=float), money_prob, pain_prob, n_trials, model, s)
+                for start, s in zip(starts, seeds)]
+
+        if n_jobs == 1:
+            results = [_predictive_chunk(*job) for job in jobs]
+        else:
+            with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+                results = list(pool.map(_predictive_chunk, *zip(*jobs)))
+
+        return PosteriorPredictive(
+            sum(r[0] for r in results) / n_draws,
+            sum(r[1] for r in results) / n_draws,
+            np.concatenate([r[2] for r in results]),
+            np.concatenate([r[3] for r in results])
+        )
+
+
+def summary_tables(predictive, subjects):
+    """Long-format tables for plotting: per-trial choice proportions and
+    accuracy averaged over subjects, and per-subject WSLS posterior means
+    with 95% intervals."""
+    n_subjects, n_trials, n_arms = predictive.choice_proportions.shape
+    per_trial = pd.DataFrame({'trial': np.arange(1, n_trials + 1),
+                              'accuracy': predictive.accuracy.mean(axis=0)})
+    for arm in range(n_arms):
+        per_trial[f'choice_{arm + 1}'] = predictive.choice_proportions[:, :, arm].mean(axis=0)
+
+    per_subject = pd.DataFrame({'subjID': subjects, 'accuracy': predictive.accuracy.mean(axis=1)})
+    for name in ('win_stay', 'lose_shift'):
+        values = getattr(predictive, name)
+        per_subject[f'{name}_percentage'] = np.nanmean(values, axis=0)
+        per_subject[f'{name}_low'] = np.nanquantile(values, 0.025, axis=0)
+        per_subject[f'{name}_high'] = np.nanquantile(values, 0.975, axis=0)
+    return per_trial, per_subject
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Posterior predictive summaries from posterior draws.')
+    parser.add_argument('draws', help='.npy array of posterior draws, n_draws x n_subjects x n_params')
+    parser.add_argument('subjects', help='CSV with a subjID column in the same subject order as the draws')
+    parser.add_argument('schedule', help='master_prob_new.mat')
+    parser.add_argument('--model', default='4par', choices=list(MODELS))
+    parser.add_argument('--chunk', type=int, default=100, help='draws simulated at once')
+    parser.add_argument('--trials', type=int, default=None, help='trials per simulation (default: whole schedule)')
+    parser.add_argument('--jobs', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--output', default='posterior_predictive')
+    args = parser.parse_args()
+
+    master_money_prob, master_pain_prob = load_master_schedule(args.schedule)
+    result = posterior_predictive(np.load(args.draws, mmap_mode='r'), master_money_prob, master_pain_prob,
+                                  model=args.model, chunk_draws=args.chunk, n_trials=args.trials,
+                                  n_jobs=args.jobs, seed=args.seed)
+    trial_table, subject_table = summary_tables(result, pd.read_csv(args.subjects)['subjID'].to_numpy())
+    trial_table.to_csv(f'{args.output}_trials.csv', index=False)
+    subject_table.to_csv(f'{args.output}_subjects.csv', index=False)
+    print(f"Posterior predictive summaries saved to: {args.output}_trials.csv, {args.output}_subjects.csv")
@@ -1,7 +1,7 @@
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
-from scipy import stats
+from correlation_engine import correlation_matrix
 
 # Load the dataset from the file
 data_path = 'path_to_your_file.csv'
@@ -31,6 +31,10 @@ pairs = [
     ('shaps_score', 'zung_score')
 ]
 
+# Calculate all questionnaire correlations at once
+questionnaire_columns = list(questionnaire_short_names)
+r_matrix, _ = correlation_matrix(cleaned_data[questionnaire_columns], cleaned_data[questionnaire_columns])
+
 # Create a figure with 2 columns and 3 rows
 fig, axes = plt.subplots(3, 2, figsize=(15, 15))
 
@@ -43,8 +47,8 @@ for idx, (x_var, y_var) in enumerate(pairs):
                 scatter_kws={'s': 50, 'color': 'teal', 'alpha': 0.6}, 
                 line_kws={"color": "salmon"}, marker='o', ci=95)
     
-    # Compute correlation
-    r_value, _ = stats.pearsonr(cleaned_data[x_var], cleaned_data[y_var])
+    # Look up correlation
+    r_value = r_matrix[questionnaire_columns.index(x_var), questionnaire_columns.index(y_var)]
     
     # Set axis labels with short forms
     axes[idx].set_xlabel(questionnaire_short_names[x_var], fontsize=12)
@@ -0,0 +1,200 @@
+import atexit
+import json
+import os
+import resource
+import sys
+import threading
+import time
+
+# Stage-level instrumentation for the analysis scripts and engines.
+#
+# Importing this module has a side effect: if sys.argv holds --profile or
+# --profile=<path>, that argument is removed from sys.argv and profiling is
+# switched on (as it is when ANALYSIS_PROFILE is set). This is what lets the
+# plain plotting scripts and the argparse CLIs take the flag without declaring
+# it; code that inspects sys.argv itself will not see it once any analysis
+# module has been imported.
+#
+#   with stage('wsls', rows=len(data)):
+#       ...
+#
+# records the wall time, CPU time (this process and finished child
+# processes), peak resident memory and row count of every named stage into an
+# in-memory trace. Nested stages are recorded with their parent path
+# ('fit/laplace'). Reporting is opt-in: set ANALYSIS_PROFILE (to a trace file
+# path, or 1 for profile_trace.json) or pass --profile / --profile=<path> on
+# the command line (see above), and at exit the trace is written as JSON and a
+# summary table per stage is printed to stderr. Memory is sampled from a
+# background thread, which, unlike tracemalloc, does not slow the numpy-heavy
+# stages down.
+# Without profiling enabled, a stage measures nothing and records nothing
+# (unless given its own `trace` list), so stages can stay in hot loops.
+
+ENV_VARIABLE = 'ANALYSIS_PROFILE'
+DEFAULT_TRACE = 'profile_trace.json'
+
+TRACE = []
+_stack = []
+_output = None
+
+
+def _current_rss():
+    # Resident set size in bytes (Linux); elsewhere fall back to the peak so far
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _process_tree_rss():
+    # Resident set size of this process and all its live descendants (Linux,
+    # e.g. ProcessPoolExecutor workers); elsewhere only this process
+    total, pending = 0, [os.getpid()]
+    while pending:
+        pid = pending.pop()
+        try:
+            with open(f'/proc/{pid}/statm') as statm:
+                total += int(statm.read().split()[1]) * resource.getpagesize()
+            for task in os.listdir(f'/proc/{pid}/task'):
+                with open(f'/proc/{pid}/task/{task}/children') as children:
+                    pending.extend(int(child) for child in children.read().split())
+        except (OSError, ValueError):
+            continue
+    return total or _current_rss()
+
+
+def _cpu_time():
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return time.process_time() + children.ru_utime + children.ru_stime
+
+
+class stage:
+    """Context manager recording one named stage.
+
+    `rows` can also be set on the returned object inside the block, once the
+    row count is known. Extra keyword labels (e.g. n_subjects=100) are stored
+    with the record. Records go to the global TRACE when profiling is
+    enabled and, if given, to `trace`; with neither the stage is a no-op.
+    With `include_children` the peak memory is that of this process and its
+    worker processes together (each process's shared pages count once per
+    process).
+    """
+
+    def __init__(self, name, rows=None, trace=None, interval=0.01, include_children=False, **labels):
+        self.name = name
+        self.rows = rows
+        self.trace = trace
+        self.interval = interval
+        self.rss = _process_tree_rss if include_children else _current_rss
+        self.labels = labels
+
+    def _sample(self):
+        while not self.done.wait(self.interval):
+            self.peak = max(self.peak, self.rss())
+
+    def __enter__(self):
+        _stack.append(self.name)
+        self.path = '/'.join(_stack)
+        self.active = enabled() or self.trace is not None
+        if not self.active:
+            return self
+        self.peak = self.rss()
+        self.done = threading.Event()
+        self.sampler = threading.Thread(target=self._sample, daemon=True)
+        self.sampler.start()
+        self.cpu_start = _cpu_time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if not self.active:
+            _stack.pop()
+            return False
+        wall = time.perf_counter() - self.start
+        cpu = _cpu_time() - self.cpu_start
+        self.done.set()
+        self.sampler.join()
+        self.peak = max(self.peak, self.rss())
+        _stack.pop()
+
+        record = dict(self.labels, stage=self.path, wall_s=wall, cpu_s=cpu, peak_rss_mb=self.peak / 2 ** 20,
+                      rows=self.rows)
+        if enabled():
+            TRACE.append(record)
+        if self.trace is not None:
+            self.trace.append(record)
+        return False
+
+
+def summary(records=None):
+    """Per-stage totals: calls, wall and CPU seconds, peak RSS, rows and rows/s."""
+    totals = {}
+    for record in TRACE if records is None else records:
+        entry = totals.setdefault(record['stage'], {'stage': record['stage'], 'calls': 0, 'wall_s': 0.0,
+                                                    'cpu_s': 0.0, 'peak_rss_mb': 0.0, 'rows': None})
+        entry['calls'] += 1
+        entry['wall_s'] += record['wall_s']
+        entry['cpu_s'] += record['cpu_s']
+        entry['peak_rss_mb'] = max(entry['peak_rss_mb'], record['peak_rss_mb'])
+        if record['rows'] is not None:
+            entry['rows'] = (entry['rows'] or 0) + record['rows']
+    for entry in totals.values():
+        entry['rows_per_s'] = entry['rows'] / entry['wall_s'] if entry['rows'] and entry['wall_s'] > 0 else None
+    return list(totals.values())
+
+
+def format_summary(rows):
+    header = f"{'stage':<32} {'calls':>5} {'wall s':>9} {'cpu s':>9} {'peak MB':>9} {'rows':>10} {'rows/s':>11}"
+    lines = [header, '-' * len(header)]
+    for row in rows:
+        rows_text = '' if row['rows'] is None else str(row['rows'])
+        rate_text = '' if row['rows_per_s'] is None else f"{row['rows_per_s']:.0f}"
+        lines.append(f"{row['stage']:<32} {row['calls']:>5} {row['wall_s']:>9.3f} {row['cpu_s']:>9.3f} "
+                     f"{row['peak_rss_mb']:>9.1f} {rows_text:>10} {rate_text:>11}")
+    return '\n'.join(lines)
+
+
+def write_trace(path):
+    trace = {
+        'command': sys.argv,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'stages': TRACE,
+        'summary': summary()
+    }
+    with open(path, 'w') as f:
+        json.dump(trace, f, indent=1)
+
+
+def _report():
+    if TRACE:
+        write_trace(_output)
+        print(format_summary(summary()), file=sys.stderr)
+        print(f"Profile trace saved to: {_output}", file=sys.stderr)
+
+
+def enable(path=DEFAULT_TRACE):
+    """Write the trace to `path` and print the summary when the process exits."""
+    global _output
+    if _output is None:
+        atexit.register(_report)
+    _output = path
+
+
+def enabled():
+    return _output is not None
+
+
+def _configure():
+    # Runs once on import; see the module comment for the sys.argv side effect
+    for i, argument in enumerate(sys.argv[1:], start=1):
+        if argument == '--profile' or argument.startswith('--profile='):
+            del sys.argv[i]
+            enable(argument.partition('=')[2] or DEFAULT_TRACE)
+            return
+    value = os.environ.get(ENV_VARIABLE)
+    if value:
+        enable(DEFAULT_TRACE if value == '1' else value)
+
+
+_configure()
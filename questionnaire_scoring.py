@@ -0,0 +1,151 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from clean_trials import make_names
+from profiling import stage
+
+# Vectorized questionnaire scoring (Python port of preprocessing/read_questionnaires.R
+# plus the DARS subdomains from DARS_subscore.py).
+#
+# Each long-format Gorilla export (one row per participant x question) is
+# pivoted once into a participant x item matrix. The recode map, the
+# attention-check invalidation and the total / subscale sums are then all
+# array operations on that matrix, instead of one filter + group_by per
+# instrument and one isin + groupby per subdomain.
+
+ID_COLUMN = 'Participant.Public.ID'
+
+INSTRUMENTS = {
+    'dars': {
+        'recode': {1: 0, 2: 1, 3: 2, 4: 3, 5: 4},
+        'attention': None,
+        'invalid': (),
+        'exclude': ()
+    },
+    'gad': {
+        'recode': {1: 0, 2: 1, 3: 2, 4: 3},
+        'attention': 'GAD_attention',
+        'invalid': (1,),
+        'exclude': ('GAD_8',)
+    },
+    'shaps': {
+        'recode': {1: 1, 2: 1, 3: 0, 4: 0},
+        'attention': 'SHAPS_attention',
+        'invalid': (1, 2),
+        'exclude': ()
+    },
+    'zung': {
+        'recode': None,
+        'attention': 'SDS_attention',
+        'invalid': (3, 4),
+        'exclude': ()
+    }
+}
+
+DARS_SUBSCALES = {
+    'Hobbies': ['DARS-1-quantised', 'DARS-2-quantised', 'DARS-3-quantised', 'DARS-4-quantised'],
+    'Food_Drink': ['DARS-5-quantised', 'DARS-6-quantised', 'DARS-7-quantised', 'DARS-8-quantised'],
+    'Social_Interaction': ['DARS-9-quantised', 'DARS-10-quantised', 'DARS-11-quantised', 'DARS-12-quantised'],
+    'Sensory_Experiences': [
+        'DARS-13-quantised', 'DARS-14-quantised', 'DARS-15-quantised', 'DARS-16-quantised', 'DARS-17-quantised'
+    ]
+}
+
+
+def item_matrix(data, recode=None):
+    """Pivot a long export into a participant x item matrix in one pass.
+
+    Only the 'quantised' rows are used. Returns (participants, items, values,
+    present, missing): `values` holds the (recoded) responses summed per cell,
+    `present` marks answered cells and `missing` cells with an NA response.
+    """
+    data = data.copy(deep=False)
+    data.columns = make_names(data.columns)
+    data = data[data['Question.Key'].astype(str).str.contains('quantised')]
+
+    response = pd.to_numeric(data['Response'], errors='coerce')
+    if recode is not None:
+        # Values outside the map are kept as they are, like dplyr::recode
+        response = response.map(recode).fillna(response)
+
+    participant, participants = pd.factorize(data[ID_COLUMN], sort=True)
+    item, items = pd.factorize(data['Question.Key'], sort=True)
+    values = response.to_numpy(dtype=float)
+    isna = np.isnan(values)
+
+    shape = (len(participants), len(items))
+    matrix = np.zeros(shape)
+    present = np.zeros(shape, dtype=bool)
+    missing = np.zeros(shape, dtype=bool)
+    np.add.at(matrix, (participant, item), np.where(isna, 0.0, values))
+    present[participant, item] = True
+    missing[participant[isna], item[isna]] = True
+    return np.asarray(participants), np.asarray(items, dtype=str), matrix, present, missing
+
+
+def score_instrument(data, instrument, subscales=None):
+    """Score one instrument's long export.
+
+    Returns a DataFrame with Participant.Public.ID and <instrument>_score,
+    plus one column per subscale (a mapping of name -> item keys). Totals are
+    NA when an attention check failed or was answered NA, or a scored item has
+    an NA response; subscales are NA when none of their items were answered.
+    """
+    spec = INSTRUMENTS[instrument]
+    participants, items, matrix, present, missing = item_matrix(data, spec['recode'])
+
+    excluded = np.array([any(key in item for key in spec['exclude']) for item in items], dtype=bool)
+    attention = np.array([spec['attention'] is not None and spec['attention'] in item for item in items],
+                         dtype=bool)
+    scored = ~excluded & ~attention
+
+    total = matrix[:, scored].sum(axis=1)
+    total[missing[:, scored].any(axis=1)] = np.nan
+    if attention.any():
+        checks = matrix[:, attention]
+        failed = (np.isin(checks, spec['invalid']) & present[:, attention]).any(axis=1)
+        total[failed] = np.nan
+        # An NA attention response leaves the check NA in R, and so the score
+        total[missing[:, attention].any(axis=1)] = np.nan
+
+    scores = pd.DataFrame({ID_COLUMN: participants, f'{instrument}_score': total})
+    for name, keys in (subscales or {}).items():
+        columns = np.isin(items, keys)
+        subscore = matrix[:, columns].sum(axis=1)
+        subscore[~present[:, columns].any(axis=1)] = np.nan
+        scores[name] = subscore
+    return scores
+
+
+def score_questionnaires(exports, dars_subscales=False):
+    """Score every instrument and full-join them, as in all_questionnaire_scores.csv.
+
+    `exports` maps instrument name ('dars', 'gad', 'shaps', 'zung') to its
+    long-format export DataFrame.
+    """
+    with stage('questionnaires', rows=sum(len(data) for data in exports.values())):
+        tables = []
+        for instrument, data in exports.items():
+            subscales = DARS_SUBSCALES if instrument == 'dars' and dars_subscales else None
+            tables.append(score_instrument(data, instrument, subscales).set_index(ID_COLUMN))
+        scores = pd.concat(tables, axis=1, join='outer').sort_index()
+        scores.index.name = ID_COLUMN
+        return scores.reset_index()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Score the prescreening questionnaires.')
+    for name in INSTRUMENTS:
+        parser.add_argument(f'--{name}', help=f'{name} questionnaire export, e.g. {name}_questionnaire.csv')
+    parser.add_argument('--subscales', action='store_true', help='add the DARS subdomain scores')
+    parser.add_argument('--output', default='all_questionnaire_scores.csv')
+    args = parser.parse_args()
+
+    questionnaire_exports = {name: pd.read_csv(getattr(args, name)) for name in INSTRUMENTS if getattr(args, name)}
+    df = score_questionnaires(questionnaire_exports, dars_subscales=args.subscales)
+    # Same layout as write.csv in read_questionnaires.R: 1-based row names first
+    df.index = df.index + 1
+    df.to_csv(args.output)
+    print(f"Scores for {len(df)} participants saved to: {args.output}")
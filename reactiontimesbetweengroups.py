@@ -1,39 +1,32 @@
-import pandas as pd
-import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
-from scipy.stats import t
+from rt_summary import RTSummary
+from trial_cache import load_trials
 
 # Load the datasets
-data_anhedonic = pd.read_csv('/mnt/data/anhedonic_cleaned_data.csv')
-data_non_anhedonic = pd.read_csv('/mnt/data/non_anhedonic_cleaned_data.csv')
+data_anhedonic = load_trials('/mnt/data/anhedonic_cleaned_data.csv')
+data_non_anhedonic = load_trials('/mnt/data/non_anhedonic_cleaned_data.csv')
 
-# Assign group labels and combine datasets for consistency
-data_anhedonic['group'] = 'Anhedonic'
-data_non_anhedonic['group'] = 'Non-Anhedonic'
-combined_data = pd.concat([data_anhedonic, data_non_anhedonic], ignore_index=True)
+# Per-trial RT statistics of each group, built from the tables loaded above
+# on every run so the curves and the t-test always match the input files
+rt_summary = RTSummary()
+rt_summary.update(data_anhedonic, 'Anhedonic')
+rt_summary.update(data_non_anhedonic, 'Non-Anhedonic')
 
-# Check sample sizes per group for accurate t-test calculations
-n_anhedonic = data_anhedonic['Participant.Public.ID'].nunique()
-n_non_anhedonic = data_non_anhedonic['Participant.Public.ID'].nunique()
-
-# Group reaction times by trial number and compute mean and SEM
-mean_rt_anhedonic = data_anhedonic.groupby('trial_nr')['rt'].mean()
-mean_rt_non_anhedonic = data_non_anhedonic.groupby('trial_nr')['rt'].mean()
-
-anhedonic_sem = data_anhedonic.groupby('trial_nr')['rt'].sem()
-non_anhedonic_sem = data_non_anhedonic.groupby('trial_nr')['rt'].sem()
+# Trial-wise mean and SEM of reaction times for each group
+curve_anhedonic = rt_summary.curve('Anhedonic')
+curve_non_anhedonic = rt_summary.curve('Non-Anhedonic')
 
 # Convert everything to numpy arrays for plotting
-mean_rt_anhedonic_np = mean_rt_anhedonic.to_numpy()
-anhedonic_sem_np = anhedonic_sem.to_numpy()
+mean_rt_anhedonic_np = curve_anhedonic['mean'].to_numpy()
+anhedonic_sem_np = curve_anhedonic['sem'].to_numpy()
 
-mean_rt_non_anhedonic_np = mean_rt_non_anhedonic.to_numpy()
-non_anhedonic_sem_np = non_anhedonic_sem.to_numpy()
+mean_rt_non_anhedonic_np = curve_non_anhedonic['mean'].to_numpy()
+non_anhedonic_sem_np = curve_non_anhedonic['sem'].to_numpy()
 
-# Convert index (trial numbers) to numpy arrays
-anhedonic_index_np = mean_rt_anhedonic.index.to_numpy()
-non_anhedonic_index_np = mean_rt_non_anhedonic.index.to_numpy()
+# Trial numbers as numpy arrays
+anhedonic_index_np = curve_anhedonic['trial_nr'].to_numpy()
+non_anhedonic_index_np = curve_non_anhedonic['trial_nr'].to_numpy()
 
 # Create the plot with shaded SEM regions
 plt.figure(figsize=(10, 6))
@@ -62,26 +55,11 @@ plt.show()
 
 # === T-Test Calculation ===
 
-# Calculate the overall mean and standard deviation for each group
-mean_anhedonic = data_anhedonic['rt'].mean()
-std_anhedonic = data_anhedonic['rt'].std()
-
-mean_non_anhedonic = data_non_anhedonic['rt'].mean()
-std_non_anhedonic = data_non_anhedonic['rt'].std()
-
-# Calculate the combined SEM for the t-test
-sem_combined = np.sqrt((std_anhedonic**2 / n_anhedonic) + (std_non_anhedonic**2 / n_non_anhedonic))
-
-# Calculate the t-statistic
-mean_difference = mean_anhedonic - mean_non_anhedonic
-t_statistic = mean_difference / sem_combined
-
-# Calculate degrees of freedom using Welch's approximation
-df = ((std_anhedonic**2 / n_anhedonic) + (std_non_anhedonic**2 / n_non_anhedonic))**2 / \
-     (((std_anhedonic**2 / n_anhedonic)**2 / (n_anhedonic - 1)) + ((std_non_anhedonic**2 / n_non_anhedonic)**2 / (n_non_anhedonic - 1)))
-
-# Calculate the two-tailed p-value
-p_value = 2 * t.cdf(-abs(t_statistic), df)
+# Welch's t-test on the overall RT of each group, from the running summary
+welch = rt_summary.welch_test('Anhedonic', 'Non-Anhedonic')
+mean_anhedonic, std_anhedonic, n_anhedonic = welch['mean1'], welch['std1'], welch['n1']
+mean_non_anhedonic, std_non_anhedonic, n_non_anhedonic = welch['mean2'], welch['std2'], welch['n2']
+t_statistic, df, p_value = welch['t_statistic'], welch['df'], welch['p_value']
 
 # Print t-test results
 print(f"T-Test Results:")
@@ -0,0 +1,174 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import runpy
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+from profiling import stage
+from trial_cache import file_hash
+
+# Headless figure rendering for the plotting scripts.
+#
+# Every registered script is run in a worker process on the Agg backend with
+# plt.show() replaced by a function that saves the open figures to the output
+# directory (<script>_<n>.png / .svg) and closes them, so the scripts run in
+# batch without a display. A figure set is re-rendered only when the
+# fingerprint of its script, the repo modules it imports, its input files and
+# the requested formats has changed since the last successful render, so a
+# refresh with unchanged data is close to a no-op.
+
+RENDER_VERSION = 1
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Plotting scripts and the data files they read
+FIGURES = [
+    {'script': 'ttestmodelparametersbothgroups.py',
+     'inputs': ['/mnt/data/organized_data.csv']},
+    {'script': 'parameterrecoveryplotsbothgroups.py',
+     'inputs': ['/mnt/data/nonanhedonic_modelparameters.csv', '/mnt/data/simulated_modelparameters.csv',
+                '/mnt/data/anhedonic_modelparameters.csv', '/mnt/data/anhedonic_simulated_modelparameters.csv']},
+    {'script': 'reactiontimesbetweengroups.py',
+     'inputs': ['/mnt/data/anhedonic_cleaned_data.csv', '/mnt/data/non_anhedonic_cleaned_data.csv']},
+    {'script': 'DARS_subscore.py',
+     'inputs': ['/path/to/data_exp_122448-v5_questionnaire-at3h.csv', '/path/to/anhedonic_cleaned_data.csv',
+                '/path/to/non_anhedonic_cleaned_data.csv', '/path/to/organized_data.csv']},
+    {'script': 'winstayloseshiftbetweengroups.py',
+     'inputs': ['/mnt/data/anhedonic_cleaned_data.csv', '/mnt/data/non_anhedonic_cleaned_data.csv']},
+    {'script': 'winstayloseshiftbetweengroups_simulated_and_original.py',
+     'inputs': ['/path/to/anhedonic_cleaned_data.csv', '/path/to/non_anhedonic_cleaned_data.csv',
+                '/path/to/anhedonic_simulated_data_combined.csv',
+                '/path/to/non_anhedonic_simulated_data_combined.csv']},
+    {'script': 'modelparametersvsquestionnaires_subplots_4x4_final_corrected.py',
+     'inputs': ['/mnt/data/organized_data.csv']},
+    {'script': 'prescreening questionnaires correlations.py',
+     'inputs': ['path_to_your_file.csv']},
+    {'script': '3abvs4abmodelparameters.py',
+     'inputs': ['/mnt/data/4AB_vs_3AB_model_parameters.csv']},
+    {'script': 'plotmasterprobability.py',
+     'inputs': ['/mnt/data/master_prob_new.mat']},
+    {'script': 'looic_model_selection_comparison_plots.py',
+     'inputs': ['looic_values.csv']}
+]
+
+
+def _local_imports(script_path, seen=None):
+    # Repo modules a script imports, followed transitively (e.g. resampling -> wsls -> trial_store)
+    seen = set() if seen is None else seen
+    with open(script_path) as f:
+        source = f.read()
+    for name in re.findall(r'^\s*(?:from|import)\s+([A-Za-z_][A-Za-z0-9_]*)', source, re.MULTILINE):
+        module_path = os.path.join(REPO_DIR, f'{name}.py')
+        if name not in seen and os.path.exists(module_path):
+            seen.add(name)
+            _local_imports(module_path, seen)
+    return sorted(seen)
+
+
+def fingerprint(figure, formats):
+    """Content hash of a figure set's script, local modules, inputs and formats."""
+    digest = hashlib.sha256()
+    script_path = os.path.join(REPO_DIR, figure['script'])
+    digest.update(f"{RENDER_VERSION}|{','.join(formats)}".encode())
+    for path in [script_path] + [os.path.join(REPO_DIR, f'{m}.py') for m in _local_imports(script_path)]:
+        digest.update(f'|{os.path.basename(path)}:{file_hash(path)}'.encode())
+    for path in figure['inputs']:
+        digest.update(f"|{path}:{file_hash(path) if os.path.exists(path) else 'missing'}".encode())
+    return digest.hexdigest()
+
+
+def render_script(script, output_dir, formats):
+    """Run one plotting script headlessly and save every figure it shows.
+
+    Returns (script, list of written files, error text or None, seconds).
+    """
+    import matplotlib
+    matplotlib.use('Agg', force=True)
+    import matplotlib.pyplot as plt
+
+    start = time.perf_counter()
+    stem = re.sub(r'[^0-9A-Za-z_]+', '_', os.path.splitext(script)[0])
+    written = []
+
+    def save_open_figures(*args, **kwargs):
+        for number in plt.get_fignums():
+            figure = plt.figure(number)
+            for fmt in formats:
+                path = os.path.join(output_dir, f'{stem}_{len(written) // len(formats) + 1}.{fmt}')
+                figure.savefig(path, bbox_inches='tight')
+                written.append(path)
+            plt.close(figure)
+
+    plt.show = save_open_figures
+    if REPO_DIR not in sys.path:
+        sys.path.insert(0, REPO_DIR)
+
+    error = None
+    try:
+        runpy.run_path(os.path.join(REPO_DIR, script), run_name='__main__')
+        save_open_figures()
+    except BaseException:
+        error = traceback.format_exc()
+    finally:
+        plt.close('all')
+    return script, written, error, time.perf_counter() - start
+
+
+def render_all(output_dir='figures', formats=('png', 'svg'), figures=FIGURES, n_jobs=None, force=False):
+    """Render every stale figure set in parallel; returns a per-script status table."""
+    with stage('render', rows=len(figures)):
+        os.makedirs(output_dir, exist_ok=True)
+        manifest_path = os.path.join(output_dir, 'render_manifest.json')
+        try:
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            manifest = {}
+
+        status, stale = [], []
+        for figure in figures:
+            key = fingerprint(figure, formats)
+            entry = manifest.get(figure['script'])
+            if not force and entry and entry['fingerprint'] == key and all(os.path.exists(p) for p in entry['files']):
+                status.append({'script': figure['script'], 'status': 'cached', 'files': len(entry['files']),
+                               'seconds': 0.0})
+            else:
+                stale.append((figure, key))
+
+        if stale:
+            with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+                jobs = [pool.submit(render_script, figure['script'], output_dir, list(formats)) for figure, _ in stale]
+                for (figure, key), job in zip(stale, jobs):
+                    script, written, error, seconds = job.result()
+                    if error is None:
+                        manifest[script] = {'fingerprint': key, 'files': written}
+                        status.append({'script': script, 'status': 'rendered', 'files': len(written),
+                                       'seconds': seconds})
+                    else:
+                        manifest.pop(script, None)
+                        status.append({'script': script, 'status': 'failed', 'files': len(written),
+                                       'seconds': seconds, 'error': error.strip().splitlines()[-1]})
+
+        with open(manifest_path, 'w') as f:
+            json.dump(manifest, f, indent=1)
+        order = {figure['script']: i for i, figure in enumerate(figures)}
+        return sorted(status, key=lambda row: order[row['script']])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Render all figures headlessly, skipping unchanged ones.')
+    parser.add_argument('--output', default='figures')
+    parser.add_argument('--formats', nargs='+', default=['png', 'svg'])
+    parser.add_argument('--jobs', type=int, default=None)
+    parser.add_argument('--only', nargs='+', help='render only these scripts')
+    parser.add_argument('--force', action='store_true', help='re-render even if nothing changed')
+    args = parser.parse_args()
+
+    selected = [f for f in FIGURES if not args.only or f['script'] in args.only]
+    for row in render_all(args.output, args.formats, selected, n_jobs=args.jobs, force=args.force):
+        line = f"{row['status']:>8}  {row['script']}  ({row['files']} files, {row['seconds']:.1f} s)"
+        print(line + (f"  {row['error']}" if 'error' in row else ''))
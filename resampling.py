@@ -0,0 +1,135 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from profiling import stage
+from trial_store import TrialStore
+from wsls import compute_wsls
+
+# Vectorized permutation and bootstrap engine for the two-group comparisons
+# (Arew, Apun, R, P, win-stay %, lose-shift %, mean RT, ...).
+#
+# All metrics are resampled at once. A chunk of permutations is a boolean
+# (n_permutations x n_participants) label matrix and a chunk of bootstrap
+# resamples a pair of multinomial count matrices, so the group sums, counts
+# and sums of squares for every resample and every metric come out of a few
+# matrix products. Chunks are sized to a memory budget and can be spread over
+# a process pool; every chunk has its own seed, so results do not depend on
+# the number of workers. Missing values (NaN) are dropped per metric.
+
+
+def _masked(values):
+    values = np.asarray(values, dtype=float)
+    present = ~np.isnan(values)
+    return np.where(present, values, 0.0), present.astype(float)
+
+
+def _welch_t(s1, n1, q1, s2, n2, q2):
+    # Welch t statistic from per-group sums, counts and sums of squares
+    with np.errstate(divide='ignore', invalid='ignore'):
+        m1, m2 = s1 / n1, s2 / n2
+        v1 = (q1 - n1 * m1 ** 2) / (n1 - 1)
+        v2 = (q2 - n2 * m2 ** 2) / (n2 - 1)
+        return (m1 - m2) / np.sqrt(v1 / n1 + v2 / n2)
+
+
+def _permutation_chunk(values, present, n_first, t_observed, n_permutations, seed):
+    rng = np.random.default_rng(seed)
+    n = values.shape[0]
+    order = rng.random((n_permutations, n)).argsort(axis=1)
+    labels = np.zeros((n_permutations, n))
+    np.put_along_axis(labels, order[:, :n_first], 1.0, axis=1)
+
+    total_s, total_n, total_q = values.sum(axis=0), present.sum(axis=0), (values ** 2).sum(axis=0)
+    s1, n1, q1 = labels @ values, labels @ present, labels @ values ** 2
+    t = _welch_t(s1, n1, q1, total_s - s1, total_n - n1, total_q - q1)
+    return (np.abs(t) >= np.abs(t_observed) - 1e-12).sum(axis=0)
+
+
+def _bootstrap_chunk(values1, present1, values2, present2, n_resamples, seed):
+    rng = np.random.default_rng(seed)
+    n1, n2 = values1.shape[0], values2.shape[0]
+    weights1 = rng.multinomial(n1, np.full(n1, 1.0 / n1), size=n_resamples).astype(float)
+    weights2 = rng.multinomial(n2, np.full(n2, 1.0 / n2), size=n_resamples).astype(float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (weights1 @ values1) / (weights1 @ present1) - (weights2 @ values2) / (weights2 @ present2)
+
+
+def _chunks(total, chunk_size):
+    return [min(chunk_size, total - start) for start in range(0, total, chunk_size)]
+
+
+def compare_groups(group1, group2, n_permutations=10000, n_bootstrap=10000, ci=0.95,
+                   memory_mb=256, n_jobs=1, seed=1234):
+    """Permutation p-values and bootstrap CIs for every metric column.
+
+    `group1` and `group2` are DataFrames with one row per participant and the
+    same metric columns. Returns one row per metric with the group means,
+    their difference, the Welch t statistic, a two-sided permutation p-value
+    for t and a percentile bootstrap CI of the mean difference.
+    """
+    with stage('resampling', rows=len(group1) + len(group2)):
+        metrics = list(group1.columns)
+        values1, present1 = _masked(group1[metrics])
+        values2, present2 = _masked(group2[metrics])
+        pooled, pooled_present = np.vstack([values1, values2]), np.vstack([present1, present2])
+        n_first, n_total = len(values1), len(pooled)
+
+        t_observed = _welch_t(values1.sum(0), present1.sum(0), (values1 ** 2).sum(0),
+                              values2.sum(0), present2.sum(0), (values2 ** 2).sum(0))
+
+        # Resamples per chunk so that the (chunk x participants) matrices fit the budget
+        chunk_size = max(1, int(memory_mb * 2 ** 20 / (8 * 4 * max(n_total, len(metrics)))))
+        permutation_seeds, bootstrap_seeds = np.random.SeedSequence(seed).spawn(2)
+        permutation_jobs = [(pooled, pooled_present, n_first, t_observed, size, s)
+                            for size, s in zip(_chunks(n_permutations, chunk_size),
+                                               permutation_seeds.spawn(len(_chunks(n_permutations, chunk_size))))]
+        bootstrap_jobs = [(values1, present1, values2, present2, size, s)
+                          for size, s in zip(_chunks(n_bootstrap, chunk_size),
+                                             bootstrap_seeds.spawn(len(_chunks(n_bootstrap, chunk_size))))]
+
+        if n_jobs == 1:
+            exceed = [_permutation_chunk(*job) for job in permutation_jobs]
+            differences = [_bootstrap_chunk(*job) for job in bootstrap_jobs]
+        else:
+            with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+                exceed = list(pool.map(_permutation_chunk, *zip(*permutation_jobs))) if permutation_jobs else []
+                differences = list(pool.map(_bootstrap_chunk, *zip(*bootstrap_jobs))) if bootstrap_jobs else []
+
+        n_exceed = np.sum(exceed, axis=0) if exceed else np.zeros(len(metrics))
+        differences = np.vstack(differences) if differences else np.full((1, len(metrics)), np.nan)
+        alpha = (1 - ci) / 2
+        with np.errstate(invalid='ignore'):
+            mean1, mean2 = values1.sum(0) / present1.sum(0), values2.sum(0) / present2.sum(0)
+
+        return pd.DataFrame({
+            'metric': metrics,
+            'n_group1': present1.sum(0).astype(int),
+            'n_group2': present2.sum(0).astype(int),
+            'mean_group1': mean1,
+            'mean_group2': mean2,
+            'difference': mean1 - mean2,
+            't_statistic': t_observed,
+            'p_permutation': (n_exceed + 1) / (n_permutations + 1),
+            'ci_low': np.nanquantile(differences, alpha, axis=0),
+            'ci_high': np.nanquantile(differences, 1 - alpha, axis=0)
+        })
+
+
+def participant_metrics(data, parameters=None, id_col='Participant.Public.ID', lose_value=1):
+    """Per-participant metric table: win-stay %, lose-shift %, mean RT and, if
+    given, the fitted parameters (allIndPars table keyed by subjID, e.g. Arew, Apun, R, P)."""
+    store = data if isinstance(data, TrialStore) else TrialStore.from_frame(data, id_col=id_col, order_col=None)
+    strategies = compute_wsls(store, id_col=id_col, lose_value=lose_value)
+    rt = store.column('rt').astype(float)
+    metrics = pd.DataFrame({
+        id_col: store.subjects,
+        'win_stay_percentage': strategies['win_stay_percentage'].to_numpy(),
+        'lose_shift_percentage': strategies['lose_shift_percentage'].to_numpy(),
+        'mean_rt': np.bincount(store.codes, weights=rt, minlength=len(store)) / store.counts
+    })
+    if parameters is not None:
+        fitted = parameters.rename(columns={'subjID': id_col})
+        metrics = metrics.merge(fitted, on=id_col, how='left')
+    return metrics.set_index(id_col)
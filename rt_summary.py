@@ -0,0 +1,164 @@
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+from scipy.stats import t
+
+from profiling import stage
+
+# Incremental reaction-time summaries for reactiontimesbetweengroups.py.
+#
+# For every group x trial_nr (and for every group overall) only the running
+# count, mean and sum of squared deviations (M2) are kept. A new batch of
+# participants is summarised on its own and merged into that state with
+# Chan et al.'s parallel form of Welford's update, so ingesting a batch costs
+# time proportional to the batch, not to the whole study. The trial-wise
+# mean/SEM curves and the group Welch test are computed from the state alone.
+
+ID_COLUMN = 'Participant.Public.ID'
+
+
+def _merge(count_a, mean_a, m2_a, count_b, mean_b, m2_b):
+    count = count_a + count_b
+    with np.errstate(divide='ignore', invalid='ignore'):
+        delta = mean_b - mean_a
+        mean = np.where(count > 0, mean_a + delta * count_b / count, 0.0)
+        m2 = m2_a + m2_b + np.where(count > 0, delta ** 2 * count_a * count_b / count, 0.0)
+    return count, mean, m2
+
+
+class RTSummary:
+    """Mergeable running RT statistics per group x trial_nr."""
+
+    def __init__(self):
+        self.groups = {}
+
+    def _state(self, group):
+        return self.groups.setdefault(group, {
+            'trial_nr': np.zeros(0, dtype=np.int64),
+            'count': np.zeros(0), 'mean': np.zeros(0), 'm2': np.zeros(0),
+            'overall': np.zeros(3),
+            'participants': set()
+        })
+
+    def update(self, data, group, id_col=ID_COLUMN):
+        """Fold a batch of trials (rows with id_col, trial_nr, rt) into `group`.
+
+        Participants already in the state are skipped, so re-ingesting a file
+        does not double count. Returns the number of new participants.
+        """
+        with stage('rt_summary', rows=len(data), group=group):
+            state = self._state(group)
+            ids = data[id_col].astype(str)
+            new = ~ids.isin(state['participants'])
+            if not new.any():
+                return 0
+            ids = ids[new]
+            trial_nr = data['trial_nr'].to_numpy()[new.to_numpy()].astype(np.int64)
+            rt = data['rt'].to_numpy()[new.to_numpy()].astype(float)
+
+            # Batch statistics per trial_nr
+            trials, codes = np.unique(trial_nr, return_inverse=True)
+            count = np.bincount(codes, minlength=len(trials)).astype(float)
+            mean = np.bincount(codes, weights=rt, minlength=len(trials)) / count
+            m2 = np.bincount(codes, weights=(rt - mean[codes]) ** 2, minlength=len(trials))
+
+            # Align old and new trial numbers, then merge
+            all_trials = np.union1d(state['trial_nr'], trials)
+            aligned = []
+            for source_trials, values in ((state['trial_nr'], (state['count'], state['mean'], state['m2'])),
+                                          (trials, (count, mean, m2))):
+                position = np.searchsorted(all_trials, source_trials)
+                for value in values:
+                    full = np.zeros(len(all_trials))
+                    full[position] = value
+                    aligned.append(full)
+            state['trial_nr'] = all_trials
+            state['count'], state['mean'], state['m2'] = _merge(*aligned)
+
+            batch_mean = rt.mean()
+            batch = (float(len(rt)), batch_mean, ((rt - batch_mean) ** 2).sum())
+            state['overall'] = np.array(_merge(*state['overall'], *batch), dtype=float)
+
+            new_participants = set(ids.unique())
+            state['participants'] |= new_participants
+            return len(new_participants)
+
+    def curve(self, group):
+        """Trial-wise mean RT and SEM (ddof=1, like groupby(...).sem())."""
+        state = self.groups[group]
+        count = state['count']
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sem = np.sqrt(state['m2'] / (count - 1)) / np.sqrt(count)
+        return pd.DataFrame({'trial_nr': state['trial_nr'], 'mean': state['mean'], 'sem': sem, 'count': count})
+
+    def overall(self, group):
+        """(mean, SD, number of participants) over all trials of a group."""
+        state = self.groups[group]
+        count, mean, m2 = state['overall']
+        return mean, np.sqrt(m2 / (count - 1)), len(state['participants'])
+
+    def welch_test(self, group1, group2):
+        """Welch t-test on overall RT, as in reactiontimesbetweengroups.py
+        (trial-level SD, participant-level N)."""
+        mean1, std1, n1 = self.overall(group1)
+        mean2, std2, n2 = self.overall(group2)
+        v1, v2 = std1 ** 2 / n1, std2 ** 2 / n2
+        t_statistic = (mean1 - mean2) / np.sqrt(v1 + v2)
+        df = (v1 + v2) ** 2 / (v1 ** 2 / (n1 - 1) + v2 ** 2 / (n2 - 1))
+        return {
+            'mean1': mean1, 'std1': std1, 'n1': n1,
+            'mean2': mean2, 'std2': std2, 'n2': n2,
+            't_statistic': t_statistic, 'df': df,
+            'p_value': 2 * t.cdf(-abs(t_statistic), df)
+        }
+
+    def save(self, path):
+        groups = {}
+        for group, state in self.groups.items():
+            groups[group] = {
+                'trial_nr': state['trial_nr'].tolist(),
+                'count': state['count'].tolist(),
+                'mean': state['mean'].tolist(),
+                'm2': state['m2'].tolist(),
+                'overall': state['overall'].tolist(),
+                'participants': sorted(state['participants'])
+            }
+        tmp = f'{path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(groups, f)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        summary = cls()
+        if not os.path.exists(path):
+            return summary
+        with open(path) as f:
+            groups = json.load(f)
+        for group, state in groups.items():
+            summary.groups[group] = {
+                'trial_nr': np.array(state['trial_nr'], dtype=np.int64),
+                'count': np.array(state['count'], dtype=float),
+                'mean': np.array(state['mean'], dtype=float),
+                'm2': np.array(state['m2'], dtype=float),
+                'overall': np.array(state['overall'], dtype=float),
+                'participants': set(state['participants'])
+            }
+        return summary
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fold new participant files into the running RT summary.')
+    parser.add_argument('state', help='summary state file, e.g. rt_summary.json')
+    parser.add_argument('group', help='group name, e.g. Anhedonic')
+    parser.add_argument('files', nargs='+', help='cleaned trial files with the new participants')
+    args = parser.parse_args()
+
+    summary = RTSummary.load(args.state)
+    for path in args.files:
+        added = summary.update(pd.read_csv(path), args.group)
+        print(f"{path}: {added} new participants added to {args.group}")
+    summary.save(args.state)
@@ -0,0 +1,113 @@
+import argparse
+import hashlib
+import inspect
+import json
+import os
+
+import numpy as np
+import scipy.io
+
+# Drifting-bandit schedules: the task's master_prob_new.mat and libraries of
+# generated alternatives.
+#
+# A schedule is a pair of (n_arms, n_trials) arrays, master_money_prob and
+# master_pain_prob, giving each arm's reward and shock probability on every
+# trial. random_walk_schedules draws thousands at once as (n_schedules,
+# n_arms, n_trials) arrays: every arm's probabilities follow an independent
+# Gaussian random walk, reflected at the bounds, all walks advanced together
+# by one cumulative sum. schedule_library caches a library as .npz under a
+# name derived from its generation parameters, so asking for the same
+# library again only reads the file. Libraries feed straight into
+# simulate_bandit.simulate_choices, which plays schedule i in replicate i.
+
+SCHEDULE_VERSION = 1
+CACHE_DIR = '.schedule_cache'
+
+
+def load_master_schedule(path):
+    """Reward and punishment probabilities (n_arms, n_trials) from master_prob_new.mat."""
+    mat_data = scipy.io.loadmat(path)
+    return mat_data['master_money_prob'], mat_data['master_pain_prob']
+
+
+def save_master_schedule(path, money_prob, pain_prob):
+    """Write a schedule in the master_prob_new.mat layout."""
+    scipy.io.savemat(path, {'master_money_prob': np.asarray(money_prob, dtype=float),
+                            'master_pain_prob': np.asarray(pain_prob, dtype=float)})
+
+
+def random_walk_schedules(n_schedules, n_arms=3, n_trials=200, sd=0.05, low=0.1, high=0.9, start=(0.25, 0.75),
+                          seed=1234):
+    """Reward and punishment probabilities of `n_schedules` drifting schedules.
+
+    Each walk starts uniformly in `start`, takes N(0, sd) steps and is
+    reflected at `low` and `high`. Returns two (n_schedules, n_arms,
+    n_trials) arrays.
+    """
+    rng = np.random.default_rng(seed)
+    shape = (2, n_schedules, n_arms)
+    steps = rng.normal(0, sd, shape + (n_trials,))
+    steps[..., 0] = rng.uniform(*start, shape)
+    walks = np.cumsum(steps, axis=-1)
+    # Reflecting boundaries: fold the unbounded walk into [low, high]
+    span = high - low
+    walks = low + span - np.abs((walks - low) % (2 * span) - span)
+    return walks[0], walks[1]
+
+
+def library_path(cache_dir=CACHE_DIR, **params):
+    """Cache file of the library generated with `params`."""
+    digest = hashlib.sha256(json.dumps([SCHEDULE_VERSION, params], sort_keys=True).encode())
+    return os.path.join(cache_dir, f'schedules_{digest.hexdigest()[:16]}.npz')
+
+
+def schedule_library(n_schedules, cache_dir=CACHE_DIR, **params):
+    """random_walk_schedules(n_schedules, **params), read from the cache in
+    `cache_dir` when this library was generated before."""
+    # Defaults are filled in, so the same library always gets the same key
+    bound = inspect.signature(random_walk_schedules).bind(n_schedules, **params)
+    bound.apply_defaults()
+    params = bound.arguments
+    path = library_path(cache_dir, **params)
+    try:
+        with np.load(path) as library:
+            return library['master_money_prob'], library['master_pain_prob']
+    except (OSError, KeyError, ValueError):
+        pass
+
+    money_prob, pain_prob = random_walk_schedules(**params)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp = f'{path}.tmp.npz'
+    np.savez(tmp, master_money_prob=money_prob, master_pain_prob=pain_prob, params=json.dumps(params))
+    os.replace(tmp, path)
+    return money_prob, pain_prob
+
+
+def load_schedule(path):
+    """A master_prob_new.mat schedule (n_arms, n_trials) or a saved library
+    (n_schedules, n_arms, n_trials) from .npz."""
+    if path.endswith('.npz'):
+        with np.load(path) as library:
+            return library['master_money_prob'], library['master_pain_prob']
+    return load_master_schedule(path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate (or reuse) a library of drifting-bandit schedules.')
+    parser.add_argument('schedules', type=int, help='number of schedules')
+    parser.add_argument('--arms', type=int, default=3, help='3 for 3AB, 4 for 4AB')
+    parser.add_argument('--trials', type=int, default=200)
+    parser.add_argument('--sd', type=float, default=0.05, help='random walk step SD')
+    parser.add_argument('--bounds', type=float, nargs=2, default=[0.1, 0.9])
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--cache-dir', default=CACHE_DIR)
+    parser.add_argument('--mat', help='also write the first schedule in the master_prob_new.mat layout')
+    args = parser.parse_args()
+
+    settings = dict(n_arms=args.arms, n_trials=args.trials, sd=args.sd, low=args.bounds[0], high=args.bounds[1],
+                    seed=args.seed)
+    money, pain = schedule_library(args.schedules, cache_dir=args.cache_dir, **settings)
+    print(f"{money.shape[0]} schedules of {money.shape[1]} arms x {money.shape[2]} trials cached in: {args.cache_dir}")
+    if args.mat:
+        save_master_schedule(args.mat, money[0], pain[0])
+        print(f"First schedule saved to: {args.mat}")
@@ -0,0 +1,94 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from bandit_models import MODELS, get_model
+from schedules import load_schedule
+
+# Batched simulator for the 3-armed bandit task under banditNarm_4par or any
+# other model from bandit_models.MODELS.
+#
+# Each replicate of each subject plays the drifting schedule from
+# master_prob_new.mat: on every trial the chosen arm pays a reward with
+# probability master_money_prob[arm, t] and, independently, a shock with
+# probability master_pain_prob[arm, t]. With a schedule library from
+# schedules.py ((n_schedules, n_arms, n_trials) arrays) replicate i plays
+# schedule i instead. All subjects and replicates are
+# advanced together as (n_replicates, n_subjects) arrays. Written files use
+# the hBayesDM coding read by winstayloseshiftbetweengroups_simulated_and_original.py
+# (choice 1-3, loss = -1), and are streamed to disk one chunk of replicates at
+# a time, so the number of replicates is not limited by memory.
+
+
+def simulate_choices(params, money_prob, pain_prob, n_replicates=1, n_trials=None, rng=None, model='4par'):
+    """Simulate choices and outcomes for every subject and replicate.
+
+    `params` is an (n_subjects, n_params) array of the model's parameters
+    (Arew, Apun, R, P for banditNarm_4par), or any shape (..., n_params),
+    which then replaces the replicate dimension. `money_prob` and `pain_prob`
+    are (n_arms, n_trials), or (n_replicates, n_arms, n_trials) for one
+    schedule per replicate. Returns int8 arrays choice (0-based), gain (0/1)
+    and loss (0/-1) of shape (n_replicates, n_subjects, n_trials).
+    """
+    return get_model(model).simulate(params, money_prob, pain_prob, n_replicates=n_replicates,
+                                     n_trials=n_trials, rng=rng)
+
+
+def _to_frame(subjects, choice, gain, loss, first_replicate):
+    n_replicates, n_subjects, n_trials = choice.shape
+    return pd.DataFrame({
+        'replicate': np.repeat(np.arange(first_replicate, first_replicate + n_replicates), n_subjects * n_trials),
+        'subjID': np.tile(np.repeat(subjects, n_trials), n_replicates),
+        'trial': np.tile(np.arange(1, n_trials + 1), n_replicates * n_subjects),
+        'choice': choice.ravel() + 1,
+        'gain': gain.ravel(),
+        'loss': loss.ravel()
+    })
+
+
+def simulate_dataset(parameters, money_prob, pain_prob, path, n_replicates=1, chunk_replicates=50,
+                     n_trials=None, seed=1234, model='4par'):
+    """Simulate `n_replicates` datasets per subject and stream them to a CSV file.
+
+    `parameters` is a table with subjID and the model's parameter columns
+    (allIndPars layout, e.g. Arew, Apun, R, P). Replicates are generated and written `chunk_replicates` at a time.
+    With (n_replicates, n_arms, n_trials) schedules replicate i plays schedule i.
+    Returns the number of rows written.
+    """
+    if np.ndim(money_prob) == 3 and len(money_prob) < n_replicates:
+        raise ValueError(f"schedule library has {len(money_prob)} schedules, fewer than {n_replicates} replicates")
+    subjects = parameters['subjID'].to_numpy()
+    values = parameters[get_model(model).parameters].to_numpy(dtype=float)
+    seeds = np.random.SeedSequence(seed).spawn(-(-n_replicates // chunk_replicates))
+
+    n_rows = 0
+    for chunk, first in enumerate(range(0, n_replicates, chunk_replicates)):
+        size = min(chunk_replicates, n_replicates - first)
+        schedule = (slice(first, first + size),) if np.ndim(money_prob) == 3 else ()
+        choice, gain, loss = simulate_choices(values, money_prob[schedule], pain_prob[schedule], n_replicates=size,
+                                              n_trials=n_trials, rng=np.random.default_rng(seeds[chunk]), model=model)
+        frame = _to_frame(subjects, choice, gain, loss, first)
+        frame.to_csv(path, mode='w' if chunk == 0 else 'a', header=chunk == 0, index=False)
+        n_rows += len(frame)
+    return n_rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Simulate 3-armed bandit data from fitted parameters.')
+    parser.add_argument('parameters', help='parameter table, e.g. anhedonic_modelparameters.csv')
+    parser.add_argument('schedule', help='master_prob_new.mat, or a schedule library (.npz): one schedule per replicate')
+    parser.add_argument('output', help='output CSV, e.g. anhedonic_simulated_data_combined.csv')
+    parser.add_argument('--model', default='4par', choices=list(MODELS))
+    parser.add_argument('--replicates', type=int, default=None, help='default: 1, or one per library schedule')
+    parser.add_argument('--chunk', type=int, default=50, help='replicates held in memory at once')
+    parser.add_argument('--trials', type=int, default=None, help='trials per replicate (default: whole schedule)')
+    parser.add_argument('--seed', type=int, default=1234)
+    args = parser.parse_args()
+
+    master_money_prob, master_pain_prob = load_schedule(args.schedule)
+    replicates = args.replicates or (len(master_money_prob) if master_money_prob.ndim == 3 else 1)
+    n_rows = simulate_dataset(pd.read_csv(args.parameters), master_money_prob, master_pain_prob,
+                              args.output, n_replicates=replicates, chunk_replicates=args.chunk,
+                              n_trials=args.trials, seed=args.seed, model=args.model)
+    print(f"Simulated {n_rows} trials, saved to: {args.output}")
@@ -0,0 +1,151 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from bandit_models import MODELS, get_model
+from schedules import random_walk_schedules
+
+# Synthetic Gorilla-format data at any scale, for benchmarks and for testing
+# the pipeline on cohorts far larger than the ~100 participants per group in
+# model fitting/*.csv.
+#
+# Trial tables follow the cleaned-data schema (Participant.Public.ID,
+# trial_nr counted from 0, choice, rt, gain, loss, score.tally; the R fitting
+# script adds 1 to trial_nr itself): each participant plays a drifting
+# 3-armed schedule under a bandit model with parameters drawn from a
+# standard normal on the unconstrained scale; a few trials are dropped, as
+# NA rows are in the cleaned files, and RTs are log-normal. Questionnaire
+# exports follow the raw long format read by questionnaire_scoring.py (one
+# row per participant x question key, a text and a "-quantised" row per
+# item, attention checks included), with the responses of all instruments
+# driven by one latent anhedonia score so that they correlate. Participants
+# are generated in chunks, so files of 100k+ participants are written with
+# bounded memory.
+
+# Bumped whenever generated files change layout, so cached cohorts are regenerated
+DATA_VERSION = 2
+TRIAL_COLUMNS = ['Participant.Public.ID', 'trial_nr', 'choice', 'rt', 'gain', 'loss', 'score.tally']
+
+# Items, response range, attention-check key, the raw responses that fail the
+# check in questionnaire_scoring.py (GAD is checked after recoding, so raw 2)
+# and whether high responses mean more (1) or less (-1) anhedonia / distress
+QUESTIONNAIRES = {
+    'dars': {'keys': [f'DARS-{i}' for i in range(1, 18)], 'levels': 5, 'attention': None, 'invalid': (),
+             'direction': -1},
+    'gad': {'keys': [f'GAD-{i}' for i in range(1, 8)] + ['GAD_8'], 'levels': 4, 'attention': 'GAD_attention',
+            'invalid': (2,), 'direction': 1},
+    'shaps': {'keys': [f'SHAPS-{i}' for i in range(1, 15)], 'levels': 4, 'attention': 'SHAPS_attention',
+              'invalid': (1, 2), 'direction': -1},
+    'zung': {'keys': [f'SDS-{i}' for i in range(1, 21)], 'levels': 4, 'attention': 'SDS_attention',
+             'invalid': (3, 4), 'direction': 1}
+}
+
+
+def participant_ids(n_participants, rng):
+    """Gorilla-style 24 character hexadecimal public IDs."""
+    digits = np.array(list('0123456789abcdef'))
+    return np.array([''.join(row) for row in digits[rng.integers(0, 16, (n_participants, 24))]])
+
+
+def trial_table(ids, money_prob, pain_prob, model='4par', drop_rate=0.02, rng=None):
+    """Cleaned trial table for the participants `ids` on the given schedule."""
+    rng = np.random.default_rng(rng)
+    model = get_model(model)
+    n_participants, n_trials = len(ids), money_prob.shape[1]
+    params = model.to_constrained(rng.standard_normal((n_participants, model.n_params)))
+    choice, gain, loss = (values[0] for values in model.simulate(params, money_prob, pain_prob, rng=rng))
+    loss = -loss
+    rt = np.rint(rng.lognormal(np.log(420), 0.55, (n_participants, n_trials)).clip(0, 3000))
+    tally = 100 + np.cumsum(gain.astype(np.int32) - loss, axis=1)
+
+    keep = rng.random((n_participants, n_trials)) >= drop_rate
+    return pd.DataFrame({
+        'Participant.Public.ID': np.repeat(ids, n_trials)[keep.ravel()],
+        'trial_nr': np.tile(np.arange(n_trials), n_participants)[keep.ravel()],
+        'choice': choice[keep],
+        'rt': rt[keep].astype(np.int32),
+        'gain': gain[keep],
+        'loss': loss[keep],
+        'score.tally': tally[keep]
+    }, columns=TRIAL_COLUMNS)
+
+
+def questionnaire_exports(ids, anhedonia=None, missing_rate=0.002, attention_fail_rate=0.03, rng=None):
+    """Raw long-format exports {'dars', 'gad', 'shaps', 'zung'} for `ids`.
+
+    `anhedonia` is an optional latent score per participant (standard normal
+    by default); higher values give lower DARS scores and higher SHAPS, GAD
+    and SDS scores.
+    """
+    rng = np.random.default_rng(rng)
+    n_participants = len(ids)
+    if anhedonia is None:
+        anhedonia = rng.standard_normal(n_participants)
+    private_ids = 8_000_000 + rng.permutation(10 * n_participants)[:n_participants]
+
+    exports = {}
+    for name, spec in QUESTIONNAIRES.items():
+        levels, n_items = spec['levels'], len(spec['keys'])
+        latent = (levels + 1) / 2 + spec['direction'] * 0.4 * anhedonia[:, None]
+        latent = latent + rng.normal(0, 0.9, (n_participants, n_items))
+        responses = np.clip(np.rint(latent), 1, levels).astype(float)
+        responses[rng.random(responses.shape) < missing_rate] = np.nan
+        keys = list(spec['keys'])
+        if spec['attention'] is not None:
+            passed = rng.choice([v for v in range(1, levels + 1) if v not in spec['invalid']], n_participants)
+            failed = rng.choice(spec['invalid'], n_participants)
+            check = np.where(rng.random(n_participants) < attention_fail_rate, failed, passed)
+            responses = np.column_stack([responses, check])
+            keys.append(spec['attention'])
+
+        # A text row and a "-quantised" row per item, in Gorilla's event order
+        n_keys = len(keys)
+        text = np.where(np.isnan(responses), '', np.nan_to_num(responses).astype(int).astype(str))
+        exports[name] = pd.DataFrame({
+            'Event Index': np.tile(np.arange(1, 2 * n_keys + 1), n_participants),
+            'Participant Public ID': np.repeat(ids, 2 * n_keys),
+            'Participant Private ID': np.repeat(private_ids, 2 * n_keys),
+            'Question Key': np.tile(np.ravel([[key, f'{key}-quantised'] for key in keys]), n_participants),
+            'Response': np.stack([text, text], axis=-1).ravel()
+        })
+    return exports
+
+
+def generate(n_participants, output_dir='.', n_trials=200, model='4par', chunk_size=10_000, seed=1234):
+    """Write cleaned_data.csv and <instrument>_questionnaire.csv for a
+    synthetic cohort of `n_participants`, one chunk of participants at a time.
+
+    Returns the written paths.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(output_dir, exist_ok=True)
+    money_prob, pain_prob = (schedule[0] for schedule in random_walk_schedules(1, n_trials=n_trials, seed=rng))
+    paths = {'trials': os.path.join(output_dir, 'cleaned_data.csv')}
+    paths.update({name: os.path.join(output_dir, f'{name}_questionnaire.csv') for name in QUESTIONNAIRES})
+
+    for start in range(0, n_participants, chunk_size):
+        ids = participant_ids(min(chunk_size, n_participants - start), rng)
+        first = start == 0
+        trial_table(ids, money_prob, pain_prob, model, rng=rng).to_csv(
+            paths['trials'], mode='w' if first else 'a', header=first, index=False)
+        for name, export in questionnaire_exports(ids, rng=rng).items():
+            export.to_csv(paths[name], mode='w' if first else 'a', header=first, index=False)
+    return paths
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate a synthetic Gorilla-format cohort.')
+    parser.add_argument('participants', type=int)
+    parser.add_argument('--output-dir', default='synthetic')
+    parser.add_argument('--trials', type=int, default=200)
+    parser.add_argument('--model', default='4par', choices=list(MODELS))
+    parser.add_argument('--chunk', type=int, default=10_000, help='participants generated at once')
+    parser.add_argument('--seed', type=int, default=1234)
+    args = parser.parse_args()
+
+    written = generate(args.participants, args.output_dir, n_trials=args.trials, model=args.model,
+                       chunk_size=args.chunk, seed=args.seed)
+    for output_file in written.values():
+        print(f"Saved: {output_file}")
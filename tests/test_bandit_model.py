@@ -0,0 +1,61 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+from bandit_model import log_likelihood, log_likelihood_grad, prepare_trials
+
+
+def reference_log_likelihood(arew, apun, r, p, choices, gains, losses):
+    # One subject, one trial at a time, as in the banditNarm_4par Stan model
+    qr, qp = [0.0] * 3, [0.0] * 3
+    total = 0.0
+    for choice, gain, loss in zip(choices, gains, losses):
+        qsum = [qr[k] + qp[k] for k in range(3)]
+        total += qsum[choice] - math.log(sum(math.exp(q) for q in qsum))
+        pe_r = r * gain - qr[choice]
+        pe_p = p * loss - qp[choice]
+        for k in range(3):
+            if k != choice:
+                qr[k] += arew * -qr[k]
+                qp[k] += apun * -qp[k]
+        qr[choice] += arew * pe_r
+        qp[choice] += apun * pe_p
+    return total
+
+
+def example(seed=0):
+    rng = np.random.default_rng(seed)
+    lengths = {'s1': 60, 's2': 45, 's3': 30}
+    frame = pd.concat([pd.DataFrame({'Participant.Public.ID': subject, 'choice': rng.integers(0, 3, n),
+                                     'gain': rng.integers(0, 2, n), 'loss': rng.integers(0, 2, n)})
+                       for subject, n in lengths.items()])
+    params = np.column_stack([rng.uniform(0, 1, (3, 2)), rng.uniform(0, 30, (3, 2))])
+    return frame, params
+
+
+def test_matches_scalar_reference():
+    frame, params = example()
+    trials = prepare_trials(frame)
+    expected = [reference_log_likelihood(*params[s], part['choice'].tolist(), part['gain'].tolist(),
+                                         (-part['loss']).tolist())
+                for s, (_, part) in enumerate(frame.groupby('Participant.Public.ID'))]
+    np.testing.assert_allclose(log_likelihood(params, trials), expected, rtol=1e-10)
+    np.testing.assert_allclose(log_likelihood(params, trials, pointwise=True).sum(axis=-1), expected, rtol=1e-10)
+
+    # Leading batch dimensions score every parameter set against every subject
+    batch = np.stack([params, params[::-1]])
+    np.testing.assert_allclose(log_likelihood(batch, trials)[0], expected, rtol=1e-10)
+
+
+def test_gradient_matches_finite_differences():
+    frame, params = example(1)
+    trials = prepare_trials(frame)
+    log_lik, grad = log_likelihood_grad(params, trials)
+    np.testing.assert_allclose(log_lik, log_likelihood(params, trials), rtol=1e-12)
+    step = 1e-6
+    for k in range(4):
+        shift = np.zeros(4)
+        shift[k] = step
+        numeric = (log_likelihood(params + shift, trials) - log_likelihood(params - shift, trials)) / (2 * step)
+        np.testing.assert_allclose(grad[:, k], numeric, rtol=1e-5, atol=1e-6)
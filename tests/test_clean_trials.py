@@ -0,0 +1,25 @@
+import pandas as pd
+
+from clean_trials import clean_export, count_missing
+
+EXPORT = '''Participant Public ID,t_response,choice,rt,gain,loss,score.tally,note
+p1,1,1,500,1,0,1,
+p1,1,,500,1,0,1,null
+NA,1,2,400,0,1,1,
+,1,3,400,0,1,1,NA
+'''
+
+
+def test_missing_values_follow_read_csv(tmp_path):
+    (tmp_path / 'export.csv').write_text(EXPORT)
+    counts = count_missing(tmp_path / 'export.csv')
+    # Empty IDs and NA IDs are separate participants; only empty numeric fields are NA
+    assert len(counts) == 3
+    assert counts.loc['p1', 'choice'] == 1
+    assert counts.sum().sum() == 1
+
+    excluded, written = clean_export(tmp_path / 'export.csv', tmp_path, max_nas=0)
+    assert excluded == {'p1'}
+    cleaned = pd.read_csv(tmp_path / 'cleaned_data.csv', keep_default_na=False)
+    assert cleaned['Participant.Public.ID'].tolist() == ['NA', '']
+    assert cleaned['note'].tolist() == ['', 'NA']
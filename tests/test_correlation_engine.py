@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+from scipy.stats import pearsonr
+
+from correlation_engine import correlation_table
+
+
+def data(seed=0):
+    rng = np.random.default_rng(seed)
+    x = pd.DataFrame(rng.normal(size=(25, 3)), columns=['Arew', 'Apun', 'R'])
+    y = pd.DataFrame({'gad': x['Arew'] + rng.normal(size=25), 'phq': rng.normal(size=25)})
+    x.iloc[[1, 4], 0] = np.nan
+    y.iloc[[4, 7, 9], 1] = np.nan
+    return x, y
+
+
+def max_abs_r(x, y):
+    # Largest |r| over every pair, each on its pairwise-complete rows
+    largest = 0.0
+    for a in x.T:
+        for b in y.T:
+            complete = ~np.isnan(a) & ~np.isnan(b)
+            largest = max(largest, abs(np.corrcoef(a[complete], b[complete])[0, 1]))
+    return largest
+
+
+def test_pairwise_complete_correlations_match_pearsonr():
+    x, y = data()
+    table = correlation_table(x, y, n_permutations=0)
+    for row in table.itertuples():
+        complete = x[row.x].notna() & y[row.y].notna()
+        expected = pearsonr(x.loc[complete, row.x], y.loc[complete, row.y])
+        assert row.n == complete.sum()
+        np.testing.assert_allclose(row.r, expected.statistic, rtol=1e-10)
+        np.testing.assert_allclose(row.p, expected.pvalue, rtol=1e-8)
+        np.testing.assert_allclose(row.p_bonferroni, min(1.0, expected.pvalue * len(table)), rtol=1e-8)
+    assert table['p_fwer'].isna().all()
+
+
+def test_fwer_matches_max_statistic_loop():
+    x, y = data(1)
+    table = correlation_table(x, y, n_permutations=4000, memory_mb=1)
+    # Reference: max |r| over the whole matrix for permutations of the rows of y
+    rng = np.random.default_rng(0)
+    x_values, y_values = x.to_numpy(), y.to_numpy()
+    null = np.array([max_abs_r(x_values, y_values[rng.permutation(len(y))]) for _ in range(4000)])
+    reference = [(np.sum(null >= abs(r) - 1e-12) + 1) / 4001 for r in table['r']]
+    np.testing.assert_allclose(table['p_fwer'], reference, atol=0.02)
+    assert table.loc[(table['x'] == 'Arew') & (table['y'] == 'gad'), 'p_fwer'].item() < 0.01
@@ -0,0 +1,46 @@
+import numpy as np
+
+from fit_bandit import _batched_bfgs
+
+
+def quadratic(target, scale):
+    def objective(x, index):
+        diff = x - target[index]
+        return (scale * diff ** 2).sum(axis=1), 2 * scale * diff
+    return objective
+
+
+def test_bfgs_recovers_from_failed_first_line_search():
+    target = np.array([[1.0, -2.0, 0.5], [-1.0, 3.0, 2.0]])
+    scale = np.array([1.0, 4.0, 0.25])
+    inner = quadratic(target, scale)
+    calls = {'n': 0}
+
+    # The first line search of problem 0 sees an overflowing objective along
+    # its first direction, so it fails and must be retried rather than
+    # reported as converged at its starting point
+    def objective(x, index):
+        value, gradient = inner(x, index)
+        calls['n'] += 1
+        if 1 < calls['n'] <= 31:
+            value = np.where(index == 0, np.inf, value)
+        return value, gradient
+
+    x, value = _batched_bfgs(objective, np.zeros_like(target))
+    np.testing.assert_allclose(x, target, atol=1e-5)
+    np.testing.assert_allclose(value, 0.0, atol=1e-9)
+
+
+def test_bfgs_gives_up_after_repeated_failures():
+    target = np.array([[1.0, -2.0]])
+    inner = quadratic(target, np.ones(2))
+
+    # No step from the start ever decreases the objective
+    def objective(x, index):
+        value, gradient = inner(x, index)
+        return np.where((x == 0).all(axis=1), value, np.inf), gradient
+
+    x, value = _batched_bfgs(objective, np.zeros_like(target), max_iter=50)
+    np.testing.assert_array_equal(x, np.zeros_like(target))
+    np.testing.assert_allclose(value, 5.0)
+
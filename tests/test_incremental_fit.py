@@ -0,0 +1,52 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+from fit_bandit import fit_subjects
+from incremental_fit import refit
+from simulate_bandit import simulate_choices
+
+
+def trial_table(subjects, seed=0):
+    rng = np.random.default_rng(seed)
+    params = np.column_stack([rng.uniform(0.2, 0.8, (len(subjects), 2)), rng.uniform(1, 6, (len(subjects), 2))])
+    choice, gain, loss = simulate_choices(params, rng.uniform(size=(3, 80)), rng.uniform(size=(3, 80)), rng=rng)
+    return pd.DataFrame({'Participant.Public.ID': np.repeat(subjects, 80), 'choice': choice[0].ravel(),
+                         'gain': gain[0].ravel(), 'loss': -loss[0].ravel()})
+
+
+def test_only_new_or_changed_participants_are_fitted(tmp_path):
+    store = tmp_path / 'store.json'
+    data = trial_table(['a', 'b', 'c'])
+    first, n_fitted = refit(data, store, n_starts=2, n_jobs=1)
+    assert n_fitted == 3
+    expected = fit_subjects(data, n_starts=2, n_jobs=1)
+    np.testing.assert_allclose(first[['Arew', 'Apun', 'R', 'P']], expected[['Arew', 'Apun', 'R', 'P']],
+                               rtol=1e-3, atol=1e-4)
+
+    again, n_fitted = refit(data, store, n_starts=2, n_jobs=1)
+    assert n_fitted == 0
+    pd.testing.assert_frame_equal(again, first)
+
+    # One participant's trials change and one participant joins
+    changed = data.copy()
+    changed.loc[changed['Participant.Public.ID'] == 'b', 'gain'] = 1 - changed['gain']
+    grown = pd.concat([changed, trial_table(['d'], seed=1)], ignore_index=True)
+    result, n_fitted = refit(grown, store, n_starts=2, n_jobs=1)
+    assert n_fitted == 2
+    assert result['subjID'].tolist() == ['a', 'b', 'c', 'd']
+    kept = result['subjID'].isin(['a', 'c'])
+    pd.testing.assert_frame_equal(result[kept], first[first['subjID'].isin(['a', 'c'])])
+    columns = ['Arew', 'Apun', 'R', 'P']
+    assert not np.allclose(result.loc[1, columns].to_numpy(float), first.loc[1, columns].to_numpy(float))
+
+
+def test_changed_settings_invalidate_stored_fits(tmp_path):
+    store = tmp_path / 'store.json'
+    data = trial_table(['a', 'b'])
+    refit(data, store, n_starts=1, n_jobs=1)
+    _, n_fitted = refit(data, store, n_starts=1, n_jobs=1, prior_sd=2.0)
+    assert n_fitted == 2
+    # Only the fits of the current version of the model are kept
+    assert len(json.loads(store.read_text())['fits']) == 1
@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+
+from bandit_model import prepare_trials
+from bandit_models import MODELS
+from likelihood_surface import grid_axes, likelihood_surface
+from simulate_bandit import simulate_choices
+
+
+def trials(n_trials, seed=0):
+    # Two simulated subjects, the second with a shorter task (padding trials)
+    rng = np.random.default_rng(seed)
+    params = np.array([[0.4, 0.2, 25.0, 20.0], [0.7, 0.5, 5.0, 10.0]])
+    choice, gain, loss = simulate_choices(params, rng.uniform(size=(3, n_trials)), rng.uniform(size=(3, n_trials)),
+                                          rng=rng)
+    frame = pd.DataFrame({'Participant.Public.ID': np.repeat(['a', 'b'], n_trials), 'choice': choice[0].ravel() + 1,
+                          'gain': gain[0].ravel(), 'loss': -loss[0].ravel()})
+    return prepare_trials(frame.drop(index=range(2 * n_trials - 40, 2 * n_trials)))
+
+
+def brute_force(trials, axes, model):
+    grid = np.stack(np.meshgrid(*axes.values(), indexing='ij'), axis=-1).reshape(-1, len(axes))
+    n_subjects = len(trials.subjects)
+    log_lik = MODELS[model].log_likelihood(np.broadcast_to(grid[:, None], (len(grid), n_subjects, len(axes))), trials)
+    return log_lik.T.reshape((n_subjects,) + tuple(len(axis) for axis in axes.values()))
+
+
+def check(trials, axes, model, tmp_path):
+    expected = brute_force(trials, axes, model)
+    result = likelihood_surface(trials, axes, model=model, n_jobs=1, surface=tmp_path / 'surface.npy')
+    np.testing.assert_allclose(np.load(tmp_path / 'surface.npy'), expected, rtol=1e-5)
+    np.testing.assert_allclose(result.max_log_lik, expected.reshape(len(expected), -1).max(axis=1), rtol=1e-9)
+    other = tuple(1 + a for a, name in enumerate(axes) if name != 'R')
+    np.testing.assert_allclose(result.profiles['R'], expected.max(axis=other), rtol=1e-9)
+
+
+def test_separable_path_on_a_long_task(tmp_path):
+    # Large R and P over 600 trials: the running products must not overflow
+    check(trials(600), grid_axes('4par', points=5), '4par', tmp_path)
+
+
+def test_separable_path_at_zero_sensitivity(tmp_path):
+    # R = P = 0 gives the smallest span bound while every factor is 3, so
+    # spans of 700 trials would overflow
+    axes = grid_axes('4par', points=3, fixed={'R': 0, 'P': 0})
+    long_trials = trials(760)
+    check(long_trials, axes, '4par', tmp_path)
+    np.testing.assert_allclose(likelihood_surface(long_trials, axes, n_jobs=1).max_log_lik,
+                               -long_trials.mask.sum(axis=1) * np.log(3))
+
+
+def test_batched_path(tmp_path):
+    check(trials(120), grid_axes('singleA_lapse', points=4), 'singleA_lapse', tmp_path)
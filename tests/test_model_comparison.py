@@ -0,0 +1,42 @@
+import warnings
+
+import numpy as np
+import pytest
+
+from model_comparison import psis_loo, psis_smooth
+
+az = pytest.importorskip('arviz')
+
+
+def log_lik(seed=0):
+    # 4 chains x 500 draws x 20 observations, three with heavy-tailed ratios
+    rng = np.random.default_rng(seed)
+    values = rng.normal(-1, 0.5, (4, 500, 20))
+    values[..., :3] += 2 * rng.standard_t(2, (4, 500, 3))
+    return values
+
+
+def test_psis_weights_match_arviz():
+    values = log_lik().reshape(-1, 20)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        expected_weights, expected_k = az.psislw(-values.T, reff=1.0)
+    log_weights, k = psis_smooth(-values)
+    np.testing.assert_allclose(k, expected_k, atol=1e-10)
+    np.testing.assert_allclose(log_weights, np.asarray(expected_weights).T, atol=1e-10)
+
+
+def test_psis_loo_matches_arviz():
+    values = log_lik(1)
+    data = az.from_dict(posterior={'mu': np.zeros(values.shape[:2])}, log_likelihood={'y': values})
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        expected = az.loo(data, pointwise=True, reff=1.0)
+    summary, pointwise = psis_loo(values, memory_mb=1)
+    np.testing.assert_allclose(summary['elpd_loo'], expected.elpd_loo, rtol=1e-10)
+    np.testing.assert_allclose(summary['p_loo'], expected.p_loo, rtol=1e-10)
+    np.testing.assert_allclose(pointwise['elpd_loo'], expected.loo_i.values, rtol=1e-10)
+    np.testing.assert_allclose(pointwise['pareto_k'], expected.pareto_k.values, atol=1e-10)
+    # Standard errors use the sample SD (n - 1), as loo does; arviz uses n
+    n = values.shape[-1]
+    np.testing.assert_allclose(summary['se_elpd_loo'], expected.se * np.sqrt(n / (n - 1)), rtol=1e-10)
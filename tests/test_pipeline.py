@@ -0,0 +1,95 @@
+import json
+
+from pipeline import build_steps, run_pipeline
+
+
+def run_first_line(inputs, outputs, settings):
+    # Writes the first line of every input, so edits below it do not change the output
+    lines = [open(path).read().splitlines()[0] for _, path in sorted(inputs.items())]
+    with open(outputs['out'], 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def run_upper(inputs, outputs, settings):
+    with open(outputs['out'], 'w') as f:
+        f.write(open(inputs['data']).read().upper())
+
+
+def run_broken(inputs, outputs, settings):
+    raise ValueError('broken step')
+
+
+def steps(tmp_path, second=run_upper):
+    path = {name: str(tmp_path / name) for name in ['raw', 'other', 'first', 'second', 'third']}
+    return [
+        {'name': 'first', 'function': run_first_line, 'module': None, 'inputs': {'raw': path['raw']},
+         'outputs': {'out': path['first']}, 'settings': {}},
+        {'name': 'side', 'function': run_upper, 'module': None, 'inputs': {'data': path['other']},
+         'outputs': {'out': str(tmp_path / 'side')}, 'settings': {}},
+        {'name': 'second', 'function': second, 'module': None, 'inputs': {'data': path['first']},
+         'outputs': {'out': path['second']}, 'settings': {}},
+        {'name': 'third', 'function': run_first_line, 'module': None,
+         'inputs': {'data': path['second'], 'other': path['other']}, 'outputs': {'out': path['third']},
+         'settings': {}}
+    ]
+
+
+def statuses(rows):
+    return {row['step']: row['status'] for row in rows}
+
+
+def test_reruns_only_steps_whose_inputs_changed(tmp_path):
+    (tmp_path / 'raw').write_text('a\nb\n')
+    (tmp_path / 'other').write_text('x\n')
+    manifest = tmp_path / 'manifest.json'
+    assert set(statuses(run_pipeline(steps(tmp_path), manifest, n_jobs=2)).values()) == {'ran'}
+    assert (tmp_path / 'third').read_text() == 'A\nx\n'
+    assert set(statuses(run_pipeline(steps(tmp_path), manifest, n_jobs=2)).values()) == {'cached'}
+
+    # The first step reruns but writes an identical file: nothing downstream reruns
+    (tmp_path / 'raw').write_text('a\nchanged\n')
+    assert statuses(run_pipeline(steps(tmp_path), manifest, n_jobs=2)) == {
+        'first': 'ran', 'side': 'cached', 'second': 'cached', 'third': 'cached'}
+
+    # A changed first line propagates; a dry run reports it without running anything
+    (tmp_path / 'raw').write_text('c\n')
+    assert statuses(run_pipeline(steps(tmp_path), manifest, dry_run=True)) == {
+        'first': 'stale', 'side': 'cached', 'second': 'stale', 'third': 'stale'}
+    assert (tmp_path / 'third').read_text() == 'A\nx\n'
+    assert statuses(run_pipeline(steps(tmp_path), manifest, n_jobs=2)) == {
+        'first': 'ran', 'side': 'cached', 'second': 'ran', 'third': 'ran'}
+    assert (tmp_path / 'third').read_text() == 'C\nx\n'
+
+    # Forced steps rerun even when current
+    assert statuses(run_pipeline(steps(tmp_path), manifest, force={'side'}))['side'] == 'ran'
+
+
+def test_failed_step_blocks_downstream(tmp_path):
+    (tmp_path / 'raw').write_text('a\n')
+    (tmp_path / 'other').write_text('x\n')
+    manifest = tmp_path / 'manifest.json'
+    rows = {row['step']: row for row in run_pipeline(steps(tmp_path, second=run_broken), manifest, n_jobs=2)}
+    assert {name: row['status'] for name, row in rows.items()} == {
+        'first': 'ran', 'side': 'ran', 'second': 'failed', 'third': 'blocked'}
+    assert rows['second']['error'] == 'ValueError: broken step'
+    assert 'second' not in json.loads(manifest.read_text())
+
+    # Fixing the step's code makes it and its dependants run
+    assert statuses(run_pipeline(steps(tmp_path), manifest, n_jobs=2)) == {
+        'first': 'cached', 'side': 'cached', 'second': 'ran', 'third': 'ran'}
+
+
+def test_analysis_step_graph(tmp_path):
+    config = {'export': 'export.csv', 'groups': 'groups.csv', 'output_dir': str(tmp_path),
+              'questionnaires': {'gad': 'gad.csv', 'shaps': 'shaps.csv'}}
+    by_name = {step['name']: step for step in build_steps(config)}
+    producers = {path: name for name, step in by_name.items() for path in step['outputs'].values()}
+
+    def upstream(name):
+        return {producers[path] for path in by_name[name]['inputs'].values() if path in producers}
+
+    assert upstream('fit_anhedonic') == {'clean'}
+    assert upstream('organize') == {'fit_anhedonic', 'fit_non_anhedonic', 'score'}
+    assert upstream('correlate') == {'organize'}
+    assert upstream('compare') == {'clean', 'fit_anhedonic', 'fit_non_anhedonic'}
+    assert upstream('score') == set()
@@ -0,0 +1,33 @@
+import numpy as np
+import pandas as pd
+
+from questionnaire_scoring import score_instrument
+
+
+def export(responses):
+    """Long Gorilla export from {participant: {question key: response}}."""
+    rows = [{'Participant Public ID': participant, 'Question Key': f'{key}-quantised', 'Response': response}
+            for participant, answers in responses.items() for key, response in answers.items()]
+    return pd.DataFrame(rows)
+
+
+def test_gad_attention_check():
+    items = {f'GAD-{i}': 2 for i in range(1, 8)}
+    data = export({
+        'passed': dict(items, GAD_attention=1),
+        'failed': dict(items, GAD_attention=2),
+        'na_check': dict(items, GAD_attention='NA'),
+        'na_item': dict(items, **{'GAD-3': 'NA'}, GAD_attention=1),
+    })
+    scores = score_instrument(data, 'gad').set_index('Participant.Public.ID')['gad_score']
+    # Responses 2 are recoded to 1; the check fails on a recoded 1 (raw 2)
+    assert scores['passed'] == 7
+    assert np.isnan(scores['failed'])
+    assert np.isnan(scores['na_check'])
+    assert np.isnan(scores['na_item'])
+
+
+def test_missing_attention_item_is_not_a_failure():
+    data = export({'no_check': {f'SDS-{i}': 1 for i in range(1, 21)}})
+    scores = score_instrument(data, 'zung')
+    assert scores['zung_score'].tolist() == [20]
@@ -0,0 +1,62 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+from scipy.stats import ttest_ind
+
+from resampling import compare_groups, participant_metrics
+
+
+def groups(seed=0):
+    rng = np.random.default_rng(seed)
+    group1 = pd.DataFrame({'a': rng.normal(1.0, 1, 7), 'b': rng.normal(0, 2, 7)})
+    group2 = pd.DataFrame({'a': rng.normal(0.0, 1, 6), 'b': rng.normal(0, 1, 6)})
+    group1.loc[2, 'b'] = np.nan
+    return group1, group2
+
+
+def exact_p(values1, values2):
+    # Two-sided p-value over every relabelling of the pooled participants
+    pooled = np.concatenate([values1, values2])
+    observed = abs(ttest_ind(values1, values2, equal_var=False).statistic)
+    count = total = 0
+    for first in itertools.combinations(range(len(pooled)), len(values1)):
+        mask = np.zeros(len(pooled), dtype=bool)
+        mask[list(first)] = True
+        count += abs(ttest_ind(pooled[mask], pooled[~mask], equal_var=False).statistic) >= observed - 1e-12
+        total += 1
+    return count / total
+
+
+def test_statistics_match_scipy_and_exact_permutation():
+    group1, group2 = groups()
+    result = compare_groups(group1, group2, n_permutations=20000, n_bootstrap=2000, memory_mb=1).set_index('metric')
+    for metric in ['a', 'b']:
+        values1, values2 = group1[metric].dropna().to_numpy(), group2[metric].dropna().to_numpy()
+        row = result.loc[metric]
+        assert (row['n_group1'], row['n_group2']) == (len(values1), len(values2))
+        np.testing.assert_allclose(row['difference'], values1.mean() - values2.mean(), rtol=1e-12)
+        np.testing.assert_allclose(row['t_statistic'], ttest_ind(values1, values2, equal_var=False).statistic,
+                                   rtol=1e-10)
+        assert abs(row['p_permutation'] - exact_p(values1, values2)) < 0.01
+        assert row['ci_low'] < row['difference'] < row['ci_high']
+
+
+def test_results_do_not_depend_on_workers():
+    group1, group2 = groups(1)
+    serial = compare_groups(group1, group2, n_permutations=500, n_bootstrap=500, memory_mb=1, n_jobs=1)
+    parallel = compare_groups(group1, group2, n_permutations=500, n_bootstrap=500, memory_mb=1, n_jobs=2)
+    pd.testing.assert_frame_equal(serial, parallel)
+
+
+def test_participant_metrics():
+    data = pd.DataFrame({'Participant.Public.ID': ['x'] * 4 + ['y'] * 3, 'choice': [0, 0, 1, 1, 2, 2, 0],
+                         'gain': [1, 0, 0, 1, 1, 1, 0], 'loss': [0, 1, 0, 0, 0, 0, 1],
+                         'rt': [100, 200, 300, 400, 500, 700, 900]})
+    parameters = pd.DataFrame({'subjID': ['y', 'x'], 'Arew': [0.2, 0.1]})
+    metrics = participant_metrics(data, parameters)
+    assert metrics.index.tolist() == ['x', 'y']
+    np.testing.assert_allclose(metrics['mean_rt'], [250, 700])
+    np.testing.assert_allclose(metrics['win_stay_percentage'], [50, 50])
+    np.testing.assert_allclose(metrics['lose_shift_percentage'], [100, 0])
+    np.testing.assert_allclose(metrics['Arew'], [0.1, 0.2])
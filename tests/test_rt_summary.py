@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+from scipy.stats import t
+
+from rt_summary import RTSummary
+
+
+def group_data(seed, n_participants, first_id=0):
+    rng = np.random.default_rng(seed)
+    frames = []
+    for p in range(first_id, first_id + n_participants):
+        n_trials = rng.integers(20, 31)
+        frames.append(pd.DataFrame({'Participant.Public.ID': f'p{p}', 'trial_nr': np.arange(1, n_trials + 1),
+                                    'rt': rng.gamma(4, 150, n_trials)}))
+    return pd.concat(frames, ignore_index=True)
+
+
+def test_matches_full_table_groupby(tmp_path):
+    anhedonic, non_anhedonic = group_data(0, 12), group_data(1, 9, first_id=100)
+
+    # Two batches of participants and a re-ingested one, through a saved state file
+    first_batch = anhedonic['Participant.Public.ID'].isin([f'p{p}' for p in range(5)])
+    summary = RTSummary()
+    summary.update(anhedonic[first_batch], 'Anhedonic')
+    summary.save(tmp_path / 'state.json')
+    summary = RTSummary.load(tmp_path / 'state.json')
+    assert summary.update(anhedonic[~first_batch], 'Anhedonic') == 7
+    assert summary.update(anhedonic[first_batch], 'Anhedonic') == 0
+    summary.update(non_anhedonic, 'Non-Anhedonic')
+
+    # Previous full-table computation of reactiontimesbetweengroups.py
+    for group, data in (('Anhedonic', anhedonic), ('Non-Anhedonic', non_anhedonic)):
+        curve = summary.curve(group)
+        by_trial = data.groupby('trial_nr')['rt']
+        np.testing.assert_array_equal(curve['trial_nr'], by_trial.mean().index)
+        np.testing.assert_allclose(curve['mean'], by_trial.mean(), rtol=1e-12)
+        np.testing.assert_allclose(curve['sem'], by_trial.sem(), rtol=1e-10)
+
+    welch = summary.welch_test('Anhedonic', 'Non-Anhedonic')
+    n1, n2 = anhedonic['Participant.Public.ID'].nunique(), non_anhedonic['Participant.Public.ID'].nunique()
+    std1, std2 = anhedonic['rt'].std(), non_anhedonic['rt'].std()
+    sem_combined = np.sqrt(std1 ** 2 / n1 + std2 ** 2 / n2)
+    t_statistic = (anhedonic['rt'].mean() - non_anhedonic['rt'].mean()) / sem_combined
+    df = sem_combined ** 4 / ((std1 ** 2 / n1) ** 2 / (n1 - 1) + (std2 ** 2 / n2) ** 2 / (n2 - 1))
+    assert (welch['n1'], welch['n2']) == (n1, n2)
+    np.testing.assert_allclose([welch['std1'], welch['std2']], [std1, std2], rtol=1e-10)
+    np.testing.assert_allclose(welch['t_statistic'], t_statistic, rtol=1e-10)
+    np.testing.assert_allclose(welch['df'], df, rtol=1e-10)
+    np.testing.assert_allclose(welch['p_value'], 2 * t.cdf(-abs(t_statistic), df), rtol=1e-8)
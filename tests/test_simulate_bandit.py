@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from simulate_bandit import simulate_dataset
+from wsls import compute_wsls
+
+
+def parameters():
+    return pd.DataFrame({'subjID': ['a', 'b'], 'Arew': [0.3, 0.6], 'Apun': [0.2, 0.4], 'R': [3.0, 1.0],
+                         'P': [2.0, 0.5]})
+
+
+def test_wsls_counts_only_transitions_within_a_replicate(tmp_path):
+    rng = np.random.default_rng(0)
+    money, pain = rng.uniform(size=(3, 20)), rng.uniform(size=(3, 20))
+    simulate_dataset(parameters(), money, pain, tmp_path / 'sim.csv', n_replicates=3, chunk_replicates=2)
+    data = pd.read_csv(tmp_path / 'sim.csv')
+
+    strategies = compute_wsls(data, id_col='subjID', lose_value=-1, replicate_col='replicate')
+    runs = [compute_wsls(run, id_col='subjID', lose_value=-1) for _, run in data.groupby('replicate')]
+    expected = pd.concat(runs).groupby('subjID')[['win_stay', 'lose_shift', 'total_win_cases',
+                                                  'total_loss_cases']].sum()
+    assert strategies['subjID'].tolist() == ['a', 'b']
+    np.testing.assert_array_equal(strategies[expected.columns].to_numpy(), expected.to_numpy())
+    # 19 transitions per replicate, not 59 across the concatenated replicates
+    assert (strategies['total_win_cases'] + strategies['total_loss_cases'] <= 3 * 19).all()
+
+
+def test_too_few_library_schedules(tmp_path):
+    rng = np.random.default_rng(0)
+    money, pain = rng.uniform(size=(2, 3, 20)), rng.uniform(size=(2, 3, 20))
+    with pytest.raises(ValueError, match='2 schedules'):
+        simulate_dataset(parameters(), money, pain, tmp_path / 'sim.csv', n_replicates=3)
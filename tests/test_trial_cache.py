@@ -0,0 +1,21 @@
+import numpy as np
+import pandas as pd
+
+from trial_cache import load_trials
+
+
+def backing_array(values):
+    while values is not None and not isinstance(values, np.memmap):
+        values = values.base
+    return values
+
+
+def test_columns_are_memory_mapped(tmp_path):
+    frame = pd.DataFrame({'Participant.Public.ID': ['p2', 'p1', 'p2'], 'trial_nr': [1, 1, 2], 'choice': [1, 3, 2],
+                          'gain': [1, 0, 0], 'loss': [0, 1, 1], 'rt': [512.5, 300.0, 1200.25]})
+    frame.to_csv(tmp_path / 'trials.csv', index=False)
+
+    data = load_trials(tmp_path / 'trials.csv', cache_dir=tmp_path / 'cache')
+    pd.testing.assert_frame_equal(data.astype({'Participant.Public.ID': object}), frame, check_dtype=False)
+    for name in ['trial_nr', 'choice', 'gain', 'loss', 'rt']:
+        assert isinstance(backing_array(data[name].to_numpy()), np.memmap), name
@@ -0,0 +1,184 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from profiling import stage
+
+# Typed columnar cache for the cleaned trial tables
+# (anhedonic_cleaned_data.csv, non_anhedonic_cleaned_data.csv).
+#
+# The first load of a CSV converts it into one .npy file per column next to
+# it (.trial_cache/<file name>/), with the participant IDs stored as int32
+# category codes, trial fields as int8/int16 and RT as float32 (wider types
+# when a column's values do not fit, so nothing wraps). Later loads
+# memory-map those files, so they are near-instant and every process reading
+# the same cache shares one copy of the data through the page cache. The
+# cache is rebuilt whenever the SHA-256 of the source file changes.
+
+CACHE_VERSION = 2
+ID_COLUMN = 'Participant.Public.ID'
+COLUMN_DTYPES = {
+    'trial_nr': np.int16,
+    'choice': np.int8,
+    'rt': np.float32,
+    'gain': np.int8,
+    'loss': np.int8,
+    'score.tally': np.int32
+}
+
+
+def file_hash(path, block_size=2 ** 20):
+    """SHA-256 hex digest of a file, read in blocks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_path(path):
+    directory, name = os.path.split(os.path.abspath(path))
+    return os.path.join(directory, '.trial_cache', name)
+
+
+def _read_manifest(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, 'manifest.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _is_current(manifest, path):
+    if manifest is None or manifest.get('version') != CACHE_VERSION:
+        return False
+    stat = os.stat(path)
+    # Unchanged size and mtime: skip re-hashing the source
+    return manifest['size'] == stat.st_size and manifest['mtime_ns'] == stat.st_mtime_ns
+
+
+def _same_content(manifest, path, cache_dir):
+    # Touched but unchanged source: refresh the stored mtime instead of rebuilding
+    if manifest is None or manifest.get('version') != CACHE_VERSION:
+        return False
+    if manifest['size'] != os.path.getsize(path) or manifest['sha256'] != file_hash(path):
+        return False
+    manifest['mtime_ns'] = os.stat(path).st_mtime_ns
+    try:
+        with open(os.path.join(cache_dir, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f, indent=1)
+    except OSError:
+        pass
+    return True
+
+
+def _fitting_dtype(series, dtype):
+    # Widen the cache type of a column until its whole range fits, so the
+    # cast in build_cache never wraps around
+    dtype = np.dtype(dtype)
+    if dtype.kind not in 'if' or series.isna().all():
+        return dtype
+    low, high = series.min(), series.max()
+    if dtype.kind == 'i':
+        for candidate in (np.int8, np.int16, np.int32, np.int64):
+            info = np.iinfo(candidate)
+            if info.bits >= dtype.itemsize * 8 and info.min <= low and high <= info.max:
+                return np.dtype(candidate)
+        raise ValueError(f"column {series.name} has values outside the int64 range ({low} .. {high})")
+    if dtype == np.float32 and max(abs(low), abs(high)) > 2 ** 24:
+        # Integers above 2^24 are not exact in float32
+        return np.dtype(np.float64)
+    return dtype
+
+
+def build_cache(path, cache_dir=None):
+    """Convert a trial CSV into the columnar cache and return the cache directory."""
+    cache_dir = cache_dir or cache_path(path)
+    stat = os.stat(path)
+    source_hash = file_hash(path)
+    df = pd.read_csv(path)
+
+    parent = os.path.dirname(cache_dir)
+    os.makedirs(parent, exist_ok=True)
+    staging = tempfile.mkdtemp(dir=parent)
+    os.chmod(staging, 0o755)
+
+    columns = []
+    for column in df.columns:
+        series = df[column]
+        entry = {'name': column, 'file': f'{len(columns)}.npy'}
+        if column == ID_COLUMN or not pd.api.types.is_numeric_dtype(series):
+            codes, categories = pd.factorize(series, sort=True)
+            np.save(os.path.join(staging, entry['file']), codes.astype(np.int32))
+            entry['categories'] = [str(c) for c in categories]
+        else:
+            dtype = COLUMN_DTYPES.get(column, series.dtype)
+            if series.isna().any() and not np.issubdtype(dtype, np.floating):
+                # Integer fields with missing values are kept as float32 NaNs
+                dtype = np.float32
+            dtype = _fitting_dtype(series, dtype)
+            np.save(os.path.join(staging, entry['file']), series.to_numpy().astype(dtype))
+        columns.append(entry)
+
+    manifest = {
+        'version': CACHE_VERSION,
+        'source': os.path.abspath(path),
+        'sha256': source_hash,
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'n_rows': len(df),
+        'columns': columns
+    }
+    with open(os.path.join(staging, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=1)
+
+    # Swap the finished cache into place so readers never see a partial one
+    if os.path.exists(cache_dir):
+        shutil.rmtree(cache_dir)
+    os.replace(staging, cache_dir)
+    return cache_dir
+
+
+def load_columns(path, cache_dir=None):
+    """Memory-mapped column arrays of a trial CSV, building the cache if needed.
+
+    Returns (columns, categories): a dict of read-only arrays keyed by column
+    name, and a dict mapping each categorical column to its category labels.
+    """
+    cache_dir = cache_dir or cache_path(path)
+    manifest = _read_manifest(cache_dir)
+    if not _is_current(manifest, path) and not _same_content(manifest, path, cache_dir):
+        build_cache(path, cache_dir)
+        manifest = _read_manifest(cache_dir)
+
+    columns, categories = {}, {}
+    for entry in manifest['columns']:
+        columns[entry['name']] = np.load(os.path.join(cache_dir, entry['file']), mmap_mode='r')
+        if 'categories' in entry:
+            categories[entry['name']] = entry['categories']
+    return columns, categories
+
+
+def load_trials(path, cache_dir=None):
+    """Drop-in replacement for pd.read_csv on a cleaned trial table.
+
+    Numeric columns are backed by the memory-mapped cache; ID columns come
+    back as pandas categoricals.
+    """
+    with stage('load') as timing:
+        columns, categories = load_columns(path, cache_dir)
+        timing.rows = len(next(iter(columns.values()), ()))
+        # Columns are inserted one at a time: building the frame from a dict
+        # consolidates same-dtype columns into a copied block on older pandas
+        data = pd.DataFrame(index=pd.RangeIndex(timing.rows))
+        for name, values in columns.items():
+            if name in categories:
+                data[name] = pd.Categorical.from_codes(values, categories[name])
+            else:
+                data[name] = values
+        return data
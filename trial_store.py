@@ -0,0 +1,121 @@
+import numpy as np
+import pandas as pd
+
+from trial_cache import ID_COLUMN, load_columns
+
+# Participant-indexed trial store.
+#
+# Trials are sorted by participant (and trial_nr) once and kept as flat column
+# arrays plus a CSR-style offsets index: participant i owns rows
+# offsets[i]:offsets[i + 1]. Per-subject access is then a contiguous slice and
+# a dictionary lookup instead of a groupby over the whole table, and whole-
+# cohort code (WSLS, model fitting, simulation) can work on the flat arrays.
+
+
+class TrialStore:
+    """Trials grouped by participant with O(1) per-subject slicing."""
+
+    def __init__(self, subjects, offsets, columns):
+        self.subjects = np.asarray(subjects)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.columns = columns
+        self._index = {subject: i for i, subject in enumerate(self.subjects)}
+
+    @classmethod
+    def from_arrays(cls, ids, columns, order_col='trial_nr'):
+        # ids may be labels or a pandas Categorical; sort by subject, then by
+        # order_col (or keep the existing row order when order_col is None)
+        codes, subjects = pd.factorize(ids, sort=True)
+        if order_col is not None and order_col in columns:
+            order = np.lexsort((np.asarray(columns[order_col]), codes))
+        else:
+            order = np.argsort(codes, kind='stable')
+        counts = np.bincount(codes, minlength=len(subjects))
+        offsets = np.concatenate(([0], np.cumsum(counts)))
+        sorted_columns = {name: np.asarray(values)[order] for name, values in columns.items()}
+        return cls(np.asarray(subjects), offsets, sorted_columns)
+
+    @classmethod
+    def from_frame(cls, data, id_col=ID_COLUMN, order_col='trial_nr'):
+        """Build a store from a trial table (one row per trial)."""
+        columns = {name: data[name].to_numpy() for name in data.columns if name != id_col}
+        return cls.from_arrays(data[id_col], columns, order_col=order_col)
+
+    @classmethod
+    def from_csv(cls, path, id_col=ID_COLUMN, order_col='trial_nr'):
+        """Build a store from a cleaned trial CSV through the columnar cache."""
+        columns, categories = load_columns(path)
+        ids = pd.Categorical.from_codes(columns.pop(id_col), categories[id_col])
+        return cls.from_arrays(ids, columns, order_col=order_col)
+
+    def __len__(self):
+        return len(self.subjects)
+
+    def __contains__(self, subject):
+        return subject in self._index
+
+    def __iter__(self):
+        for i, subject in enumerate(self.subjects):
+            yield subject, self._slice_columns(i)
+
+    @property
+    def n_trials(self):
+        return int(self.offsets[-1])
+
+    @property
+    def counts(self):
+        """Number of trials per participant."""
+        return np.diff(self.offsets)
+
+    @property
+    def codes(self):
+        """Participant index of every (sorted) trial row."""
+        return np.repeat(np.arange(len(self.subjects)), self.counts)
+
+    def index(self, subject):
+        return self._index[subject]
+
+    def rows(self, subject):
+        """Row slice of one participant in the sorted column arrays."""
+        i = self._index[subject]
+        return slice(self.offsets[i], self.offsets[i + 1])
+
+    def _slice_columns(self, i):
+        rows = slice(self.offsets[i], self.offsets[i + 1])
+        return {name: values[rows] for name, values in self.columns.items()}
+
+    def subject(self, subject):
+        """Column arrays (views) of one participant's trials."""
+        return self._slice_columns(self._index[subject])
+
+    def column(self, name):
+        return self.columns[name]
+
+    def select(self, subjects):
+        """A new store restricted to `subjects`, in the given order."""
+        index = np.array([self._index[s] for s in subjects], dtype=np.int64)
+        rows = np.concatenate([np.arange(self.offsets[i], self.offsets[i + 1]) for i in index]) \
+            if len(index) else np.zeros(0, dtype=np.int64)
+        offsets = np.concatenate(([0], np.cumsum(self.counts[index])))
+        return TrialStore(self.subjects[index], offsets,
+                          {name: values[rows] for name, values in self.columns.items()})
+
+    def padded(self, name, fill=0, dtype=None):
+        """(n_subjects, max_trials) array of one column, padded with `fill`."""
+        values = self.columns[name]
+        counts = self.counts
+        out = np.full((len(self.subjects), counts.max() if len(counts) else 0), fill,
+                      dtype=dtype or values.dtype)
+        codes = self.codes
+        out[codes, np.arange(len(codes)) - self.offsets[codes]] = values
+        return out
+
+    def mask(self):
+        """(n_subjects, max_trials) mask of real (non-padding) trials."""
+        counts = self.counts
+        return np.arange(counts.max() if len(counts) else 0) < counts[:, None]
+
+    def to_frame(self, id_col=ID_COLUMN):
+        data = {id_col: self.subjects[self.codes]}
+        data.update(self.columns)
+        return pd.DataFrame(data)
@@ -2,52 +2,18 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 from scipy.stats import ttest_ind
-from scipy import stats
 import ace_tools as tools
+from resampling import compare_groups
+from trial_cache import load_trials
+from wsls import compute_wsls
 
 # Load data
-data_anhedonic = pd.read_csv('/mnt/data/anhedonic_cleaned_data.csv')
-data_non_anhedonic = pd.read_csv('/mnt/data/non_anhedonic_cleaned_data.csv')
+data_anhedonic = load_trials('/mnt/data/anhedonic_cleaned_data.csv')
+data_non_anhedonic = load_trials('/mnt/data/non_anhedonic_cleaned_data.csv')
 
-# Function to compute win-stay and lose-shift instances
-def compute_strategies(participant_data):
-    win_stay_count = 0
-    lose_shift_count = 0
-    total_win_cases = np.sum((participant_data['gain'] == 1) & (participant_data['loss'] == 0))
-    total_loss_cases = np.sum((participant_data['gain'] == 0) & (participant_data['loss'] == 1))
-    
-    for i in range(1, len(participant_data)):
-        prev_choice = participant_data.iloc[i-1]["choice"]
-        prev_gain = participant_data.iloc[i-1]["gain"]
-        prev_loss = participant_data.iloc[i-1]["loss"]
-        curr_choice = participant_data.iloc[i]["choice"]
-        
-        # Check for win-stay
-        if prev_gain == 1 and prev_loss == 0 and prev_choice == curr_choice:
-            win_stay_count += 1
-        
-        # Check for lose-shift
-        if prev_gain == 0 and prev_loss == 1 and prev_choice != curr_choice:
-            lose_shift_count += 1
-
-    return pd.DataFrame({
-        "Participant.Public.ID": [participant_data.iloc[0]["Participant.Public.ID"]],
-        "win_stay": [win_stay_count],
-        "lose_shift": [lose_shift_count],
-        "total_win_cases": [total_win_cases],
-        "total_loss_cases": [total_loss_cases]
-    })
-
-# Compute strategies for each participant in both groups
-strategies_anhedonic = pd.concat([compute_strategies(participant_data) for _, participant_data in data_anhedonic.groupby('Participant.Public.ID')])
-strategies_non_anhedonic = pd.concat([compute_strategies(participant_data) for _, participant_data in data_non_anhedonic.groupby('Participant.Public.ID')])
-
-# Calculate win-stay and lose-shift percentages
-strategies_anhedonic['win_stay_percentage'] = (strategies_anhedonic['win_stay'] / strategies_anhedonic['total_win_cases']) * 100
-strategies_anhedonic['lose_shift_percentage'] = (strategies_anhedonic['lose_shift'] / strategies_anhedonic['total_loss_cases']) * 100
-
-strategies_non_anhedonic['win_stay_percentage'] = (strategies_non_anhedonic['win_stay'] / strategies_non_anhedonic['total_win_cases']) * 100
-strategies_non_anhedonic['lose_shift_percentage'] = (strategies_non_anhedonic['lose_shift'] / strategies_non_anhedonic['total_loss_cases']) * 100
+# Compute win-stay and lose-shift counts and percentages for each participant in both groups
+strategies_anhedonic = compute_wsls(data_anhedonic)
+strategies_non_anhedonic = compute_wsls(data_non_anhedonic)
 
 # Compute means and standard errors
 means_anhedonic = strategies_anhedonic[['win_stay_percentage', 'lose_shift_percentage']].mean()
@@ -60,6 +26,10 @@ errors_non_anhedonic = strategies_non_anhedonic[['win_stay_percentage', 'lose_sh
 win_stay_ttest = ttest_ind(strategies_anhedonic['win_stay_percentage'], strategies_non_anhedonic['win_stay_percentage'], equal_var=False)
 lose_shift_ttest = ttest_ind(strategies_anhedonic['lose_shift_percentage'], strategies_non_anhedonic['lose_shift_percentage'], equal_var=False)
 
+# Permutation p-values and bootstrap CIs of the group differences for both strategies
+strategy_columns = ['win_stay_percentage', 'lose_shift_percentage']
+strategy_resampling = compare_groups(strategies_anhedonic[strategy_columns], strategies_non_anhedonic[strategy_columns])
+
 # Summary results with updated Welch's t-test
 summary_table = pd.DataFrame({
     "Strategy": ["Win-Stay", "Lose-Shift"],
@@ -68,7 +38,9 @@ summary_table = pd.DataFrame({
     "Non-Anhedonic Mean (SD)": [f"{means_non_anhedonic['win_stay_percentage']:.2f} ({errors_non_anhedonic['win_stay_percentage']:.2f})",
                                  f"{means_non_anhedonic['lose_shift_percentage']:.2f} ({errors_non_anhedonic['lose_shift_percentage']:.2f})"],
     "t Statistic": [win_stay_ttest.statistic, lose_shift_ttest.statistic],
-    "p-value": [win_stay_ttest.pvalue, lose_shift_ttest.pvalue]
+    "p-value": [win_stay_ttest.pvalue, lose_shift_ttest.pvalue],
+    "Permutation p-value": strategy_resampling['p_permutation'].values,
+    "Bootstrap 95% CI": [f"[{low:.2f}, {high:.2f}]" for low, high in zip(strategy_resampling['ci_low'], strategy_resampling['ci_high'])]
 })
 
 # Display summary table to user
@@ -2,6 +2,8 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 from scipy.stats import ttest_ind
+from trial_cache import load_trials
+from wsls import compute_wsls
 
 # Define color schemes
 anhedonic_color = 'salmon'  # Anhedonic group remains salmon
@@ -11,87 +13,24 @@ non_anhedonic_color = 'turquoise'  # Non-anhedonic group is turquoise
 transparency_original = 0.9
 transparency_simulated = 0.5
 
-# Function to compute win-stay and lose-shift instances for original data
-def compute_strategies(participant_data):
-    win_stay_count = 0
-    lose_shift_count = 0
-    
-    for i in range(1, len(participant_data)):
-        prev_choice = participant_data.iloc[i-1]["choice"]
-        prev_gain = participant_data.iloc[i-1]["gain"]
-        prev_loss = participant_data.iloc[i-1]["loss"]
-        
-        curr_choice = participant_data.iloc[i]["choice"]
-        
-        # Check for win-stay
-        if prev_gain == 1 and prev_loss == 0 and prev_choice == curr_choice:
-            win_stay_count += 1
-        
-        # Check for lose-shift (original data has loss = 1 for lose)
-        if prev_gain == 0 and prev_loss == 1 and prev_choice != curr_choice:
-            lose_shift_count += 1
-    
-    return pd.DataFrame({
-        "subjID": [participant_data.iloc[0]["Participant.Public.ID"]],
-        "win_stay": [win_stay_count],
-        "lose_shift": [lose_shift_count]
-    })
-
-# Function to compute win-stay and lose-shift for simulated data
-def compute_strategies_simulated(participant_data):
-    win_stay_count = 0
-    lose_shift_count = 0
-    
-    for i in range(1, len(participant_data)):
-        prev_choice = participant_data.iloc[i-1]["choice"]
-        prev_gain = participant_data.iloc[i-1]["gain"]
-        prev_loss = participant_data.iloc[i-1]["loss"]
-        
-        curr_choice = participant_data.iloc[i]["choice"]
-        
-        # Check for win-stay
-        if prev_gain == 1 and prev_loss == 0 and prev_choice == curr_choice:
-            win_stay_count += 1
-        
-        # Check for lose-shift (simulated data has loss = -1 for lose)
-        if prev_gain == 0 and prev_loss == -1 and prev_choice != curr_choice:
-            lose_shift_count += 1
-    
-    return pd.DataFrame({
-        "subjID": [participant_data.iloc[0]["subjID"]],
-        "win_stay": [win_stay_count],
-        "lose_shift": [lose_shift_count]
-    })
-
 # Load original data
-data_anhedonic = pd.read_csv('/path/to/anhedonic_cleaned_data.csv')
-data_non_anhedonic = pd.read_csv('/path/to/non_anhedonic_cleaned_data.csv')
-
-# Compute strategies for original data
-strategies_anhedonic = pd.concat([compute_strategies(participant_data) for _, participant_data in data_anhedonic.groupby('Participant.Public.ID')])
-strategies_non_anhedonic = pd.concat([compute_strategies(participant_data) for _, participant_data in data_non_anhedonic.groupby('Participant.Public.ID')])
-
-# Compute percentages for original data
-strategies_anhedonic['win_stay_percentage'] = (strategies_anhedonic['win_stay'] / data_anhedonic.groupby('Participant.Public.ID').apply(lambda x: np.sum((x['gain'] == 1) & (x['loss'] == 0))).values) * 100
-strategies_anhedonic['lose_shift_percentage'] = (strategies_anhedonic['lose_shift'] / data_anhedonic.groupby('Participant.Public.ID').apply(lambda x: np.sum((x['gain'] == 0) & (x['loss'] == 1))).values) * 100
+data_anhedonic = load_trials('/path/to/anhedonic_cleaned_data.csv')
+data_non_anhedonic = load_trials('/path/to/non_anhedonic_cleaned_data.csv')
 
-strategies_non_anhedonic['win_stay_percentage'] = (strategies_non_anhedonic['win_stay'] / data_non_anhedonic.groupby('Participant.Public.ID').apply(lambda x: np.sum((x['gain'] == 1) & (x['loss'] == 0))).values) * 100
-strategies_non_anhedonic['lose_shift_percentage'] = (strategies_non_anhedonic['lose_shift'] / data_non_anhedonic.groupby('Participant.Public.ID').apply(lambda x: np.sum((x['gain'] == 0) & (x['loss'] == 1))).values) * 100
+# Compute strategies and percentages for original data (loss = 1 for lose)
+strategies_anhedonic = compute_wsls(data_anhedonic).rename(columns={'Participant.Public.ID': 'subjID'})
+strategies_non_anhedonic = compute_wsls(data_non_anhedonic).rename(columns={'Participant.Public.ID': 'subjID'})
 
 # Load simulated data
 data_anhedonic_simulated = pd.read_csv('/path/to/anhedonic_simulated_data_combined.csv')
 data_non_anhedonic_simulated = pd.read_csv('/path/to/non_anhedonic_simulated_data_combined.csv')
 
-# Compute strategies for simulated data
-strategies_anhedonic_simulated = pd.concat([compute_strategies_simulated(participant_data) for _, participant_data in data_anhedonic_simulated.groupby('subjID')])
-strategies_non_anhedonic_simulated = pd.concat([compute_strategies_simulated(participant_data) for _, participant_data in data_non_anhedonic_simulated.groupby('subjID')])
-
-# Compute percentages for simulated data
-strategies_anhedonic_simulated['win_stay_percentage'] = (strategies_anhedonic_simulated['win_stay'] / data_anhedonic_simulated.groupby('subjID').apply(lambda x: np.sum((x['gain'] == 1) & (x['loss'] == 0))).values) * 100
-strategies_anhedonic_simulated['lose_shift_percentage'] = (strategies_anhedonic_simulated['lose_shift'] / data_anhedonic_simulated.groupby('subjID').apply(lambda x: np.sum((x['gain'] == 0) & (x['loss'] == -1))).values) * 100
-
-strategies_non_anhedonic_simulated['win_stay_percentage'] = (strategies_non_anhedonic_simulated['win_stay'] / data_non_anhedonic_simulated.groupby('subjID').apply(lambda x: np.sum((x['gain'] == 1) & (x['loss'] == 0))).values) * 100
-strategies_non_anhedonic_simulated['lose_shift_percentage'] = (strategies_non_anhedonic_simulated['lose_shift'] / data_non_anhedonic_simulated.groupby('subjID').apply(lambda x: np.sum((x['gain'] == 0) & (x['loss'] == -1))).values) * 100
+# Compute strategies and percentages for simulated data (loss = -1 for lose),
+# counting only transitions within each replicate
+strategies_anhedonic_simulated = compute_wsls(data_anhedonic_simulated, id_col='subjID', lose_value=-1,
+                                              replicate_col='replicate')
+strategies_non_anhedonic_simulated = compute_wsls(data_non_anhedonic_simulated, id_col='subjID', lose_value=-1,
+                                                  replicate_col='replicate')
 
 # Compute means and errors for original data
 means_anhedonic = strategies_anhedonic[['win_stay_percentage', 'lose_shift_percentage']].mean()
@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+
+from profiling import stage
+from trial_store import TrialStore
+
+# Shared win-stay / lose-shift engine.
+#
+# Replaces the per-participant iloc loops: the whole trial table is grouped by
+# participant once into a TrialStore (keeping each participant's original row
+# order, as groupby does) and every trial transition is scored in a single
+# array pass.
+# Real data codes a loss as loss == 1, hBayesDM-style simulated data as
+# loss == -1; pass the matching `lose_value`.
+
+
+def wsls_counts(choice, gain, loss, codes, n_subjects, lose_value=1):
+    """Win-stay / lose-shift counts from flat trial arrays.
+
+    Rows must be grouped by participant (`codes` non-decreasing) and in trial
+    order within each participant. Returns four int arrays of length
+    `n_subjects`: win_stay, lose_shift, total_win_cases, total_loss_cases.
+    """
+    choice = np.asarray(choice)
+    codes = np.asarray(codes)
+    win = (np.asarray(gain) == 1) & (np.asarray(loss) == 0)
+    lose = (np.asarray(gain) == 0) & (np.asarray(loss) == lose_value)
+
+    # A transition only counts when both trials belong to the same participant
+    same_subject = codes[1:] == codes[:-1]
+    stay = choice[1:] == choice[:-1]
+
+    win_stay = same_subject & win[:-1] & stay
+    lose_shift = same_subject & lose[:-1] & ~stay
+
+    win_stay_count = np.bincount(codes[1:][win_stay], minlength=n_subjects)
+    lose_shift_count = np.bincount(codes[1:][lose_shift], minlength=n_subjects)
+    total_win_cases = np.bincount(codes[win], minlength=n_subjects)
+    total_loss_cases = np.bincount(codes[lose], minlength=n_subjects)
+    return win_stay_count, lose_shift_count, total_win_cases, total_loss_cases
+
+
+def compute_wsls(data, id_col='Participant.Public.ID', lose_value=1, replicate_col=None):
+    """Win-stay / lose-shift table for every participant in a trial table.
+
+    `data` is a trial DataFrame (scored in its row order within each
+    participant, like the old groupby loops) or a TrialStore. Gives one row
+    per participant in sorted ID order, plus the win_stay_percentage /
+    lose_shift_percentage columns used by the plots. With `replicate_col`
+    (simulated data) each replicate of a participant is scored on its own
+    and the counts are summed, so no transition spans two replicates.
+    """
+    if replicate_col is not None:
+        runs = data.groupby([id_col, replicate_col], sort=True)
+        strategies = compute_wsls(data[['choice', 'gain', 'loss']].assign(run=runs.ngroup()), id_col='run',
+                                  lose_value=lose_value)
+        counts = ['win_stay', 'lose_shift', 'total_win_cases', 'total_loss_cases']
+        strategies = strategies[counts].groupby(runs.size().index.get_level_values(0)).sum()
+        strategies = strategies.rename_axis(id_col).reset_index()
+        strategies['win_stay_percentage'] = (strategies['win_stay'] / strategies['total_win_cases']) * 100
+        strategies['lose_shift_percentage'] = (strategies['lose_shift'] / strategies['total_loss_cases']) * 100
+        return strategies
+
+    with stage('wsls') as timing:
+        if isinstance(data, TrialStore):
+            store = data
+        else:
+            store = TrialStore.from_frame(data[[id_col, 'choice', 'gain', 'loss']], id_col=id_col, order_col=None)
+
+        win_stay, lose_shift, total_win_cases, total_loss_cases = wsls_counts(
+            store.column('choice'), store.column('gain'), store.column('loss'),
+            store.codes, len(store), lose_value=lose_value)
+        timing.rows = store.n_trials
+
+        strategies = pd.DataFrame({
+            id_col: store.subjects,
+            'win_stay': win_stay,
+            'lose_shift': lose_shift,
+            'total_win_cases': total_win_cases,
+            'total_loss_cases': total_loss_cases
+        })
+        strategies['win_stay_percentage'] = (strategies['win_stay'] / strategies['total_win_cases']) * 100
+        strategies['lose_shift_percentage'] = (strategies['lose_shift'] / strategies['total_loss_cases']) * 100
+        return strategies